@@ -0,0 +1,94 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import numpy as np
+import xarray as xr
+
+"""Mergeable accumulators (Welford/Chan) stored as xr.Dataset with <var>_count, <var>_mean, <var>_m2"""
+
+
+def batch_statistics(values, groups, n_groups):
+    """Count, mean and M2 (sum of squared deviations) of values per group, NaNs are skipped
+    Input:
+        - values (n, ...)
+        - groups (n) group index of each row (0...n_groups-1)
+    Output:
+        - count, mean, m2 (n_groups, ...)
+    """
+    valid  = ~np.isnan(values)
+    count  = np.zeros((n_groups,) + values.shape[1:])
+    total  = np.zeros((n_groups,) + values.shape[1:])
+    np.add.at(count, groups, valid)
+    np.add.at(total, groups, np.where(valid, values, 0))
+    mean = total / np.where(count > 0, count, 1)
+
+    m2 = np.zeros((n_groups,) + values.shape[1:])
+    np.add.at(m2, groups, np.where(valid, values - mean[groups], 0)**2)
+    return count, mean, m2
+
+
+def accumulator(values, groups, coords, name):
+    """Accumulator dataset of values, rows are grouped by a flat group index into the leading dims of coords
+        - e.g. coords {'month','hour','alt'}, values (time, alt), groups = month_index*24 + hour
+    """
+    dims   = list(coords)
+    shape  = [len(coords[dim]) for dim in dims]
+    n_group_dims = len(dims) - (values.ndim - 1)
+    count, mean, m2 = batch_statistics(values, groups, int(np.prod(shape[:n_group_dims])))
+    return xr.Dataset({name + '_count': (dims, count.reshape(shape)),
+                       name + '_mean' : (dims, mean.reshape(shape)),
+                       name + '_m2'   : (dims, m2.reshape(shape))},
+                      coords=coords)
+
+
+def variables(acc):
+    """Names of the accumulated variables"""
+    return [var[:-6] for var in acc.data_vars if var.endswith('_count')]
+
+
+def merge(acc_a, acc_b):
+    """Merge two accumulators (Chan et al.), grids are aligned with outer join"""
+    if acc_a is None:
+        return acc_b
+    if acc_b is None:
+        return acc_a
+    names = variables(acc_a)
+    state = [name + suffix for name in names for suffix in ['_count', '_mean', '_m2']]
+    acc_a, acc_b = xr.align(acc_a[state], acc_b[state], join='outer', fill_value=0)
+
+    acc = xr.Dataset(coords=acc_a.coords)
+    for name in names:
+        n_a, n_b = acc_a[name + '_count'], acc_b[name + '_count']
+        n     = n_a + n_b
+        delta = acc_b[name + '_mean'] - acc_a[name + '_mean']
+        frac  = (n_b / n.where(n > 0)).fillna(0)
+        acc[name + '_count'] = n
+        acc[name + '_mean']  = acc_a[name + '_mean'] + delta * frac
+        acc[name + '_m2']    = acc_a[name + '_m2'] + acc_b[name + '_m2'] + delta**2 * n_a * frac
+    return acc
+
+
+def collapse(acc, dim):
+    """Merge accumulator along a dimension (e.g. hour -> monthly statistics)"""
+    acc_out = xr.Dataset()
+    for name in variables(acc):
+        n     = acc[name + '_count'].sum(dim=dim)
+        mean  = (acc[name + '_count'] * acc[name + '_mean']).sum(dim=dim) / n.where(n > 0)
+        m2    = acc[name + '_m2'].sum(dim=dim) + (acc[name + '_count'] * (acc[name + '_mean'] - mean)**2).sum(dim=dim)
+        acc_out[name + '_count'] = n
+        acc_out[name + '_mean']  = mean.fillna(0)
+        acc_out[name + '_m2']    = m2.fillna(0)
+    return acc_out
+
+
+def finalize(acc):
+    """Add mean and standard deviation (NaN without data) to accumulator"""
+    for name in variables(acc):
+        n = acc[name + '_count']
+        acc[name] = acc[name + '_mean'].where(n > 0)
+        acc[name + '_std'] = np.sqrt(acc[name + '_m2'] / (n - 1).where(n > 1))
+    return acc
@@ -0,0 +1,144 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import re
+import sys
+import glob
+import configparser
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import storage
+
+"""Config"""
+PRODUCTS   = ['-ml-int', '-ml-station', '-pl', '-pvu']
+CHUNK_DAYS = 1 # days written per step (bounds memory)
+
+
+def consolidate_era5(CONFIG_FILE, era5_folder):
+    """Merge per-night ERA5 files (<file_name[0:13]><product>) into monthly files (<YYYY-MM><product>)
+        - consecutive nights overlap by a day, every hour is stored once (unique hourly time axis)
+        - the time range of each night is kept in era5-index.csv, storage.open_era5 still finds "the ERA5 of measurement X"
+        - monthly files that already exist are extended (new nights can be consolidated later)
+    """
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    folder  = os.path.join(config.get("OUTPUT","FOLDER"), era5_folder)
+    backend = config.get("ERA5", "BACKEND", fallback="netcdf")
+
+    for product in PRODUCTS:
+        night_files = sorted(path for path in glob.glob(os.path.join(folder, "*" + product + ".*"))
+                             if re.match(r'^\d{8}-\d{4}' + product + r'\.(nc|zarr)$', os.path.split(path)[-1]))
+        if len(night_files) == 0:
+            continue
+
+        """Sources (several nights can share one day store) and index of nights"""
+        sources, index, night_hours = {}, [], []
+        for path in night_files:
+            source = os.path.realpath(path)
+            if source not in sources:
+                sources[source] = storage.open_dataset(source)
+            times = sources[source]['time'].values
+            index.append({'night': os.path.split(path)[-1][0:13], 'product': product, 'start': times[0], 'end': times[-1]})
+            night_hours.append(times)
+
+        """Monthly files on unique hourly time axis"""
+        first  = next(iter(sources.values()))
+        months = np.unique(np.concatenate([ds['time'].values.astype('datetime64[M]') for ds in sources.values()]))
+        for month in months:
+            monthly_file = os.path.join(folder, str(month) + product + storage.extensions[backend])
+            consolidate_month(month, monthly_file, list(sources.values()),
+                              first.attrs.get('encoding_profile', 'default'), bool(first.attrs.get('packed', 0)))
+            print(f"[i]  {os.path.split(monthly_file)[-1]} ({len(night_files)} nights)")
+
+        for ds in sources.values():
+            ds.close()
+
+        """Per-night files are only removed if the monthly files hold every hour (start...end) of each night"""
+        missing = [entry['night'] for entry, times in zip(index, night_hours) if not month_coverage(folder, product, times)]
+        if len(missing) > 0:
+            raise RuntimeError(f"Monthly {product} files miss hours of {', '.join(missing)}, per-night files are kept")
+
+        """Index and removal of per-night files (and shared day stores)"""
+        ds_index = pd.concat([storage.read_era5_index(folder), pd.DataFrame(index)], ignore_index=True)
+        ds_index = ds_index.drop_duplicates(subset=['night', 'product'], keep='last').sort_values(['product', 'night'])
+        ds_index.to_csv(storage.era5_index_file(folder), index=False)
+        for path in night_files:
+            storage.remove(path)
+        for source in sources:
+            storage.remove(source)
+            storage.remove(source + '.lock')
+
+
+# ----------------------------------- SUBROUTINES ----------------------------------- #
+def consolidate_month(month, monthly_file, sources, profile, packed):
+    """Write all hours of month from the sources (and an existing monthly file) in time order, each hour once"""
+    tmp_file = monthly_file + '.tmp' + os.path.splitext(monthly_file)[1]
+    if os.path.exists(monthly_file):
+        sources = [storage.open_dataset(monthly_file)] + sources
+
+    # - First source providing an hour is used - #
+    hours, source_index = np.array([], dtype='datetime64[ns]'), np.array([], dtype=int)
+    for k, ds in enumerate(sources):
+        times = ds['time'].values.astype('datetime64[ns]')
+        times = times[times.astype('datetime64[M]') == month]
+        new   = times[~np.isin(times, hours)]
+        hours = np.concatenate([hours, new])
+        source_index = np.concatenate([source_index, np.full(len(new), k)])
+    order = np.argsort(hours)
+    hours, source_index = hours[order], source_index[order]
+
+    """Write in chunks of CHUNK_DAYS"""
+    days = hours.astype('datetime64[D]')
+    chunk_starts = np.unique(days)[::CHUNK_DAYS]
+    for c, chunk_start in enumerate(chunk_starts):
+        in_chunk = (days >= chunk_start) & (days < chunk_start + CHUNK_DAYS)
+        parts = [sources[k].sel(time=hours[in_chunk & (source_index == k)]) for k in np.unique(source_index[in_chunk])]
+        ds_chunk = xr.concat(parts, dim='time').sortby('time').load() if len(parts) > 1 else parts[0].load()
+        for var in ds_chunk.variables:
+            ds_chunk[var].encoding = {key: value for key, value in ds_chunk[var].encoding.items() if key in ['units', 'calendar']}
+        storage.write_dataset(ds_chunk, tmp_file, profile, append=(c > 0), packed=packed)
+
+    if os.path.exists(monthly_file):
+        sources[0].close()
+        storage.remove(monthly_file)
+    os.rename(tmp_file, monthly_file)
+
+
+def month_coverage(folder, product, times):
+    """All times of a night are in the monthly files (read back after writing)"""
+    times = np.asarray(times).astype('datetime64[ns]')
+    for month in np.unique(times.astype('datetime64[M]')):
+        monthly_file = storage.find(os.path.join(folder, str(month) + product + '.nc'))
+        if monthly_file is None:
+            return False
+        with storage.open_dataset(monthly_file) as ds_month:
+            hours = ds_month['time'].values.astype('datetime64[ns]')
+        if not np.all(np.isin(times[times.astype('datetime64[M]') == month], hours)):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    """provide ini file and ERA5 folder (in OUTPUT FOLDER) as arguments and pass it to function"""
+
+    """Example:
+        >> python3 consolidate_era5.py coral.ini era5-region
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    consolidate_era5(sys.argv[1], sys.argv[2])
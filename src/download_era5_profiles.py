@@ -27,7 +27,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import warnings
 warnings.simplefilter("ignore", RuntimeWarning)
 
-import filter, cmaps, era5_processor, lidar_processor
+import filter, cmaps, era5_processor, lidar_processor, storage
 
 """Config"""
 duration_threshold = 6
@@ -91,8 +91,9 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
         nc_file_name = file_name[:13]
         file_ml     = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml.nc')
         file_ml_T21 = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml-T21.nc')
-        file_ml_int = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml-int.nc')
-        if not os.path.exists(file_ml_int):
+        file_ml_int = storage.era5_file(config, nc_file_name, start_date, '-ml-int') # .nc or shared .zarr day store
+        file_station = storage.era5_file(config, nc_file_name, start_date, '-ml-station') # station column sidecar of file_ml_int
+        if not storage.era5_available(config, nc_file_name, start_date, '-ml-int'): # per-night file or consolidated
             """Download ERA5 data"""
             DATE = start_date.strftime("%Y-%m-%d") + "/to/" + (start_date + datetime.timedelta(days=1)).strftime("%Y-%m-%d")
             ## AREA = '-25/-120/-85/-30',          # North, West, South, East. Default: global
@@ -141,9 +142,23 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
                 }, file_ml_T21)
 
             print(f"[i][{ii}]   Interpolating model levels...")
-            era5_processor.prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int)
+            era5_processor.prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int,
+                                                      memory_budget=config.getfloat("ERA5","MEMORY_BUDGET",fallback=era5_processor.ml_memory_budget),
+                                                      profile=config.get("ERA5","ENCODING_PROFILE",fallback="station-column"),
+                                                      packed=config.getboolean("ERA5","PACKED",fallback=False),
+                                                      file_station=file_station, station=era5_processor.station_coords(config),
+                                                      station_method=config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
             os.remove(file_ml)
             os.remove(file_ml_T21)                
+        if storage.era5_available(config, nc_file_name, start_date, '-ml-int') and not storage.era5_available(config, nc_file_name, start_date, '-ml-station'):
+            print(f"[i][{ii}]   Writing station column...")
+            ds_ml_int = storage.open_era5_file(config, nc_file_name, start_date, '-ml-int')
+            era5_processor.write_station_column(ds_ml_int, file_station, era5_processor.station_coords(config),
+                                                packed=config.getboolean("ERA5","PACKED",fallback=False),
+                                                method=config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
+            ds_ml_int.close()
+        storage.link_era5_file(config, nc_file_name, start_date, '-ml-int')
+        storage.link_era5_file(config, nc_file_name, start_date, '-ml-station')
         print(f"[i][{ii}]   ERA5 data prepared for observation: {obs}")
     else:
         print(f"[i][{ii}]   Duration below limit for observation: {obs}")
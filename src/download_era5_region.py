@@ -27,7 +27,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import warnings
 warnings.simplefilter("ignore", RuntimeWarning)
 
-import filter, cmaps, era5_processor, lidar_processor
+import filter, cmaps, era5_processor, lidar_processor, storage
 
 """Config"""
 duration_threshold = 6
@@ -92,9 +92,10 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
         nc_file_name = file_name[:13]
         file_ml     = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml.nc')
         file_ml_T21 = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml-T21.nc')
-        file_ml_int = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-ml-int.nc')
-        file_pl     = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-pl.nc')
-        file_pvu    = os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + '-pvu.nc')
+        file_ml_int = storage.era5_file(config, nc_file_name, start_date, '-ml-int') # .nc or shared .zarr day store
+        file_station = storage.era5_file(config, nc_file_name, start_date, '-ml-station') # station column sidecar of file_ml_int
+        file_pl     = storage.era5_file(config, nc_file_name, start_date, '-pl')
+        file_pvu    = storage.era5_file(config, nc_file_name, start_date, '-pvu')
 
         """Download ERA5 data"""
         if config.get("GENERAL","INSTRUMENT") == "TELMA":
@@ -105,7 +106,7 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
         AREA = config.get("ERA5","AREA")
         c = cdsapi.Client(quiet=True)
 
-        if not os.path.exists(file_ml_int):
+        if not storage.era5_available(config, nc_file_name, start_date, '-ml-int'): # per-night file or consolidated
             if not os.path.exists(file_ml):
                 print(f"[i][{ii}]   Retrieving full model data...")
                 # - Request model level data - #
@@ -147,11 +148,23 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
                 }, file_ml_T21)
 
             print(f"[i][{ii}]   Interpolating model levels...")
-            era5_processor.prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int)
+            era5_processor.prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int,
+                                                      memory_budget=config.getfloat("ERA5","MEMORY_BUDGET",fallback=era5_processor.ml_memory_budget),
+                                                      profile=config.get("ERA5","ENCODING_PROFILE",fallback="cross-section"),
+                                                      packed=config.getboolean("ERA5","PACKED",fallback=False),
+                                                      file_station=file_station, station=era5_processor.station_coords(config),
+                                                      station_method=config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
             os.remove(file_ml)
             os.remove(file_ml_T21)
-
-        if (not os.path.exists(file_pl)):
+        if storage.era5_available(config, nc_file_name, start_date, '-ml-int') and not storage.era5_available(config, nc_file_name, start_date, '-ml-station'):
+            print(f"[i][{ii}]   Writing station column...")
+            ds_ml_int = storage.open_era5_file(config, nc_file_name, start_date, '-ml-int')
+            era5_processor.write_station_column(ds_ml_int, file_station, era5_processor.station_coords(config),
+                                                packed=config.getboolean("ERA5","PACKED",fallback=False),
+                                                method=config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
+            ds_ml_int.close()
+
+        if not storage.era5_available(config, nc_file_name, start_date, '-pl'):
             print(f"[i][{ii}]   Retrieving pressure level data...")
             c.retrieve('reanalysis-era5-complete', {
                 'class'   : 'ea',
@@ -167,9 +180,12 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
                 'area'    : AREA,          # North, West, South, East. Default: global
                 'grid'    : '0.25/0.25',               # Latitude/longitude. Default: spherical harmonics or reduced Gaussian grid
                 'format'  : 'netcdf',                # Output needs to be regular lat-lon, so only works in combination with 'grid'!
-            }, file_pl)
+            }, storage.backend_path(file_pl, 'netcdf'))
+            if storage.is_zarr(file_pl):
+                storage.convert(storage.backend_path(file_pl, 'netcdf'), file_pl)
+                os.remove(storage.backend_path(file_pl, 'netcdf'))
 
-        if (not os.path.exists(file_pvu)):
+        if not storage.era5_available(config, nc_file_name, start_date, '-pvu'):
             print(f"[i][{ii}]   Retrieving 2PVU level data...")
             c.retrieve('reanalysis-era5-complete', {
                 'class'   : 'ea',
@@ -184,8 +200,13 @@ def download_and_interpolate_era5_data(ii,config,obs,sema):
                 'area'    : AREA,          # North, West, South, East. Default: global
                 'grid'    : '0.25/0.25',               # Latitude/longitude. Default: spherical harmonics or reduced Gaussian grid
                 'format'  : 'netcdf',
-            }, file_pvu)
+            }, storage.backend_path(file_pvu, 'netcdf'))
+            if storage.is_zarr(file_pvu):
+                storage.convert(storage.backend_path(file_pvu, 'netcdf'), file_pvu)
+                os.remove(storage.backend_path(file_pvu, 'netcdf'))
 
+        for product in ['-ml-int', '-ml-station', '-pl', '-pvu']:
+            storage.link_era5_file(config, nc_file_name, start_date, product)
         print(f"[i][{ii}]   ERA5 data prepared for observation: {obs}")
     else:
         print(f"[i][{ii}]   Duration below limit for observation: {obs}")
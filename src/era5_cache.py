@@ -0,0 +1,68 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import glob
+import hashlib
+
+import numpy as np
+import xarray as xr
+
+import storage
+
+"""Cache of the ERA5 computations of a composition (slices and virtual lidar) per measurement
+    - key: fingerprints of the ERA5 input files, [ERA5] section of the config and settings of the caller
+    - file: <night>-<key>-slices.nc (all fields the draw path reads, derived 4D fields like th, N2, u_horiz are not stored)
+"""
+
+"""Config"""
+CACHE_VERSION  = 3 # increase if slices change
+CACHE_PRODUCTS = ['-ml-int', '-ml-station', '-pl', '-pvu']
+
+
+def cache_folder(config):
+    """Cache next to the outputs (OUTPUT: CACHE_FOLDER, default OUTPUT FOLDER/era5-cache)"""
+    return config.get("OUTPUT", "CACHE_FOLDER", fallback=os.path.join(config.get("OUTPUT","FOLDER"), "era5-cache"))
+
+
+def cache_key(config, era5_folder, night, settings):
+    """Key of the inputs of a measurement (ERA5 files, [ERA5] config, settings dict of the caller)"""
+    items = ["version:{}".format(CACHE_VERSION)]
+    for product in CACHE_PRODUCTS:
+        paths, timeframe = storage.era5_paths(era5_folder, night, product)
+        items += [product] + [storage.fingerprint(path) for path in paths] + [str(timeframe)]
+    items += ["{}={}".format(key, value) for key, value in sorted(config.items("ERA5"))]
+    items += ["{}={}".format(key, value) for key, value in sorted(settings.items())]
+    return hashlib.sha1("\n".join(items).encode()).hexdigest()[:16]
+
+
+def cache_file(config, night, key):
+    return os.path.join(cache_folder(config), "{}-{}-slices.nc".format(night, key))
+
+
+def load(config, night, key):
+    """Slices of a measurement from the cache -> dict of arrays (None if not cached)"""
+    path = cache_file(config, night, key)
+    if not os.path.exists(path):
+        return None
+    with storage.open_dataset(path) as ds_slices:
+        slices = {var: ds_slices[var].values for var in ds_slices.data_vars}
+    return slices
+
+
+def store(config, night, key, slices):
+    """Write slices of a measurement (older entries of the measurement are removed)"""
+    os.makedirs(cache_folder(config), exist_ok=True)
+    for path in glob.glob(os.path.join(cache_folder(config), night + "-*.nc")):
+        storage.remove(path)
+
+    # - Slices (arrays of different grids): dims <var>_<axis> - #
+    ds_slices = xr.Dataset({var: (["{}_{}".format(var, axis) for axis in range(np.ndim(values))], np.asarray(values))
+                            for var, values in slices.items()})
+    path = cache_file(config, night, key)
+    storage.write_dataset(ds_slices, path + '.tmp')
+    os.rename(path + '.tmp', path) # complete entries only
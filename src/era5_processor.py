@@ -5,10 +5,14 @@
 # GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
 ################################################################################
 
+import functools
+
 import numpy as np
 import pandas as pd
 import xarray as xr
 
+import filter, storage
+
 """Constants"""
 # omega = 7.292*10**(-5)
 g = 9.80665
@@ -18,8 +22,20 @@ p0 = 101325
 
 file_ml_coeff = '../input/era5-ml-coeff.csv'
 
-def processing_data_for_jetexit_comp(config,ds,ds_pv,ds_2pvu):
-    """Further processing of ERA5 data"""
+"""Config (vertical grid of interpolated model level data)"""
+z_new   = np.linspace(0,70,176) * 1000 # m
+# z_new = np.linspace(0,80,161) * 1000
+alt_var = 'geop_height' # 'geom_height'
+ml_vars = ['t','p','u','v']
+station_vars = ['t','p','u','v','tprime'] # station column sidecar (-ml-station) of the interpolated file
+station_method = 'bilinear' # horizontal interpolation to the station: bilinear or idw (ERA5: STATION_INTERP)
+
+"""Config (memory of model level processing)"""
+ml_memory_budget   = 4000 # MB per process (ERA5: MEMORY_BUDGET)
+ml_fields_per_step = 40   # approx. number of 137-level float64 fields held per time step (input, heights, interpolation)
+
+def derived_fields(ds):
+    """Derived fields of the composition slices (th, N2 from the vertical gradient of th, u_horiz)"""
 
     ds['th'] = ds['t'] * (p0/ds['p'])**(2/7)
     
@@ -47,10 +63,15 @@ def processing_data_for_jetexit_comp(config,ds,ds_pv,ds_2pvu):
     # ds['tprime_m'] = ds['tprime'].where(abs(ds['tprime'])>1)
     ds['u_horiz'] = (ds['u']**2 + ds['v']**2)**(1/2)
 
-    ds_pv['u_horiz'] = (ds_pv['u']**2 + ds_pv['v']**2)**(1/2)
     # ds_pv['u_horiz'] = (ds_pv['u']**2 + ds_pv['v']**2)**(1/2)
     # ds_pv['div_u'] = ds_pv['u'].differentiate(coord='longitude') + ds_pv['v'].differentiate(coord='latitude')
 
+    return ds
+
+
+def plot_coordinates(config, ds, ds_pv, ds_2pvu):
+    """Longitudes for plots (coordinates only, no data is computed)"""
+
     if config.getboolean("ERA5","WESTERN_COORDS"):
         ds['longitude_plot']      = ds['longitude'] - 360
         ds_pv['longitude_plot']   = ds_pv['longitude'] - 360
@@ -63,143 +84,369 @@ def processing_data_for_jetexit_comp(config,ds,ds_pv,ds_2pvu):
         ds_pv['longitude_plot']   = ds_pv['longitude']
         ds_2pvu['longitude_plot'] = ds_2pvu['longitude']
 
-    dims_pv = np.shape(ds_pv['pv'])
-    ds_pv['longitude_3d'] = ds_pv.longitude_plot.expand_dims(dim={'time':dims_pv[0],'level':dims_pv[1],'latitude':dims_pv[2]},axis=[0,1,2])
-    ds_pv['latitude_3d']  = ds_pv.latitude.expand_dims(dim={'time':dims_pv[0],'level':dims_pv[1],'longitude':dims_pv[3]},axis=[0,1,3])
-
     return ds,ds_pv,ds_2pvu
 
 
-def prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int):
-    """"Open files"""
-    ml_coeff = pd.read_csv(file_ml_coeff)
-    # engine="netcdf4"
-    with xr.open_dataset(file_ml) as ds:
-        with xr.open_dataset(file_ml_T21) as ds_T21:
-            """Interpolate the model level dataset to a regular grid and combine with T21 (filtered) dataset"""
-            lnsp = ds['lnsp'][:,0,:,:].drop_vars('level').expand_dims(dim={'level':138}, axis=1)
-            dims = np.shape(lnsp)
-
-            a = xr.DataArray(ml_coeff['a [Pa]'])
-            a = a.rename({'dim_0':'level'})
-            a = a.expand_dims(dim={'time':dims[0],'latitude':dims[2],'longitude':dims[3]},axis=[0,2,3])
-
-            b = xr.DataArray(ml_coeff['b'])
-            b = b.rename({'dim_0':'level'})
-            b = b.expand_dims(dim={'time':dims[0],'latitude':dims[2],'longitude':dims[3]},axis=[0,2,3])
-
-            # - Pressure at half levels - # 
-            p_half = a + b * np.exp(lnsp.values)
-
-            """Compute geopotential and geometric height"""
-            ds = compute_z_level(ds, p_half)
-            ds['geom_height'] = Re * ds['geop_height'] / (Re-ds['geop_height'])
-
-            # - Calculate pressure on model levels - #
-            i=np.arange(0,137)
-            ds['p'] = ds['t'].copy()
-            ds['p'][:,i,:,:] = (p_half[:,i+1,:,:].values + p_half[:,i,:,:].values) / 2
-            
-            # - Calculate T' - #
-            ds['tprime'] = ds['t']-ds_T21['t']
-
-            """Interpolate data to aequidistant vertical grid"""
-            z_new = np.linspace(0,70,176) * 1000
-            # z_new   = np.linspace(0,80,161) * 1000
-            vars    = ['t','p','u','v','tprime']
-            alt_var = 'geop_height' # 'geom_height'
-            ds = interp_ds_vertically(ds,z_new,alt_var,vars)
-
-            # - Compression - #
-            for var_name in vars: # ds.variables
-                ds[var_name] = ds[var_name].astype('float32') #'int16'
-
-            ds.to_netcdf(file_ml_int)
-
-
-def prepare_T21(file_ml, file_ml_int):
-    """"Open files"""
-    ml_coeff = pd.read_csv(file_ml_coeff)
+def prepare_interpolated_ml_ds(file_ml,file_ml_T21,file_ml_int,memory_budget=ml_memory_budget,profile='default',packed=False,
+                               file_station=None,station=None,station_method=station_method):
+    """Interpolate the model level dataset to a regular grid and combine with T21 (filtered) dataset (t,p,u,v,tprime)"""
+    process_ml_files(file_ml, file_ml_T21=file_ml_T21, file_ml_int=file_ml_int, memory_budget=memory_budget, profile=profile, packed=packed,
+                     file_station=file_station, station=station, station_method=station_method)
+
+
+def prepare_T21(file_ml, file_ml_int, memory_budget=ml_memory_budget, profile='default', packed=False):
+    """Interpolate the model level dataset to a regular grid (t,p,u,v)"""
+    process_ml_files(file_ml, file_ml_int=file_ml_int, memory_budget=memory_budget, profile=profile, packed=packed)
+
+
+def process_ml_files(file_ml, file_ml_T21=None, file_ml_int=None, memory_budget=ml_memory_budget, profile='default', packed=False,
+                     file_station=None, station=None, station_method=station_method):
+    """Model level pipeline: heights, pressure and vertical interpolation of ERA5 model level files in one pass
+        - file_ml_int:  interpolated t,p,u,v (+ tprime = t - t_T21 if file_ml_T21 is given)
+        - file_station: station column (station: (lat, lon), see station_coords) of file_ml_int (station-column profile),
+                        horizontally interpolated with station_method (bilinear or idw)
+        - T21 uses heights and interpolation weights of file_ml if the grids match (tprime on model levels
+          and its interpolation are the same, interpolation is linear)
+        - processed in time chunks (memory_budget in MB), each chunk is appended to the outputs
+        - outputs are written with an encoding profile of storage.py (chunks, compression, dim order), optionally packed (int16)
+    """
     # engine="netcdf4"
-    with xr.open_dataset(file_ml) as ds:
-        """Interpolate the model level dataset to a regular grid and combine with T21 (filtered) dataset"""
-        lnsp = ds['lnsp'][:,0,:,:].drop_vars('level').expand_dims(dim={'level':138}, axis=1)
-        dims = np.shape(lnsp)
+    with xr.open_dataset(file_ml) as ds_file:
+        ds_T21_file = None
+        if file_ml_T21 is not None:
+            ds_T21_file = xr.open_dataset(file_ml_T21)
+        try:
+            chunk = time_chunk_size(ds_file, memory_budget)
+            for t0 in range(0, ds_file.sizes['time'], chunk):
+                ds = ds_file.isel(time=slice(t0, t0+chunk)).load()
+                ds_T21 = None
+                if ds_T21_file is not None:
+                    ds_T21 = ds_T21_file.sel(time=ds['time'].values).load()
+                ds_int = process_ml_chunk(ds, ds_T21)
+
+                if file_station is not None:
+                    write_ml_int(station_column(ds_int, station, station_method), file_station, append=(t0 > 0), profile='station-column', packed=packed)
+                if file_ml_int is not None:
+                    write_ml_int(ds_int, file_ml_int, append=(t0 > 0), profile=profile, packed=packed)
+                del ds, ds_T21, ds_int
+        finally:
+            if ds_T21_file is not None:
+                ds_T21_file.close()
+
+
+def time_chunk_size(ds, memory_budget):
+    """Number of time steps per chunk within memory_budget (MB), ml_fields_per_step model level fields per time step"""
+    step_bytes = ml_fields_per_step * ds.sizes['level'] * ds.sizes['latitude'] * ds.sizes['longitude'] * 8
+    return int(max(1, min(ds.sizes['time'], memory_budget * 1024**2 // step_bytes)))
+
+
+def process_ml_chunk(ds, ds_T21=None):
+    """Heights, pressure and interpolated fields of one time chunk (+ tprime if ds_T21 is given)"""
+
+    """Compute pressure, geopotential and geometric height"""
+    ds = prepare_model_levels(ds)
+
+    """Interpolate data to aequidistant vertical grid"""
+    weights = interpolation_weights(np.moveaxis(ds[alt_var].values[:,::-1,:,:], 1, -1), z_new)
+    ds_int  = interp_ds_vertically(ds, z_new, alt_var, ml_vars, weights=weights)
+
+    if ds_T21 is not None:
+        # - Only T of the T21 background is needed - #
+        shared = all(np.array_equal(ds[dim].values, ds_T21[dim].values) for dim in ['time','level','latitude','longitude'])
+        if shared:
+            ds_T21[alt_var] = ds[alt_var]
+            ds_T21_int = interp_ds_vertically(ds_T21, z_new, alt_var, ['t'], weights=weights)
+        else:
+            ds_T21_int = interp_ds_vertically(prepare_model_levels(ds_T21), z_new, alt_var, ['t'])
 
-        a = xr.DataArray(ml_coeff['a [Pa]'])
-        a = a.rename({'dim_0':'level'})
-        a = a.expand_dims(dim={'time':dims[0],'latitude':dims[2],'longitude':dims[3]},axis=[0,2,3])
+        # - Calculate T' - #
+        ds_int['tprime'] = ds_int['t'] - ds_T21_int['t']
 
-        b = xr.DataArray(ml_coeff['b'])
-        b = b.rename({'dim_0':'level'})
-        b = b.expand_dims(dim={'time':dims[0],'latitude':dims[2],'longitude':dims[3]},axis=[0,2,3])
+    return ds_int
 
-        # - Pressure at half levels - # 
-        p_half = a + b * np.exp(lnsp.values)
 
-        """Compute geopotential and geometric height"""
-        ds = compute_z_level(ds, p_half)
-        ds['geom_height'] = Re * ds['geop_height'] / (Re-ds['geop_height'])
+def prepare_model_levels(ds):
+    """Pressure (p), geopotential (z, geop_height) and geometric height on model levels"""
+    # - Pressure at half levels and on model levels - #
+    p_half, p_full = pressure_levels(ds['lnsp'].values[:,0,:,:])
 
-        # - Calculate pressure on model levels - #
-        i=np.arange(0,137)
-        ds['p'] = ds['t'].copy()
-        ds['p'][:,i,:,:] = (p_half[:,i+1,:,:].values + p_half[:,i,:,:].values) / 2
+    """Compute geopotential and geometric height"""
+    ds = compute_z_level(ds, p_half)
+    ds['geom_height'] = Re * ds['geop_height'] / (Re-ds['geop_height'])
+    ds['p'] = (ds['t'].dims, p_full)
+    return ds
 
-        """Interpolate data to aequidistant vertical grid"""
-        z_new = np.linspace(0,70,176) * 1000
-        # z_new   = np.linspace(0,80,161) * 1000
-        vars    = ['t','p','u','v']
-        alt_var = 'geop_height' # 'geom_height'
-        ds = interp_ds_vertically(ds,z_new,alt_var,vars)
 
-        # - Compression - #
-        for var_name in vars: # ds.variables
-            ds[var_name] = ds[var_name].astype('float32') #'int16'
+def write_ml_int(ds, file_ml_int, append=False, profile='default', packed=False):
+    """Write interpolated model level data (append: add time steps to existing file, time is unlimited)"""
+    # - Compression (float32, packed: int16 with scale_factor/add_offset where the precision allows) - #
+    for var_name in ds.data_vars: # ds.variables
+        ds[var_name] = ds[var_name].astype('float32')
 
-        ds.to_netcdf(file_ml_int)
+    storage.write_dataset(ds, file_ml_int, profile=profile, append=append, packed=packed)
+
+
+def station_coords(config):
+    """Latitude and longitude (0...360, as in the ERA5 files) of the station"""
+    lon = config.getfloat("ERA5","LON")
+    if config.getboolean("ERA5","WESTERN_COORDS"):
+        lon = lon + 360
+    return config.getfloat("ERA5","LAT"), lon
+
+
+def station_column(ds, station, method=station_method):
+    """Station column (station_vars interpolated to station, lat/lon kept as scalar coords)"""
+    vars = [var for var in station_vars if var in ds.data_vars]
+    return interp_station(ds[vars], station, method)
+
+
+def write_station_column(ds_ml_int, file_station, station, packed=False, method=station_method):
+    """Station column sidecar of existing interpolated data (per-night or consolidated -ml-int dataset)"""
+    ds_station = station_column(ds_ml_int, station, method).load()
+    for var in ds_station.variables:
+        ds_station[var].encoding = {key: value for key, value in ds_station[var].encoding.items() if key in ['units', 'calendar']}
+    write_ml_int(ds_station, file_station, profile='station-column', packed=packed)
+
+
+def open_station_column(config, folder, night):
+    """ERA5 station column of a measurement (night: file_name[0:13]), None if not available
+        - sidecar (-ml-station) if available, otherwise the column of the regional interpolated file (-ml-int)
+    """
+    ds = storage.open_era5(folder, night, '-ml-station')
+    if ds is not None:
+        return ds
+    ds = storage.open_era5(folder, night, '-ml-int')
+    if ds is None:
+        return None
+    return interp_station(ds, station_coords(config), config.get("ERA5","STATION_INTERP",fallback=station_method))
+
+
+def axis_weights(grid, x):
+    """Linear interpolation of x on a 1D grid (ascending or descending) -> index window, weights"""
+    grid = np.asarray(grid, dtype=float)
+    on_grid = np.isclose(grid, x, rtol=0, atol=1e-6)
+    if on_grid.any():
+        i = int(np.argmax(on_grid))
+        return slice(i, i+1), np.ones(1)
+    if not (min(grid[0], grid[-1]) < x < max(grid[0], grid[-1])):
+        raise ValueError(f"Station coordinate {x} outside of ERA5 grid [{grid.min()}, {grid.max()}]")
+    if grid[0] < grid[-1]:
+        i = int(np.searchsorted(grid, x)) - 1
+    else:
+        i = int(np.searchsorted(-grid, -x)) - 1
+    f = (x - grid[i]) / (grid[i+1] - grid[i])
+    return slice(i, i+2), np.array([1-f, f])
+
+
+@functools.lru_cache(maxsize=None)
+def grid_station_weights(lat_grid, lon_grid, lat, lon, method):
+    """Horizontal interpolation weights of a station on a lat/lon grid (tuples, cached per grid and station)
+        -> lat window, lon window, weights (nlat_window, nlon_window)
+        - bilinear: product of the linear weights in latitude and longitude
+        - idw: inverse squared distance of the surrounding grid points (distance in longitude scaled by cos(lat))
+        - stations on grid points (or grid lines) use the grid values without interpolation
+    """
+    lat_window, w_lat = axis_weights(lat_grid, lat)
+    lon_window, w_lon = axis_weights(lon_grid, lon)
+    if method == 'bilinear':
+        weights = np.outer(w_lat, w_lon)
+    elif method == 'idw':
+        dlat = np.asarray(lat_grid[lat_window]) - lat
+        dlon = (np.asarray(lon_grid[lon_window]) - lon) * np.cos(np.deg2rad(lat))
+        dist = dlat[:,np.newaxis]**2 + dlon[np.newaxis,:]**2
+        weights = np.ones_like(dist) if dist.size == 1 else 1 / dist
+        weights = weights / weights.sum()
+    else:
+        raise ValueError(f"Unknown station interpolation: {method}")
+    return lat_window, lon_window, weights
+
+
+def station_weights(ds, station, method=station_method):
+    """Horizontal interpolation weights of station (lat, lon) on the grid of ds"""
+    return grid_station_weights(tuple(ds['latitude'].values.tolist()), tuple(ds['longitude'].values.tolist()),
+                                float(station[0]), float(station[1]), method)
+
+
+def apply_station_weights(data, weights):
+    """Station values of (..., latitude, longitude) arrays (one einsum over the weight window)"""
+    lat_window, lon_window, w = weights
+    return np.einsum('...ij,ij->...', data[..., lat_window, lon_window], w)
+
+
+def interp_station(ds, station, method=station_method):
+    """Interpolate all variables of ds (Dataset or DataArray) with latitude and longitude to station (lat, lon)"""
+    lat_window, lon_window, w = station_weights(ds, station, method)
+    ds = ds.isel(latitude=lat_window, longitude=lon_window)
+    if isinstance(ds, xr.DataArray):
+        return interp_station_da(ds, w, station)
+    ds_station = xr.Dataset(attrs=ds.attrs)
+    for var in ds.data_vars:
+        ds_station[var] = interp_station_da(ds[var], w, station)
+    return ds_station
+
+
+def interp_station_da(da, w, station):
+    """Weighted sum over the lat/lon window of a DataArray (lat/lon -> scalar coords of the station)"""
+    if ('latitude' not in da.dims) or ('longitude' not in da.dims):
+        return da
+    da = da.transpose(..., 'latitude', 'longitude')
+    coords = {name: coord for name, coord in da.coords.items() if not {'latitude','longitude'} & set(coord.dims)}
+    coords.update({'latitude': float(station[0]), 'longitude': float(station[1])})
+    return xr.DataArray(np.einsum('...ij,ij->...', da.values, w), dims=da.dims[:-2], coords=coords, attrs=da.attrs, name=da.name)
+
+
+def interp_slice(da, dim, x):
+    """Cross section of da at x along dim (latitude or longitude), linear between grid lines"""
+    window, w = axis_weights(da[dim].values, x)
+    return (da.isel({dim: window}) * xr.DataArray(w, dims=dim)).sum(dim, skipna=False)
+
+
+@functools.lru_cache(maxsize=64)
+def linear_weights(grid, x):
+    """Linear interpolation from an ascending grid to x (tuples, cached) -> lower index, weight (NaN outside of grid)"""
+    grid = np.asarray(grid, dtype=float)
+    x    = np.asarray(x, dtype=float)
+    lo = np.clip(np.searchsorted(grid, x, side='right') - 1, 0, len(grid)-2)
+    w  = np.where((x >= grid[0]) & (x <= grid[-1]), (x - grid[lo]) / (grid[lo+1] - grid[lo]), np.nan)
+    lo.flags.writeable = False # shared by all calls with the same grids
+    w.flags.writeable  = False
+    return lo, w
+
+
+def lidar_grid_weights(era5_time, era5_alt, time, alt):
+    """Interpolation weights from the hourly ERA5 column (time, altitude in km) to the lidar grid (time, alt_plot in km)
+        - cached, nights and variables with identical grids reuse the indices
+    """
+    era5_time, time = [tuple(np.asarray(t).astype('datetime64[ns]').astype(np.int64).tolist()) for t in [era5_time, time]]
+    era5_alt, alt   = [tuple(np.round(np.asarray(z, dtype=float), 6).tolist()) for z in [era5_alt, alt]]
+    return linear_weights(era5_time, time), linear_weights(era5_alt, alt)
+
+
+def interp_to_lidar_grid(ds_era5, time, alt, vars):
+    """ERA5 station column (time, level) of vars on the lidar grid (time, alt in km) in one step -> {var: (time, alt)}"""
+    (lt, wt), (lz, wz) = lidar_grid_weights(ds_era5['time'].values, ds_era5['level'].values / 1000, time, alt)
+    data = np.stack([ds_era5[var].transpose('time', 'level').values for var in vars]) # (var, time, level)
+    data = data[:,lt,:] * (1 - wt)[np.newaxis,:,np.newaxis] + data[:,lt+1,:] * wt[np.newaxis,:,np.newaxis]
+    data = data[:,:,lz] * (1 - wz) + data[:,:,lz+1] * wz
+    return {var: data[k] for k, var in enumerate(vars)}
+
+
+def stations_weights(ds, stations, method=station_method):
+    """Horizontal interpolation weights of several stations [(lat, lon), ...] on the grid of ds as gather indices
+        -> index (nstations, 4) into the flattened lat/lon grid, weights (nstations, 4) (unused points: weight 0)
+    """
+    nlat, nlon = ds.sizes['latitude'], ds.sizes['longitude']
+    index   = np.zeros((len(stations), 4), dtype=int)
+    weights = np.zeros((len(stations), 4))
+    for s, station in enumerate(stations):
+        lat_window, lon_window, w = station_weights(ds, station, method)
+        ilat, ilon = np.meshgrid(np.arange(nlat)[lat_window], np.arange(nlon)[lon_window], indexing='ij')
+        index[s,:]        = ilat.ravel()[0] * nlon + ilon.ravel()[0] # padding: first point (no NaN from unused points)
+        index[s,:w.size]  = (ilat * nlon + ilon).ravel()
+        weights[s,:w.size] = w.ravel()
+    return index, weights
+
+
+def apply_stations_weights(data, index, weights):
+    """Columns of several stations of (..., latitude, longitude) arrays in one gather and einsum -> (..., station)"""
+    flat = data.reshape(data.shape[:-2] + (-1,))
+    return np.einsum('...sk,sk->...s', flat[..., index], weights)
+
+
+def extract_stations(ds, stations, names, method=station_method, memory_budget=ml_memory_budget):
+    """Columns of several stations from one (regional) dataset -> dataset with dims (station, ...)
+        - all stations are extracted in one pass over the data, read in time chunks (memory_budget in MB)
+    """
+    index, weights = stations_weights(ds, stations, method)
+    step_bytes = ds.sizes.get('level', 1) * ds.sizes['latitude'] * ds.sizes['longitude'] * 8
+    chunk = int(max(1, memory_budget * 1024**2 // step_bytes))
+
+    ds_stations = xr.Dataset(coords={'station'  : names,
+                                     'latitude' : ('station', [float(station[0]) for station in stations]),
+                                     'longitude': ('station', [float(station[1]) for station in stations])},
+                             attrs=ds.attrs)
+    for var in ds.data_vars:
+        da = ds[var]
+        if ('latitude' not in da.dims) or ('longitude' not in da.dims):
+            continue
+        da = da.transpose(..., 'latitude', 'longitude')
+        if 'time' in da.dims:
+            values = np.concatenate([apply_stations_weights(da.isel(time=slice(t0, t0+chunk)).values, index, weights)
+                                     for t0 in range(0, da.sizes['time'], chunk)], axis=da.dims.index('time'))
+        else:
+            values = apply_stations_weights(da.values, index, weights)
+        ds_stations[var] = (('station',) + da.dims[:-2], np.moveaxis(values, -1, 0), da.attrs)
+    for dim in ['time', 'level']:
+        if dim in ds.coords:
+            ds_stations = ds_stations.assign_coords({dim: ds[dim]})
+    return ds_stations
+
+
+def calculate_station_primes(ds_stations, temporal_cutoff, vertical_cutoff):
+    """Butterworth T' of all station columns in one filter call per direction (as for the virtual lidar)
+        - tprime_tbwf: T' with periods below temporal_cutoff (min)
+        - tprime_vbwf: T' with vertical wavelengths below vertical_cutoff (km)
+    """
+    t = ds_stations['t'].transpose('station', 'time', 'level').values
+    nstation, ntime, nlevel = t.shape
+    vres = (ds_stations['level'].values[1] - ds_stations['level'].values[0]) / 1000 # km
+    tres = (ds_stations['time'].values[1] - ds_stations['time'].values[0]) / np.timedelta64(1, 'm') # min
+
+    tprime_vbwf, tbg = filter.butterworth_filter(t.reshape(-1, nlevel), cutoff=1/vertical_cutoff, fs=1/vres, order=5, mode='both')
+    tprime_tbwf, tbg = filter.butterworth_filter(np.moveaxis(t, 1, 2).reshape(-1, ntime), cutoff=1/temporal_cutoff, fs=1/tres, order=5, mode='both')
+    ds_stations['tprime_vbwf'] = (('station', 'time', 'level'), tprime_vbwf.reshape(nstation, ntime, nlevel))
+    ds_stations['tprime_tbwf'] = (('station', 'time', 'level'), np.moveaxis(tprime_tbwf.reshape(nstation, nlevel, ntime), 2, 1))
+    return ds_stations
+
+
+@functools.lru_cache(maxsize=None)
+def ml_coefficients():
+    """Hybrid coefficients a (Pa) and b of the 138 half levels (parsed once per process)"""
+    ml_coeff = pd.read_csv(file_ml_coeff)
+    return ml_coeff['a [Pa]'].values, ml_coeff['b'].values
+
+
+def pressure_levels(lnsp):
+    """Pressure at half levels (time, 138, lat, lon) and on model levels (time, 137, lat, lon) from lnsp (time, lat, lon)
+        - 1-D coefficients are broadcast against surface pressure (no 4-D coefficient arrays)
+    """
+    a, b   = ml_coefficients()
+    p_half = a[np.newaxis,:,np.newaxis,np.newaxis] + b[np.newaxis,:,np.newaxis,np.newaxis] * np.exp(lnsp)[:,np.newaxis,:,:]
+    p_full = (p_half[:,1:,:,:] + p_half[:,:-1,:,:]) / 2
+    return p_half, p_full
 
 
 def compute_z_level(ds, p_half):
     """Compute z at half & full level for the given level, based on t/q/sp"""
     # https://confluence.ecmwf.int/display/CKB/ERA5%3A+compute+pressure+and+geopotential+on+model+levels%2C+geopotential+height+and+geometric+height
+    # - all levels at once: z at the lower half level of each level is a reverse cumulative sum (from the surface) - #
 
     # - Get surface geopotential - #
-    z_h = ds['z'][:,0,:,:].copy()
-    
+    z_s = ds['z'].values[:,0:1,:,:]
+
     # compute moist temperature
     ds['t_moist'] = ds['t'] * (1. + 0.609133 * ds['q'])
- 
-    # compute the pressures (on half-levels)
-    i=np.arange(0,137)
+    t_level = ds['t_moist'].values * Rd
 
-    for i in range(136,0,-1):
-        ph_levplusone  = p_half[:,i+1,:,:].values
-        ph_lev         = p_half[:,i,:,:].values
+    # compute the pressures (on half-levels)
+    p_half = np.asarray(p_half)
+    ph_lev         = p_half[:,:-1,:,:]
+    ph_levplusone  = p_half[:,1:,:,:]
 
+    with np.errstate(divide='ignore', invalid='ignore'):
         dlog_p = np.log(ph_levplusone / ph_lev)
-        alpha = 1. - ((ph_lev / (ph_levplusone - ph_lev)) * dlog_p)
-
-        t_level = ds['t_moist'][:,i,:,:] * Rd
- 
-        # z_f is the geopotential of this full level
-        # integrate from previous (lower) half-level z_h to the full level
-        # z_f = z_h + (t_level * alpha)
-        ds['z'][:,i,:,:] = z_h + (t_level * alpha)
-    
-        # z_h is the geopotential of 'half-levels'
-        # integrate z_h to next half level
-        z_h = z_h + (t_level * dlog_p)
- 
-    i = 0
-    ph_levplusone   = p_half[:,i+1,:,:].values
-    ph_lev          = p_half[:,i,:,:].values
-    
-    dlog_p = np.log(ph_levplusone / 0.1)
-    alpha = np.log(2)
+        alpha  = 1. - ((ph_lev / (ph_levplusone - ph_lev)) * dlog_p)
+    # - top level (p = 0 at upper half level) - #
+    dlog_p[:,0,:,:] = np.log(ph_levplusone[:,0,:,:] / 0.1)
+    alpha[:,0,:,:]  = np.log(2)
 
-    t_level = ds['t_moist'][:,i,:,:] * Rd
-    ds['z'][:,i,:,:] = z_h + (t_level * alpha)
+    # z_h is the geopotential of 'half-levels' (integrated from the surface up to the lower half level of each level)
+    dz_h = t_level[:,1:,:,:] * dlog_p[:,1:,:,:]
+    z_h  = np.concatenate([np.cumsum(dz_h[:,::-1,:,:], axis=1)[:,::-1,:,:], np.zeros_like(z_s)], axis=1) + z_s
+
+    # z_f is the geopotential of this full level
+    # integrate from previous (lower) half-level z_h to the full level
+    ds['z'] = (ds['z'].dims, z_h + (t_level * alpha), ds['z'].attrs)
 
     # calculate geopotential height!!
     ds['geop_height'] = ds['z'] / g
@@ -207,23 +454,58 @@ def compute_z_level(ds, p_half):
     return ds
 
 
-def interp_ds_vertically(ds,z_new,alt_var,vars):
-    """Interpolate model levels to aequdistant grid for applying filters"""
-    for var in vars:
-        shape = np.shape(ds[vars[0]].values)
-        data  = np.zeros((shape[0],len(z_new),shape[2],shape[3]))
-        for t in range(0,shape[0]):
-            ## print(var, ': ',t, end='\r')
-            for lat in range(0,shape[2]):
-                for lon in range(0,shape[3]):
-                    data[t,:,lat,lon] = np.interp(z_new,ds[alt_var].values[t,::-1,lat,lon],ds[var].values[t,::-1,lat,lon])
-        if var==vars[0]:
-            ds_new = xr.Dataset({var: (['time','level','latitude','longitude'],data,ds[var].attrs)},
-                                coords={'time'     : ds['time'],
-                                        'level'    : z_new,
-                                        'latitude' : ds['latitude'],
-                                        'longitude': ds['longitude']},
-                                attrs=ds.attrs)
-        else:
-            ds_new[var] = (['time','level','latitude','longitude'],data,ds[var].attrs)
-    return ds_new
\ No newline at end of file
+def interpolation_weights(z, z_new):
+    """Bracket indices and weights of z_new in each column of z (last axis, increasing)
+        - same as np.interp per column (values outside of the column are clamped to the first/last level)
+        - columns are separated by an offset, so one searchsorted finds the brackets of all columns
+    Input:
+        - z (..., nz)
+        - z_new (nz_new) or (..., nz_new)
+    Output:
+        - lower index and weight of upper level (..., nz_new)
+    """
+    z     = np.asarray(z, dtype=float)
+    nz    = z.shape[-1]
+    z_new = np.broadcast_to(np.asarray(z_new, dtype=float), z.shape[:-1] + np.shape(z_new)[-1:])
+    z_col = z.reshape(-1, nz)
+    z_new_col = z_new.reshape(len(z_col), -1)
+
+    zmin   = min(z_col.min(), z_new_col.min())
+    span   = max(z_col.max(), z_new_col.max()) - zmin + 1
+    offset = (np.arange(len(z_col)) * span)[:,np.newaxis]
+    idx = np.searchsorted((z_col - zmin + offset).ravel(), (z_new_col - zmin + offset).ravel(), side='right')
+    lo  = np.clip(idx.reshape(z_new_col.shape) - np.arange(len(z_col))[:,np.newaxis] * nz - 1, 0, nz-2)
+
+    z_lo = np.take_along_axis(z_col, lo, axis=-1)
+    z_hi = np.take_along_axis(z_col, lo+1, axis=-1)
+    w = np.clip((z_new_col - z_lo) / (z_hi - z_lo), 0, 1)
+    return lo.reshape(z_new.shape), w.reshape(z_new.shape)
+
+
+def apply_interpolation_weights(data, lo, w):
+    """Interpolate data (..., nz) with indices and weights of interpolation_weights (leading axes, e.g. variables, are broadcast)"""
+    lo = np.broadcast_to(lo, data.shape[:-1] + lo.shape[-1:])
+    w  = np.broadcast_to(w, lo.shape)
+    return np.take_along_axis(data, lo, axis=-1) * (1 - w) + np.take_along_axis(data, lo+1, axis=-1) * w
+
+
+def interp_ds_vertically(ds,z_new,alt_var,vars,weights=None):
+    """Interpolate model levels to aequdistant grid for applying filters
+        - brackets and weights are computed once from alt_var (or passed) and applied to all vars
+    """
+    # - (time, level, lat, lon) -> (time, lat, lon, level) with increasing height - #
+    if weights is None:
+        weights = interpolation_weights(np.moveaxis(ds[alt_var].values[:,::-1,:,:], 1, -1), z_new)
+    lo, w = weights
+
+    data = np.stack([np.moveaxis(ds[var].values[:,::-1,:,:], 1, -1) for var in vars])
+    data = np.moveaxis(apply_interpolation_weights(data, lo, w), -1, 2)
+
+    ds_new = xr.Dataset(coords={'time'     : ds['time'],
+                                'level'    : z_new,
+                                'latitude' : ds['latitude'],
+                                'longitude': ds['longitude']},
+                        attrs=ds.attrs)
+    for k, var in enumerate(vars):
+        ds_new[var] = (['time','level','latitude','longitude'],data[k],ds[var].attrs)
+    return ds_new
@@ -0,0 +1,158 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import sys
+import configparser
+import multiprocessing as mp
+import time
+
+import numpy as np
+import xarray as xr
+
+import warnings
+warnings.simplefilter("ignore", RuntimeWarning)
+
+import era5_processor, plt_helper, storage
+
+"""Config"""
+VERTICAL_CUTOFF = 15 # km (LAMBDA_CUT)
+TEMPORAL_CUTOFF = 8*60 # min (TAU_CUT)
+
+
+def extract_virtual_stations(CONFIG_FILE, reset):
+    """Virtual lidar columns of several stations (ERA5: STATIONS and the configured station) from the regional ERA5 data
+        - all stations of a measurement are extracted in one pass over the regional -ml-int data
+        - one dataset per station: <station>.nc in era5-region/stations (t, p, u, v, tprime, tprime_tbwf, tprime_vbwf)
+          with dims (night, step, level), step: hours after the first ERA5 time of the measurement, time (night, step)
+        - measurements are extracted in parallel, station datasets are extended once by the main process
+    """
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+
+    era5_folder = os.path.join(config.get("OUTPUT","FOLDER"), "era5-region")
+    out_folder  = os.path.join(era5_folder, "stations")
+    os.makedirs(out_folder, exist_ok=True)
+
+    names, stations = station_list(config)
+    print(f"[i]  Stations: {', '.join(names)}")
+    if reset:
+        for name in names:
+            storage.remove(station_file(out_folder, name))
+    processed = station_nights(out_folder, names)
+
+    progress_counter = mp.Manager().Value('i', 0)
+    lock = mp.Manager().Lock()
+    stime = time.time()
+    pbar = {"progress_counter": progress_counter, "lock": lock, "stime": stime}
+
+    args_list = []
+    for night in storage.era5_nights(era5_folder, '-ml-int'):
+        if night not in processed:
+            args_list.append((config, era5_folder, night, names, stations, pbar))
+
+    pbar['ntasks'] = len(args_list)
+    config['GENERAL']['NCPUS'] = str(max(1, int(mp.cpu_count()-2)))
+    print(f"[i]  CPUs used: {config.get('GENERAL','NCPUS')}")
+    print(f"[i]  Reset: {reset}, Number of measurements: {pbar['ntasks']}")
+
+    with mp.Pool(processes=config.getint("GENERAL","NCPUS")) as pool:
+        results = [ds_night for ds_night in pool.imap(extract_night, args_list) if ds_night is not None]
+    write_stations(out_folder, names, results, packed=config.getboolean("ERA5","PACKED",fallback=False))
+
+
+# ----------------------------------- SUBROUTINES ----------------------------------- #
+def station_list(config):
+    """Names and (lat, lon) of the stations: configured station (INSTRUMENT) and ERA5: STATIONS"""
+    names    = [config.get("GENERAL","INSTRUMENT")]
+    stations = [era5_processor.station_coords(config)]
+    for name, (lat, lon) in eval(config.get("ERA5","STATIONS",fallback="{}")).items():
+        if config.getboolean("ERA5","WESTERN_COORDS"):
+            lon = lon + 360
+        names.append(name)
+        stations.append((lat, lon))
+    return names, stations
+
+
+def station_file(out_folder, name):
+    return os.path.join(out_folder, "{}.nc".format(name.lower()))
+
+
+def station_nights(out_folder, names):
+    """Measurements contained in the datasets of all stations"""
+    nights = None
+    for name in names:
+        if not os.path.exists(station_file(out_folder, name)):
+            return set()
+        with storage.open_dataset(station_file(out_folder, name)) as ds_station:
+            nights = set(ds_station['night'].values) if nights is None else nights & set(ds_station['night'].values)
+    return nights if nights is not None else set()
+
+
+def extract_night(args):
+    """Columns and T' of all stations for one measurement -> dataset (station, night, step, level), None if not available"""
+    config, era5_folder, night, names, stations, pbar = args
+    ds_night = None
+    ds = storage.open_era5(era5_folder, night, '-ml-int')
+    if ds is not None:
+        ds_stations = era5_processor.extract_stations(ds, stations, names,
+                                                      method=config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method),
+                                                      memory_budget=config.getfloat("ERA5","MEMORY_BUDGET",fallback=era5_processor.ml_memory_budget))
+        ds.close()
+        ds_stations = era5_processor.calculate_station_primes(ds_stations, TEMPORAL_CUTOFF, VERTICAL_CUTOFF)
+        ds_night = night_columns(ds_stations, night)
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def night_columns(ds_stations, night):
+    """Station columns of one measurement on the layout of the station datasets (time -> step, night added)"""
+    step = np.round((ds_stations['time'].values - ds_stations['time'].values[0]) / np.timedelta64(1, 'h')).astype(int)
+    ds_stations = ds_stations.assign_coords(step=('time', step)).swap_dims(time='step').reset_coords('time')
+    return ds_stations.expand_dims(night=[night]).set_coords('time')
+
+
+def write_stations(out_folder, names, results, packed=False):
+    """Extend the station datasets by the measurements of results (nights sorted, shorter nights padded with NaN)"""
+    if len(results) == 0:
+        return
+    ds_new = xr.concat(results, dim='night', join='outer')
+    for name in names:
+        path = station_file(out_folder, name)
+        ds_station = ds_new.sel(station=name)
+        ds_station = ds_station.assign({var: ds_station[var].astype('float32') for var in ds_station.data_vars})
+        if os.path.exists(path):
+            with storage.open_dataset(path) as ds_file:
+                ds_station = xr.concat([ds_file.load(), ds_station], dim='night', join='outer')
+        ds_station = ds_station.sortby('night')
+        for var in ds_station.variables:
+            ds_station[var].encoding = {}
+        storage.write_dataset(ds_station, path + '.tmp', profile='station-column', packed=packed)
+        os.replace(path + '.tmp', path) # complete datasets only
+
+
+if __name__ == '__main__':
+    """provide ini file as argument and pass it to function"""
+
+    """Example:
+        >> python3 extract_virtual_stations.py coral.ini
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    reset = False
+    if len(sys.argv) > 2:
+        if sys.argv[2].lower().capitalize() == "True":
+            reset = True
+    extract_virtual_stations(sys.argv[1], reset)
@@ -52,10 +52,10 @@ def butterworth_filter_and_interp(data, z=None, highcut=1/20, fs=1/0.1, order=5)
 
 def butterworth_filter(data, cutoff=1/15, fs=1/0.1, order=5, mode='low'):
     """butterworth filter applied to matrix or each column seperately
-        - uses the signal.butter and signal.lfilter functions of the SCIPY library
+        - uses the signal.butter and signal.filtfilt functions of the SCIPY library
         - applies a BW filter based on the given order and cutoff frequency
     Input:
-        - 2D matrix
+        - 2D matrix (or stack of 2D matrices, e.g. noise realizations, with leading axes sharing the NaN pattern)
         - highcut frequency (1/wavelength) (1/Period)
         - fs (sampling frequency) -> 100m 
         - order of filter = 5
@@ -67,48 +67,14 @@ def butterworth_filter(data, cutoff=1/15, fs=1/0.1, order=5, mode='low'):
         b, a = butter_lowpass(cutoff, fs, order=order) 
         # print(b,a)
         # print("filter stable!", np.all(np.abs(np.roots(a))<1))
-
-        # - Filter each column (returns matrix with Nans at bottom and top) - #
-        bg = np.full(data.shape, np.NaN)
-        for col, column in enumerate(data):
-            mask = np.isnan(column) # dataarray
-            c_masked = column[~mask] # dataarray
-            if len(c_masked) >= 10:
-                c_mirrored = np.append(np.flip(c_masked, axis=0), c_masked, axis=0) # numpy array
-                c_filtered = signal.filtfilt(b,a,c_mirrored, axis=0)
-                # c_filtered = signal.lfilter(b,a,c_mirrored, axis=0)
-                # c_filtered = signal.filtfilt(b,a,c_masked, axis=0, padtype='odd') # 'even'
-                c_filtered = c_filtered[len(c_masked):]
-                column_bg = column.copy()
-                column_bg[~mask] = c_filtered
-                bg[col,:] = column_bg
-            else: # column of NANs is just passed through
-                bg[col,:] = column
+        bg = filter_columns(b, a, data)
         
         if mode=='low':
             pert = data - bg 
     
     if mode == 'high' or mode == 'both':
         b, a = butter_highpass(cutoff, fs, order=order) 
-        # print(b,a)
-        # print("filter stable!", np.all(np.abs(np.roots(a))<1))
-
-        # - Filter each column (returns matrix with Nans at bottom and top) - #
-        pert = np.full(data.shape, np.NaN)
-        for col, column in enumerate(data):
-            mask = np.isnan(column) # dataarray
-            c_masked = column[~mask] # dataarray
-            if len(c_masked) >= 10:
-                c_mirrored = np.append(np.flip(c_masked, axis=0), c_masked, axis=0) # numpy array
-                c_filtered = signal.filtfilt(b,a,c_mirrored, axis=0)
-                # c_filtered = signal.lfilter(b,a,c_mirrored, axis=0)
-                # c_filtered = signal.filtfilt(b,a,c_masked, axis=0, padtype='odd') # 'even'
-                c_filtered = c_filtered[len(c_masked):]
-                column_pert = column.copy()
-                column_pert[~mask] = c_filtered
-                pert[col,:] = column_pert
-            else: # column of NANs is just passed through
-                pert[col,:] = column
+        pert = filter_columns(b, a, data)
 
         if mode=='high':
             bg = data - pert
@@ -116,6 +82,34 @@ def butterworth_filter(data, cutoff=1/15, fs=1/0.1, order=5, mode='low'):
     return pert, bg
 
 
+def filter_columns(b, a, data):
+    """Apply filter coefficients to each column (last axis) of data, skipping NaNs
+        - columns are mirrored and filtered forward and backward (filtfilt)
+        - columns with the same NaN pattern are filtered in one call (all leading axes at once)
+        - leading axes have to share the NaN pattern of the first 2D matrix
+        - columns with less than 10 values are passed through (e.g. column of NaNs)
+    """
+    data = np.asarray(data, dtype=float)
+    out  = data.copy()
+
+    masks = ~np.isnan(data[(0,)*(data.ndim-2)]) # (columns, samples)
+    patterns, inverse = np.unique(masks, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    for k, valid in enumerate(patterns):
+        n_valid = np.count_nonzero(valid)
+        if n_valid < 10:
+            continue
+        cols = np.flatnonzero(inverse == k)
+        idx  = np.flatnonzero(valid)
+        c_masked   = data[..., cols, :][..., idx]
+        c_mirrored = np.concatenate((np.flip(c_masked, axis=-1), c_masked), axis=-1)
+        c_filtered = signal.filtfilt(b, a, c_mirrored, axis=-1)
+        # c_filtered = signal.filtfilt(b,a,c_masked, axis=-1, padtype='odd') # 'even'
+        out[..., cols[:,np.newaxis], idx[np.newaxis,:]] = c_filtered[..., n_valid:]
+
+    return out
+
+
 def interp_elev_to_z(data,elev,z):
     "2D Berg fuer xz Schnitt y level egal, fuer 3D Berg wichtig!"
     # old_shape = np.shape(data)
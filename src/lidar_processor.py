@@ -5,18 +5,37 @@
 # GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
 ################################################################################
 
+import os
+import glob
 import datetime
 import numpy as np
 import pandas as pd
 import xarray as xr
 from tqdm import tqdm
 
-import filter
+import filter, era5_processor
+
+"""Constants"""
+g  = 9.80665 # m s^-2
+cp = 1004.64 # J kg^-1 K^-1
 
 """Config"""
 reference_hour  = 15 # 15 for CORAL
 fixed_timeframe = 24 # h
 
+"""Quality control (defaults if [QC] is missing in config)"""
+qc_err_max      = 15   # K (absolute temperature_err)
+qc_rel_err_max  = 0.05 # temperature_err / temperature
+qc_top_min_alt  = 30   # km (top cut only triggered above this altitude)
+qc_spike_window = 5    # bins (rolling median along altitude)
+qc_spike_max    = 20   # K (deviation from rolling median)
+
+# - Bit flags of qc_flags - #
+QC_ERR     = 1 # temperature_err > QC ERR_MAX
+QC_REL_ERR = 2 # temperature_err / temperature > QC REL_ERR_MAX
+QC_TOP     = 4 # above first noisy bin of profile (top cut)
+QC_SPIKE   = 8 # |T - rolling median| > QC SPIKE_MAX
+
 def open_and_decode_lidar_measurement(obs: str):
     """Open and decode time of NC-file (lidar obs)"""
 
@@ -85,11 +104,44 @@ def open_and_decode_lidar_measurement(obs: str):
     return ds
 
 
-def process_lidar_measurement(config: dict, ds: object):
-    """Process lidar measurement (time decoding, altitude for plots, filter,...)"""
+def open_lidar_pair(config: dict, obs: str):
+    """Open and decode fine (RESOLUTION) and background (RESOLUTION_BG) product of the same night
+        - background file is matched by night (file_name[0:13]) in the folder of obs
+        - returns ds, ds_bg (ds_bg None if RESOLUTION_BG is not set or not available)
+    """
+
+    ds = open_and_decode_lidar_measurement(obs)
+    if ds is None:
+        return None, None
+
+    ds_bg = None
+    if config.get("GENERAL", "RESOLUTION_BG", fallback="NONE") != "NONE":
+        folder, file_name = os.path.split(obs)
+        bg_files = sorted(glob.glob(os.path.join(folder, file_name[0:13] + config.get("GENERAL","RESOLUTION_BG"))))
+        if len(bg_files) > 0:
+            ds_bg = open_and_decode_lidar_measurement(bg_files[0])
+    return ds, ds_bg
+
+
+def process_lidar_pair(config: dict, ds: object, ds_bg: object):
+    """Process fine and background product with one timeframe (the one of the fine product)"""
+
+    ds = process_lidar_measurement(config, ds)
+    if ds_bg is not None:
+        ds_bg = process_lidar_measurement(config, ds_bg, timeframe=(ds['date_startp'].values, ds['date_endp'].values))
+    return ds, ds_bg
+
+
+def process_lidar_measurement(config: dict, ds: object, timeframe=None):
+    """Process lidar measurement (time decoding, altitude for plots, filter,...)
+        - timeframe (date_startp, date_endp) of another product of the night can be reused
+    """
 
     """Define timeframe for plot"""
-    if config.get("GENERAL","TIMEFRAME_NIGHT") != "NONE":
+    if timeframe is not None:
+        ds['date_startp'] = timeframe[0]
+        ds['date_endp']   = timeframe[1]
+    elif config.get("GENERAL","TIMEFRAME_NIGHT") != "NONE":
         timeframe = eval(config.get("GENERAL", "TIMEFRAME_NIGHT"))
         if timeframe[1] < timeframe[0]:
             fixed_intervall = timeframe[1] + 24 - timeframe[0]
@@ -133,6 +185,45 @@ def process_lidar_measurement(config: dict, ds: object):
     ds.attrs['vres'] = (ds['alt_plot'][1]-ds['alt_plot'][0]).values # in km
     ds.attrs['tres'] = (ds['time'][1]-ds['time'][0]).values.astype("timedelta64[m]").astype('int') # in minutes
 
+    """Quality control (mask noisy bins before filtering)"""
+    if config.getboolean("QC", "ENABLED", fallback=True):
+        ds = quality_control(config, ds)
+
+    return ds
+
+
+def quality_control(config, ds):
+    """Flag noisy bins of the whole time-height array (qc_flags) and mask them in temperature and temperature_err"""
+
+    err_max      = config.getfloat("QC", "ERR_MAX", fallback=qc_err_max)
+    rel_err_max  = config.getfloat("QC", "REL_ERR_MAX", fallback=qc_rel_err_max)
+    top_min_alt  = config.getfloat("QC", "TOP_MIN_ALT", fallback=qc_top_min_alt)
+    spike_window = config.getint("QC", "SPIKE_WINDOW", fallback=qc_spike_window)
+    spike_max    = config.getfloat("QC", "SPIKE_MAX", fallback=qc_spike_max)
+
+    temp = ds.temperature.values
+    err  = ds.temperature_err.values
+    flags = np.zeros(temp.shape, dtype=np.uint8)
+
+    # - Error thresholds (NaN comparisons are False) - #
+    flags[err > err_max] |= QC_ERR
+    flags[err / temp > rel_err_max] |= QC_REL_ERR
+
+    # - Top cut: everything above the first noisy bin (above TOP_MIN_ALT) of each profile - #
+    noisy = (flags != 0) & (ds.alt_plot.values >= top_min_alt)[np.newaxis,:]
+    flags[np.logical_or.accumulate(noisy, axis=1)] |= QC_TOP
+
+    # - Spikes: deviation from rolling median along altitude - #
+    median = ds.temperature.rolling(altitude=spike_window, center=True, min_periods=spike_window//2+1).median().values
+    flags[np.abs(temp - median) > spike_max] |= QC_SPIKE
+
+    ds['qc_flags'] = (ds.temperature.dims, flags)
+    ds['qc_flags'].attrs['flag_masks']    = [QC_ERR, QC_REL_ERR, QC_TOP, QC_SPIKE]
+    ds['qc_flags'].attrs['flag_meanings'] = 'err rel_err top_cut spike'
+
+    ds.temperature.values     = np.where(flags == 0, temp, np.nan)
+    ds.temperature_err.values = np.where(flags == 0, err, np.nan)
+
     return ds
 
 def calculate_primes(ds, temporal_cutoff, vertical_cutoff):
@@ -156,4 +247,85 @@ def calculate_primes(ds, temporal_cutoff, vertical_cutoff):
     # - Subtract nightly mean - #
     ds["tprime_nm"]  = (ds["temperature"]-ds["temperature"].mean(dim='time'))
 
-    return ds
\ No newline at end of file
+    return ds
+
+def calculate_primes_bg(ds, ds_bg):
+    """T' relative to the background product (T' = T - T_bg interpolated to the time of the fine product)
+        - T_bg is kept constant before the first and after the last background profile
+        - altitude is only interpolated if the grids differ (bins next to gaps are kept)
+    """
+
+    tbg = ds_bg["temperature"].assign_coords(altitude=ds_bg.alt_plot.values)
+    time = np.clip(ds.time.values, tbg.time.values[0], tbg.time.values[-1])
+    tbg = tbg.interp(time=time)
+    if not np.array_equal(ds_bg.alt_plot.values, ds.alt_plot.values):
+        tbg = tbg.interp(altitude=ds.alt_plot.values)
+    tbg = tbg.values
+
+    ds["tbg_bg"]    = (('t', 'z'), tbg)
+    ds["tprime_bg"] = (('t', 'z'), ds["temperature"].values - tbg)
+
+    return ds
+
+def calculate_primes_era5(ds, ds_era5):
+    """Residuals to ERA5 and T' relative to the ERA5 background (station column interpolated to the lidar grid)
+        - temperature_era5: ERA5 T, tres_era5 = T - T_ERA5
+        - tbg_era5: ERA5 T21 background (t - tprime), tprime_era5 = T - T_bg (only if tprime is in ds_era5)
+    """
+
+    vars = ['t', 'tprime'] if 'tprime' in ds_era5.data_vars else ['t']
+    era5 = era5_processor.interp_to_lidar_grid(ds_era5, ds.time.values, ds.alt_plot.values, vars)
+
+    ds["temperature_era5"] = (('t', 'z'), era5['t'])
+    ds["tres_era5"]        = (('t', 'z'), ds["temperature"].values - era5['t'])
+    if 'tprime' in era5:
+        ds["tbg_era5"]    = (('t', 'z'), era5['t'] - era5['tprime'])
+        ds["tprime_era5"] = (('t', 'z'), ds["temperature"].values - ds["tbg_era5"].values)
+
+    return ds
+
+def calculate_prime_uncertainty(ds, temporal_cutoff, vertical_cutoff, n_samples=200, seed=None):
+    """Monte Carlo propagation of temperature_err through the vertical and temporal BW filter
+        - n_samples noise realizations are stacked along a new axis and filtered in one call
+        - returns standard deviation of T' per bin (tprime_vbwf_std, tprime_tbwf_std)
+    """
+
+    rng  = np.random.default_rng(seed)
+    temp = ds["temperature"].values
+    err  = np.nan_to_num(ds["temperature_err"].values) # missing error -> no noise
+    temp_mc = temp[np.newaxis,:,:] + err[np.newaxis,:,:] * rng.standard_normal((n_samples,) + temp.shape)
+
+    # - Vertical BW filter - #
+    tprime_vbwf, tbg_vbwf = filter.butterworth_filter(temp_mc, cutoff=1/vertical_cutoff, fs=1/ds.vres, order=5, mode='high')
+    ds["tprime_vbwf_std"] = (('t', 'z'), np.std(tprime_vbwf, axis=0))
+    del tprime_vbwf, tbg_vbwf
+
+    # - Temporal BW filter (Interpolate data gaps and remove again later) - #
+    temp_mc = xr.DataArray(temp_mc, dims=('sample',) + ds.temperature.dims, coords={'time': ds.time})
+    temp_mc = temp_mc.interpolate_na(dim='time', method='linear', limit=None, use_coordinate='time', max_gap=None)
+    tprime_tbwf, tbg_tbwf = filter.butterworth_filter(np.swapaxes(temp_mc.values, 1, 2), cutoff=1/temporal_cutoff, fs=1/ds.tres, order=5, mode='high')
+    tprime_tbwf_std = np.std(tprime_tbwf, axis=0).T
+    ds["tprime_tbwf_std"] = (('t', 'z'), np.where(~np.isnan(temp), tprime_tbwf_std, np.nan))
+
+    ds["tprime_vbwf_std"].attrs['n_samples'] = n_samples
+    ds["tprime_tbwf_std"].attrs['n_samples'] = n_samples
+
+    return ds
+
+
+def calculate_energy(ds):
+    """Brunt-Vaisala frequency (N2) from lidar background and potential energy density Ep = 1/2 (g/N)^2 (T'/T_bg)^2 (J/kg)"""
+
+    for filt in ['vbwf', 'tbwf']:
+        tbg    = ds["tbg_" + filt].values
+        tprime = ds["tprime_" + filt].values
+
+        # - N2 from vertical gradient of background temperature - #
+        dtdz = np.gradient(tbg, ds.vres * 1000, axis=1) # K/m
+        n2   = g / tbg * (dtdz + g / cp)
+        n2   = np.where(n2 > 0, n2, np.nan) # no Ep for unstable or neutral background
+
+        ds["N2_" + filt]   = (('t', 'z'), n2)
+        ds["epot_" + filt] = (('t', 'z'), 0.5 * g**2 / n2 * (tprime / tbg)**2)
+
+    return ds
@@ -0,0 +1,246 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import sys
+import glob
+import configparser
+import multiprocessing as mp
+import time
+
+import numpy as np
+import xarray as xr
+
+import warnings
+warnings.simplefilter("ignore", RuntimeWarning)
+
+import plt_helper
+from process_lidar_data import load_measurement
+
+"""Config"""
+PYRAMID_VARS   = ['temperature', 'tprime_vbwf']
+PYRAMID_LEVELS = 8  # level l: tiles of 2^l time steps (level 7: 32 h at 15 min)
+ALT_MAX_LEVEL  = 3  # altitude coarsening by 2^min(l, ALT_MAX_LEVEL)
+PYRAMID_FLUSH  = 30 # nights buffered before partitions are written
+epoch = np.datetime64('1970-01-01T00:00:00', 'ns')
+
+"""Level-of-detail pyramid (time x altitude tiles with sum/count/min/max, partitioned by level and month of tile start)
+    - each partition lists the nights it contains (night coordinate), nights.txt lists the nights of all partitions
+"""
+
+
+def update_pyramid(CONFIG_FILE, reset):
+    """Add new measurements to the level-of-detail pyramid of the instrument"""
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+
+    if config.get("INPUT","OBS_FILE") == "NONE":
+        obs_list = sorted(glob.glob(os.path.join(config.get("INPUT","OBS_FOLDER") , config.get("GENERAL","RESOLUTION"))))
+    else:
+        obs_list = [os.path.join(config.get("INPUT","OBS_FOLDER"), config.get("INPUT","OBS_FILE"))]
+
+    folder = pyramid_folder(config)
+    if reset:
+        for partition in glob.glob(os.path.join(folder, "*.nc")) + glob.glob(os.path.join(folder, "*.tmp")) + glob.glob(os.path.join(folder, "nights.txt")):
+            os.remove(partition)
+    os.makedirs(folder, exist_ok=True)
+    nights_file = os.path.join(folder, "nights.txt")
+    processed = []
+    if os.path.exists(nights_file):
+        with open(nights_file) as f:
+            processed = f.read().split()
+
+    progress_counter = mp.Manager().Value('i', 0)
+    lock = mp.Manager().Lock()
+    stime = time.time()
+    pbar = {"progress_counter": progress_counter, "lock": lock, "stime": stime}
+
+    args_list = [(config, obs, pbar) for obs in obs_list if os.path.split(obs)[-1][0:13] not in processed]
+    pbar['ntasks'] = len(args_list)
+    config['GENERAL']['NCPUS'] = str(max(1, int(mp.cpu_count()-2)))
+    print(f"[i]  CPUs used: {config.get('GENERAL','NCPUS')}")
+    print(f"[i]  Reset: {reset}, Number of new measurements: {pbar['ntasks']}")
+
+    # - Measurements are sorted by date, so buffered partitions are mostly complete when written - #
+    buffer, nights = {}, []
+    with mp.Pool(processes=config.getint("GENERAL","NCPUS")) as pool:
+        for night, tiles in pool.imap(night_tiles, args_list):
+            if tiles is None:
+                continue
+            for partition, ds_tiles in tiles.items():
+                buffer.setdefault(partition, []).append((night, ds_tiles))
+            nights.append(night)
+            if len(nights) >= PYRAMID_FLUSH:
+                flush_partitions(folder, buffer, nights)
+                buffer, nights = {}, []
+    flush_partitions(folder, buffer, nights)
+
+
+# ----------------------------------- SUBROUTINES ----------------------------------- #
+def pyramid_folder(config):
+    """Pyramid is stored next to the measurements (INPUT: PYRAMID_FOLDER, default OBS_FOLDER/pyramid)"""
+    return config.get("INPUT", "PYRAMID_FOLDER", fallback=os.path.join(config.get("INPUT","OBS_FOLDER"), "pyramid"))
+
+
+def night_tiles(args):
+    """Tiles of one measurement for all levels -> {(level, month): dataset}"""
+    config, obs, pbar = args
+    night = os.path.split(obs)[-1][0:13]
+    ds = load_measurement(config, obs)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return night, None
+
+    tres = int(ds.tres)
+    vres = float(ds.vres)
+    i = ((ds.time.values - epoch) // np.timedelta64(tres, 'm')).astype(np.int64)
+    j = np.round(ds.alt_plot.values / vres).astype(np.int64)
+
+    tiles = {}
+    for level in range(PYRAMID_LEVELS):
+        uti, ti = np.unique(i >> level, return_inverse=True)
+        uzj, zj = np.unique(j >> min(level, ALT_MAX_LEVEL), return_inverse=True)
+        flat = (ti.reshape(-1)[:,np.newaxis] * len(uzj) + zj.reshape(-1)[np.newaxis,:])
+        n    = len(uti) * len(uzj)
+
+        vars = {}
+        for var in PYRAMID_VARS:
+            values = ds[var].values
+            valid  = ~np.isnan(values)
+            count  = np.bincount(flat[valid], minlength=n)
+            vmin   = np.full(n, np.inf)
+            vmax   = np.full(n, -np.inf)
+            np.minimum.at(vmin, flat[valid], values[valid])
+            np.maximum.at(vmax, flat[valid], values[valid])
+            vars[var + '_sum']   = np.bincount(flat[valid], weights=values[valid], minlength=n)
+            vars[var + '_count'] = count.astype(np.int32)
+            vars[var + '_min']   = np.where(count > 0, vmin, np.nan).astype(np.float32)
+            vars[var + '_max']   = np.where(count > 0, vmax, np.nan).astype(np.float32)
+        ds_level = xr.Dataset({var: (('time_tile', 'alt_tile'), values.reshape(len(uti), len(uzj))) for var, values in vars.items()},
+                              coords={'time_tile': uti, 'alt_tile': uzj},
+                              attrs={'level': level, 'tres': tres, 'vres': vres})
+
+        # - Partition by month of tile start - #
+        months = tile_times(uti, level, tres).astype('datetime64[M]')
+        for month in np.unique(months):
+            tiles[(level, str(month))] = ds_level.isel(time_tile=(months == month))
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return night, tiles
+
+
+def tile_times(time_tile, level, tres):
+    """Start time of tiles"""
+    return epoch + np.asarray(time_tile) * (2**level) * np.timedelta64(int(tres), 'm')
+
+
+def combine_tiles(ds_a, ds_b):
+    """Combine tiles of two datasets (sum/count added, min/max of both)"""
+    ds_a, ds_b = xr.align(ds_a, ds_b, join='outer')
+    ds = xr.Dataset(attrs=ds_a.attrs)
+    for var in PYRAMID_VARS:
+        ds[var + '_sum']   = ds_a[var + '_sum'].fillna(0) + ds_b[var + '_sum'].fillna(0)
+        ds[var + '_count'] = (ds_a[var + '_count'].fillna(0) + ds_b[var + '_count'].fillna(0)).astype(np.int32)
+        ds[var + '_min']   = np.fmin(ds_a[var + '_min'], ds_b[var + '_min'])
+        ds[var + '_max']   = np.fmax(ds_a[var + '_max'], ds_b[var + '_max'])
+    return ds
+
+
+def partition_file(folder, level, month):
+    return os.path.join(folder, "L{}-{}.nc".format(level, month))
+
+
+def flush_partitions(folder, buffer, nights):
+    """Merge buffered tiles into partition files and record nights
+        - tiles of a night already in a partition are skipped (no double counting after an interrupted flush)
+        - partitions are replaced by renaming a complete temporary file, nights.txt is written last
+    """
+    for (level, month), tiles_list in buffer.items():
+        path = partition_file(folder, level, month)
+        ds_partition, partition_nights = None, []
+        if os.path.exists(path):
+            with xr.open_dataset(path) as ds_file:
+                ds_partition = ds_file.load()
+            if 'night' in ds_partition.coords:
+                partition_nights = list(ds_partition['night'].values)
+                ds_partition = ds_partition.drop_vars('night')
+        for night, ds_tiles in tiles_list:
+            if night in partition_nights:
+                continue
+            ds_partition = ds_tiles if ds_partition is None else combine_tiles(ds_partition, ds_tiles)
+            partition_nights.append(night)
+        ds_partition.sortby('time_tile').assign_coords(night=partition_nights).to_netcdf(path + '.tmp')
+        os.replace(path + '.tmp', path)
+    with open(os.path.join(folder, "nights.txt"), 'a') as f:
+        for night in nights:
+            f.write(night + "\n")
+
+
+def select_level(tres, start, end, width_px):
+    """Coarsest detail needed: lowest level with not more time tiles than pixels"""
+    n_steps = (np.datetime64(end) - np.datetime64(start)) / np.timedelta64(int(tres), 'm')
+    for level in range(PYRAMID_LEVELS):
+        if n_steps / 2**level <= width_px:
+            return level
+    return PYRAMID_LEVELS - 1
+
+
+def read_level(config, level, start, end):
+    """Dense time-height grid (mean, min, max of PYRAMID_VARS) of one level between start and end"""
+    folder = pyramid_folder(config)
+    start  = np.datetime64(start, 'ns')
+    end    = np.datetime64(end, 'ns')
+    months = np.arange((start - np.timedelta64(2, 'D')).astype('datetime64[M]'), end.astype('datetime64[M]') + 1)
+
+    ds_level = None
+    for month in months:
+        path = partition_file(folder, level, str(month))
+        if os.path.exists(path):
+            with xr.open_dataset(path) as ds_file:
+                ds_file = ds_file.drop_vars('night', errors='ignore').load()
+            ds_level = ds_file if ds_level is None else combine_tiles(ds_level, ds_file)
+    if ds_level is None:
+        return None
+
+    tres = ds_level.attrs['tres']
+    vres = ds_level.attrs['vres']
+    step = (2**level) * np.timedelta64(int(tres), 'm').astype('timedelta64[ns]') # tile centres not truncated to minutes
+    time_tiles = np.arange((start - epoch) // step, (end - epoch) // step + 1)
+    ds_level = ds_level.reindex(time_tile=time_tiles)
+
+    ds = xr.Dataset(coords={'time': tile_times(time_tiles, level, tres) + step / 2,
+                            'alt' : (ds_level['alt_tile'].values + 0.5) * 2**min(level, ALT_MAX_LEVEL) * vres - vres / 2})
+    for var in PYRAMID_VARS:
+        count = ds_level[var + '_count'].values
+        ds[var]          = (('time', 'alt'), np.where(count > 0, ds_level[var + '_sum'].values / np.where(count > 0, count, 1), np.nan))
+        ds[var + '_min'] = (('time', 'alt'), ds_level[var + '_min'].values)
+        ds[var + '_max'] = (('time', 'alt'), ds_level[var + '_max'].values)
+    ds.attrs['level'] = level
+    return ds
+
+
+if __name__ == '__main__':
+    """provide ini file as argument and pass it to function"""
+
+    """Example:
+        >> python3 lidar_pyramid.py coral.ini
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    reset = False
+    if len(sys.argv) > 2:
+        if sys.argv[2].lower().capitalize() == "True":
+            reset = True
+    update_pyramid(sys.argv[1], reset)
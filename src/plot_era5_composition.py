@@ -31,7 +31,7 @@ warnings.simplefilter("ignore", RuntimeWarning)
 warnings.filterwarnings('ignore', category=UserWarning, module='imageio_ffmpeg')
 logging.getLogger('imageio_ffmpeg').setLevel(logging.ERROR)
 
-import filter, cmaps, era5_processor, lidar_processor, plt_helper
+import filter, cmaps, era5_cache, era5_processor, lidar_processor, plt_helper, storage
 from plot_era5_tropopause_composition import plot_era5_tropopause_composition
 from plot_era5_jet_pvu_composition import plot_era5_jet_pvu_composition
 from plot_era5_jet_composition import plot_era5_jet_composition
@@ -41,6 +41,7 @@ plt.style.use('latex_default.mplstyle')
 """Config"""
 VERTICAL_CUTOFF = 15 # km (LAMBDA_CUT)
 TEMPORAL_CUTOFF = 8*60 # min (TAU_CUT)
+JET_SECTION_SOUTH = 5 # deg, second vertical cross section of the jet compositions (LAT - 5)
 PVU_z_levels = [3,4,5,6,7,8,9,10,11,12,13]
 saamer_file_path = "/export/data/SAAMER/SAAMER_Hindley22_version_2018.nc"
 
@@ -60,8 +61,7 @@ def prepare_era5_composition(config_file, content, reset):
     
     config["INPUT"]["ERA5-FOLDER"] = os.path.join(config.get("OUTPUT","FOLDER"),"era5-region")
     os.makedirs(config.get("INPUT","ERA5-FOLDER"), exist_ok=True)
-    era5_region_list = sorted(glob.glob(os.path.join(config.get("INPUT","ERA5-FOLDER"),"*pvu.nc")))
-    era5_region_list = [path.split("/")[-1] for path in era5_region_list]
+    era5_region_list = storage.era5_nights(config.get("INPUT","ERA5-FOLDER"), "-pvu") # per-night or monthly files
 
     config["GENERAL"]["CONTENT"] = content
     if reset:
@@ -80,7 +80,7 @@ def prepare_era5_composition(config_file, content, reset):
     for obs in obs_list:
         filename = os.path.split(obs)[-1][0:13]
         """Check if ERA5 data exists"""
-        if filename + "-pvu.nc" not in era5_region_list:
+        if filename not in era5_region_list:
             continue
 
         """Check if animation already exists"""
@@ -155,21 +155,19 @@ def plot_era5_composition(config, obs, pbar):
     animation_path = os.path.join(config.get("OUTPUT","FOLDER"), config.get("GENERAL","CONTENT"), animation_name)
 
     """Process lidar data and load ERA5 data for plot"""
-    era5_files_name = os.path.join(config["INPUT"]["ERA5-FOLDER"], file_name[0:13])
-    if not os.path.exists(era5_files_name + '-ml-int.nc'):
+    ds_ml   = storage.open_era5(config["INPUT"]["ERA5-FOLDER"], file_name[0:13], '-ml-int')
+    ds_pv   = storage.open_era5(config["INPUT"]["ERA5-FOLDER"], file_name[0:13], '-pl')
+    ds_2pvu = storage.open_era5(config["INPUT"]["ERA5-FOLDER"], file_name[0:13], '-pvu')
+    if ds_ml is None:
         print(f"[i]  Missing ERA5 data for measurement {file_name}")
-    elif not os.path.exists(era5_files_name + '-pl.nc'):
+    elif ds_pv is None:
         print(f"[i]  Missing ERA5 data for measurement {file_name}")
-    elif not os.path.exists(era5_files_name + '-pvu.nc'):
+    elif ds_2pvu is None:
         print(f"[i]  Missing ERA5 PVU data for measurement {file_name}")
     else:
         ds      = lidar_processor.process_lidar_measurement(config, ds)
         ds      = lidar_processor.calculate_primes(ds, TEMPORAL_CUTOFF, VERTICAL_CUTOFF)
-        ds_ml   = xr.open_dataset(era5_files_name + '-ml-int.nc')
-        ds_pv   = xr.open_dataset(era5_files_name + '-pl.nc')
-        ds_2pvu = xr.open_dataset(era5_files_name + '-pvu.nc')
-        ds_ml,ds_pv,ds_2pvu = era5_processor.processing_data_for_jetexit_comp(config,ds_ml,ds_pv,ds_2pvu)
-        preprocessed_vars = vlidar_and_latlon_slices(config,ds_ml,ds_pv)
+        ds_ml,ds_pv,ds_2pvu,preprocessed_vars = prepare_composition_data(config,file_name[0:13],ds_ml,ds_pv,ds_2pvu)
 
         if config.get("GENERAL","CONTENT") == "era5-tropo":
             print("plotting")
@@ -233,8 +231,29 @@ def plot_era5_composition(config, obs, pbar):
 
 
 # ----------------------------------- SUBROUTINES ----------------------------------- #
-def vlidar_and_latlon_slices(config,ds_ml,ds_pv):
-    """Filtering virtual lidar data (vlidar) and averaging lat lon bands or using slices of data"""
+def prepare_composition_data(config,night,ds_ml,ds_pv,ds_2pvu):
+    """Plot coordinates and slices of the composition, slices from the cache if ERA5 inputs and config did not change
+        - the draw path reads only slices, so re-rendering with other styling skips all ERA5 computation
+        - derived fields (th, N2, u_horiz) are computed on a cache miss only"""
+    settings = {'TEMPORAL_CUTOFF': TEMPORAL_CUTOFF, 'VERTICAL_CUTOFF': VERTICAL_CUTOFF, 'JET_SECTION_SOUTH': JET_SECTION_SOUTH}
+    key = era5_cache.cache_key(config, config["INPUT"]["ERA5-FOLDER"], night, settings)
+    ds_ml,ds_pv,ds_2pvu = era5_processor.plot_coordinates(config,ds_ml,ds_pv,ds_2pvu)
+    preprocessed_vars = era5_cache.load(config, night, key)
+    if preprocessed_vars is not None:
+        return ds_ml,ds_pv,ds_2pvu,preprocessed_vars
+
+    ds_ml = era5_processor.derived_fields(ds_ml)
+    ds_station = storage.open_era5(config["INPUT"]["ERA5-FOLDER"], night, '-ml-station') # None: column of ds_ml
+    preprocessed_vars = vlidar_and_latlon_slices(config,ds_ml,ds_pv,ds_station)
+    if ds_station is not None:
+        ds_station.close()
+    era5_cache.store(config, night, key, preprocessed_vars)
+    return ds_ml,ds_pv,ds_2pvu,preprocessed_vars
+
+
+def vlidar_and_latlon_slices(config,ds_ml,ds_pv,ds_station=None):
+    """Filtering virtual lidar data (vlidar) and averaging lat lon bands or using slices of data
+        - ds_station: station column sidecar (-ml-station) for the virtual lidar, default: column of ds_ml"""
     
     vars = {}
     lat = config.getfloat("ERA5","LAT")
@@ -247,18 +266,23 @@ def vlidar_and_latlon_slices(config,ds_ml,ds_pv):
     lon_avg = eval(config.get("ERA5","LON_AVG"))
     g = config.getfloat("ERA5","g")
 
-    vars["th_lon_z"] = ds_ml['th'].sel(latitude=lat)          ## ds['th'].sel(latitude =slice(lat_range[0],lat_range[1])).mean(axis=2)
-    vars["th_lat_z"] = ds_ml['th'].sel(longitude=lon_eastern) ## ds['th'].sel(longitude=slice(lon_range[0],lon_range[1])).mean(axis=3)
+    vars["th_lon_z"] = era5_processor.interp_slice(ds_ml['th'],'latitude',lat)          ## ds['th'].sel(latitude =slice(lat_range[0],lat_range[1])).mean(axis=2)
+    vars["th_lat_z"] = era5_processor.interp_slice(ds_ml['th'],'longitude',lon_eastern) ## ds['th'].sel(longitude=slice(lon_range[0],lon_range[1])).mean(axis=3)
 
-    vars["n2_lon_z"] = ds_ml['N2'].sel(latitude=lat)*10**4          ## ds_ml['N2'].sel(latitude =slice(lat_avg[0],lat_avg[1])).mean(axis=2)
-    vars["n2_lat_z"] = ds_ml['N2'].sel(longitude=lon_eastern)*10**4 ## ds_ml['N2'].sel(longitude=slice(lon_avg[0],lon_avg[1])).mean(axis=3)
+    vars["n2_lon_z"] = era5_processor.interp_slice(ds_ml['N2'],'latitude',lat)*10**4          ## ds_ml['N2'].sel(latitude =slice(lat_avg[0],lat_avg[1])).mean(axis=2)
+    vars["n2_lat_z"] = era5_processor.interp_slice(ds_ml['N2'],'longitude',lon_eastern)*10**4 ## ds_ml['N2'].sel(longitude=slice(lon_avg[0],lon_avg[1])).mean(axis=3)
 
     #v_lon_z = ds_ml['v'].sel(latitude =slice(lat_range[0],lat_range[1])).mean(axis=2).copy()
     #u_lat_z = ds_ml['u'].sel(longitude=slice(lon_range[0],lon_range[1])).mean(axis=3).copy()
-    vars["v_lon_z"]  = ds_ml['v'].sel(latitude=lat)
-    vars["u_lat_z"]  = ds_ml['u'].sel(longitude=lon_eastern)
-    vars["UV_lon_z"] = (ds_ml['u'].sel(latitude=lat)**2 + ds_ml['v'].sel(latitude=lat)**2)**(1/2)
-    vars["UV_lat_z"] = (ds_ml['u'].sel(longitude=lon_eastern)**2 + ds_ml['v'].sel(longitude=lon_eastern)**2)**(1/2)
+    vars["v_lon_z"]  = era5_processor.interp_slice(ds_ml['v'],'latitude',lat)
+    vars["u_lat_z"]  = era5_processor.interp_slice(ds_ml['u'],'longitude',lon_eastern)
+    vars["UV_lon_z"] = (era5_processor.interp_slice(ds_ml['u'],'latitude',lat)**2 + era5_processor.interp_slice(ds_ml['v'],'latitude',lat)**2)**(1/2)
+    vars["UV_lat_z"] = (era5_processor.interp_slice(ds_ml['u'],'longitude',lon_eastern)**2 + era5_processor.interp_slice(ds_ml['v'],'longitude',lon_eastern)**2)**(1/2)
+
+    # - Vertical cross sections of the jet compositions (LAT and LAT - JET_SECTION_SOUTH) - #
+    vars["th_lon_z_south"] = era5_processor.interp_slice(ds_ml['th'],'latitude',lat-JET_SECTION_SOUTH)
+    vars["uh_lon_z"]       = era5_processor.interp_slice(ds_ml['u_horiz'],'latitude',lat)
+    vars["uh_lon_z_south"] = era5_processor.interp_slice(ds_ml['u_horiz'],'latitude',lat-JET_SECTION_SOUTH)
 
     # - Rolling mean - #
     # tmp_mean = ds['t'].rolling(longitude=90, center = True).mean(dim='longitude')
@@ -282,10 +306,13 @@ def vlidar_and_latlon_slices(config,ds_ml,ds_pv):
     vars["zpv_lat_z"] = ds_pv['z'].sel(longitude=slice(lon_avg[0],lon_avg[1])).mean(axis=3) / (g*1000) 
 
     """Virtual lidar data"""
-    vres = (ds_ml['level'].values[1]-ds_ml['level'].values[0]) / 1000 # km
+    if ds_station is None:
+        ds_station = era5_processor.interp_station(ds_ml[['t','tprime']], (lat,lon_eastern),
+                                                   config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
+    vres = (ds_station['level'].values[1]-ds_station['level'].values[0]) / 1000 # km
     tres = 60 # min 
-    vars["t_vlidar"]           = ds_ml['t'].sel(latitude=lat,longitude=lon_eastern).values.T.copy()
-    vars["tprime_T21"]         = ds_ml['tprime'].sel(latitude=lat,longitude=lon_eastern).values.T.copy()
+    vars["t_vlidar"]           = ds_station['t'].values.T.copy()
+    vars["tprime_T21"]         = ds_station['tprime'].values.T.copy()
     vars["tprime_vlidar_tbwf"], tbg_BW = filter.butterworth_filter(vars["t_vlidar"], cutoff=1/TEMPORAL_CUTOFF, fs=1/tres, order=5, mode='both')
     tprime_vlidar_vbwf, tbg_BW = filter.butterworth_filter(vars["t_vlidar"].T, cutoff=1/VERTICAL_CUTOFF, fs=1/vres, order=5, mode='both')
     vars["tprime_vlidar_vbwf"] = tprime_vlidar_vbwf.T
@@ -145,10 +145,12 @@ def plot_era5_jet_composition(config, vars, ds, ds_ml, ds_pv, ds_2pvu, ds_saamer
     csaameru = 'darkslateblue'
     csaamerv = 'violet'
 
-    ax_wind.plot(np.mean(ds_ml['u'].sel(latitude=lat,longitude=lon_eastern),axis=0),ds_ml['level']/1000,lw=lw_medium,ls='--', color=cwindu)
-    ax_wind.plot(np.mean(ds_ml['v'].sel(latitude=lat,longitude=lon_eastern),axis=0),ds_ml['level']/1000,lw=lw_medium,ls='--', color=cwindv)
-    era5u = ax_wind.plot(ds_ml['u'].sel(latitude=lat,longitude=lon_eastern)[t],ds_ml['level']/1000,lw=lw_thick,color=cwindu, label="ERA5 u")
-    era5v = ax_wind.plot(ds_ml['v'].sel(latitude=lat,longitude=lon_eastern)[t],ds_ml['level']/1000,lw=lw_thick,color=cwindv, label="ERA5 v")
+    wind_station = era5_processor.interp_station(ds_ml[['u','v']], (lat,lon_eastern),
+                                                 config.get("ERA5","STATION_INTERP",fallback=era5_processor.station_method))
+    ax_wind.plot(np.mean(wind_station['u'],axis=0),ds_ml['level']/1000,lw=lw_medium,ls='--', color=cwindu)
+    ax_wind.plot(np.mean(wind_station['v'],axis=0),ds_ml['level']/1000,lw=lw_medium,ls='--', color=cwindv)
+    era5u = ax_wind.plot(wind_station['u'][t],ds_ml['level']/1000,lw=lw_thick,color=cwindu, label="ERA5 u")
+    era5v = ax_wind.plot(wind_station['v'][t],ds_ml['level']/1000,lw=lw_thick,color=cwindv, label="ERA5 v")
     if ds_saamer is not None:
         saameru = ax_wind.plot(ds_saamer['zonal_wind'][:,t],ds_saamer['altitude'],lw=lw_thick,color=csaameru, label="SAAMER u")
         saamerv = ax_wind.plot(ds_saamer['meridional_wind'][:,t],ds_saamer['altitude'],lw=lw_thick,color=csaamerv, label="SAAMER v")
@@ -227,7 +229,7 @@ def plot_era5_jet_composition(config, vars, ds, ds_ml, ds_pv, ds_2pvu, ds_saamer
         # --- TPJ Jet --- #
         if j==2:
             ax_tpj.contour(ds_pv.longitude_plot, ds_pv.latitude, ds_pv['z'].sel(level=met_level)[t,:,:]/g, colors='dimgray', levels=geop_levels, linewidths=lw_wind)
-            contf_wind = ax_tpj.contourf(ds_pv.longitude_plot, ds_pv.latitude, ds_pv['u_horiz'].sel(level=met_level)[t,:,:], cmap=cmap, norm=norm, levels=wind_levels,extend='both')
+            contf_wind = ax_tpj.contourf(ds_pv.longitude_plot, ds_pv.latitude, (ds_pv['u'].sel(level=met_level)[t,:,:]**2 + ds_pv['v'].sel(level=met_level)[t,:,:]**2)**(1/2), cmap=cmap, norm=norm, levels=wind_levels,extend='both')
             ax_tpj.contour(ds_ml.longitude_plot, ds_ml.latitude, ds_ml['tprime'][t,:,:,:].sel(level=tmp_level1), colors=clev_colors, levels=clev_lin, linewidths=lw_medium, extend='both')
         else:
             # ax_tpj.contourf(ds_ml.longitude_plot, ds_ml.latitude, ds_ml['u_horiz'].sel(level=tmp_level1)[t,:,:], cmap=cmap_vert, norm=norm_vert, levels=wind_levels_vert,extend='both')
@@ -299,32 +301,34 @@ def plot_era5_jet_composition(config, vars, ds, ds_ml, ds_pv, ds_2pvu, ds_saamer
         if ii==0: 
             axb = axb1
             lat_temp = lat
+            section = ''
             levels = levels1
         else:
             axb = axb2
             lat_temp = lat-5
+            section = '_south'
             levels = levels2
 
         ## Tprime
         # nx_avg = 50 # 50 -> approx. lambdax=750km assuming 1°=60km, 60->900km
         # tprime_lon_z, tprime_lat_z = era_filter.horizontal_temp_filter(ds,t,lat,lon, nx_avg=nx_avg)
-        tprime_lon_z_T21 = ds_ml['tprime'][t,:,:,:].sel(latitude=lat_temp,method='nearest').values
+        tprime_lon_z_T21 = era5_processor.interp_slice(ds_ml['tprime'][t,:,:,:],'latitude',lat_temp).values
 
         # contf_tprime = axb1.contourf(ds['longitude'], ds['level']/1000, tprime_lon_z_T21, levels=clev, cmap=cmap_st, norm=norm_st, extend='both')
         axb.contour(ds_ml.longitude_plot, ds_ml['level']/1000, tprime_lon_z_T21, colors=clev_colors, levels=clev_lin, linewidths=lw_medium, extend='both') # lw=0.8
 
         ## Theta
-        cont_th0  = axb.contour(ds_ml.longitude_plot, ds_ml['level']/1000, ds_ml['th'].sel(latitude=lat_temp)[t,:,:], colors='dimgray', levels=thlev_st, linewidths=0.3)
+        cont_th0  = axb.contour(ds_ml.longitude_plot, ds_ml['level']/1000, vars["th_lon_z"+section][t,:,:], colors='dimgray', levels=thlev_st, linewidths=0.3)
         # axb1.clabel(cont_th0, thlev_labels, fmt= '%1.0fK', inline=True, fontsize=9, manual=th_label_lon)
 
         ## PVU lines
-        contb0 = axb.contour(ds_pv['longitude_3d'][t,:,0,:], ds_pv['z'].sel(latitude=lat_temp)[t,:,:] / (g*1000), ds_pv['pv'].sel(latitude=lat)[t,:,:] * 10**(6), colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
+        contb0 = axb.contour(np.meshgrid(ds_pv.longitude_plot, ds_pv.level)[0], era5_processor.interp_slice(ds_pv['z'][t,:,:,:],'latitude',lat_temp) / (g*1000), era5_processor.interp_slice(ds_pv['pv'][t,:,:,:],'latitude',lat_temp) * 10**(6), colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
         axb.clabel(contb0, [-4,-3,-2,-1], fmt= '%1.0f', inline=True)
 
         ## Wind
         # cont_v  = axb.contour(ds['longitude'], ds['level']/1000, ds['u_horiz'].sel(latitude=lat)[t,:,:], colors='k', levels=ulev, linewidths=0.9, linestyles='--')
         # axb.clabel(cont_v, ulev, fmt= '%1.0f', inline=True, fontsize=9)
-        contf_wind_vert  = axb.contourf(ds_ml.longitude_plot, ds_ml['level']/1000, ds_ml['u_horiz'].sel(latitude=lat_temp)[t,:,:], cmap=cmap_vert, norm=norm_vert, levels=wind_levels_vert, alpha=0.95, extend='both')
+        contf_wind_vert  = axb.contourf(ds_ml.longitude_plot, ds_ml['level']/1000, vars["uh_lon_z"+section][t,:,:], cmap=cmap_vert, norm=norm_vert, levels=wind_levels_vert, alpha=0.95, extend='both')
         # contf_wind_vert  = axb.contourf(ds.longitude_plot, ds['level']/1000, ds['u_horiz'].sel(latitude=lat_temp)[t,:,:], cmap=cmap, norm=norm, levels=wind_levels, extend='both')
 
         axb.axhline(levels[0]/1000, color='black', ls='--', lw=lw_cut)
@@ -65,8 +65,8 @@ def plot_era5_tropopause_composition(config, vars, ds, ds_ml, ds_pv, ds_2pvu, t)
     # tprime_lon_z, tprime_lat_z = filter.horizontal_temp_filter(ds_ml,t,lat,lon_eastern,nx_avg=nx_avg)
     
     # - T21 - #
-    tprime_lon_z = ds_ml['tprime'][t,:,:,:].sel(latitude=lat).values
-    tprime_lat_z = ds_ml['tprime'][t,:,:,:].sel(longitude=lon_eastern).values
+    tprime_lon_z = era5_processor.interp_slice(ds_ml['tprime'][t,:,:,:],'latitude',lat).values
+    tprime_lat_z = era5_processor.interp_slice(ds_ml['tprime'][t,:,:,:],'longitude',lon_eastern).values
 
     """Figure specs"""
     gskw  = {'hspace':0.06, 'wspace':0.04, 'height_ratios': [4,4,3,0.001,3.5], 'width_ratios': [5,5,1]} #  , 'width_ratios': [5,5]}
@@ -298,8 +298,8 @@ def plot_era5_tropopause_composition(config, vars, ds, ds_ml, ds_pv, ds_2pvu, t)
     """(g) PV (dynamical tropopause in xz section)"""
     # axes[k,0].contour(ds.longitude, ds['geom_height'][t,:,0,0]/1000, pv_lon_z[t,:,:], colors='k', lw=3, levels=pvlev)
     # axes[k,1].contour(ds.latitude,  ds['geom_height'][t,:,0,0]/1000, pv_lat_z[t,:,:], colors='k', lw=3, levels=pvlev)
-    cont0 = axes[k+1,0].contour(ds_pv['longitude_3d'][t,:,0,:], vars["zpv_lon_z"][t,:,:], vars["pv_lon_z"][t,:,:], colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
-    cont1 = axes[k+1,1].contour(ds_pv['latitude_3d'][t,:,:,0],  vars["zpv_lat_z"][t,:,:], vars["pv_lat_z"][t,:,:], colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
+    cont0 = axes[k+1,0].contour(np.meshgrid(ds_pv.longitude_plot, ds_pv.level)[0], vars["zpv_lon_z"][t,:,:], vars["pv_lon_z"][t,:,:], colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
+    cont1 = axes[k+1,1].contour(np.meshgrid(ds_pv.latitude, ds_pv.level)[0],  vars["zpv_lat_z"][t,:,:], vars["pv_lat_z"][t,:,:], colors=['k', 'k', 'limegreen', 'k'], linestyles='solid', linewidths=[1.5, 1.5, 2.5, 1.5], levels=pvlev)
     axes[k+1,0].clabel(cont0, [-4,-3,-2,-1], fmt= '%1.0f', inline=True)
     axes[k+1,1].clabel(cont1, [-4,-3,-2,-1], fmt= '%1.0f', inline=True)
 
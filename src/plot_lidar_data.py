@@ -27,7 +27,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import warnings
 warnings.simplefilter("ignore", RuntimeWarning)
 
-import filter, cmaps, lidar_processor, plt_helper
+import filter, cmaps, lidar_processor, plt_helper, storage
 from plot_lidar_filt_1D import plot_lidar_filt_1D
 from plot_lidar_filt_stacked import plot_lidar_filt_stacked
 from plot_lidar_tmp import plot_lidar_tmp
@@ -38,8 +38,9 @@ plt.style.use('latex_default.mplstyle')
 VERTICAL_CUTOFF = 15 # km (LAMBDA_CUT)
 
 
-def plot_lidar_data(CONFIG_FILE, content, reset):
-    """Visualize lidar measurements (time-height diagrams + absolute temperature measurements)"""
+def plot_lidar_data(CONFIG_FILE, content, reset, events_only=False):
+    """Visualize lidar measurements (time-height diagrams + absolute temperature measurements)
+        - events_only: only nights flagged in the event index (process_lidar_data.py ... events)"""
     
     """Settings"""
     config = configparser.ConfigParser()
@@ -59,6 +60,12 @@ def plot_lidar_data(CONFIG_FILE, content, reset):
     fig_list = sorted(glob.glob(os.path.join(config.get("OUTPUT","FOLDER"),config.get("GENERAL","CONTENT"),"*.png")))
     fig_list = [fig_path.split("/")[-1] for fig_path in fig_list]
 
+    if events_only:
+        event_file = storage.find(os.path.join(config.get("OUTPUT","FOLDER"), "events", config.get("GENERAL","INSTRUMENT").lower() + "-events.nc"))
+        with storage.open_dataset(event_file) as ds_events:
+            event_nights = list(ds_events['night'].values[ds_events['n_events'].values > 0])
+        obs_list = [obs for obs in obs_list if obs.split("/")[-1][0:13] in event_nights]
+
     progress_counter = mp.Manager().Value('i', 0)
     lock = mp.Manager().Lock()
     stime = time.time()
@@ -112,6 +119,7 @@ if __name__ == '__main__':
 
     """Example: 
         >> python3 plot_lidar_data.py coral.ini tmp true
+        >> python3 plot_lidar_data.py coral.ini filt-1D false events
     """
     
     """Try changing working directory for Crontab"""
@@ -127,4 +135,8 @@ if __name__ == '__main__':
     if len(sys.argv) > 3:
         if sys.argv[3].lower().capitalize() == "True":
             reset = True
-    plot_lidar_data(sys.argv[1], content, reset)
\ No newline at end of file
+    events_only = False
+    if len(sys.argv) > 4:
+        if sys.argv[4].lower() == "events":
+            events_only = True
+    plot_lidar_data(sys.argv[1], content, reset, events_only)
\ No newline at end of file
@@ -25,7 +25,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 import warnings
 warnings.simplefilter("ignore", RuntimeWarning)
 
-import filter, cmaps, lidar_processor, plt_helper
+import filter, cmaps, era5_processor, lidar_processor, plt_helper
 
 plt.style.use('latex_default.mplstyle')
 
@@ -48,17 +48,10 @@ def plot_lidar_filt_1D(config, obs, pbar):
     vars = [None, ds["tprime_tbwf"].values, ds["tprime_vbwf"].values]
 
     """ERA5 and SAAMER data for plot"""
-    era5_file_path = os.path.join(config["INPUT"]["ERA5-FOLDER"], file_name[0:13] + "-ml-int.nc")
+    ds_era5 = era5_processor.open_station_column(config, config["INPUT"]["ERA5-FOLDER"], file_name[0:13]) # sidecar or regional file
     plot_era5 = False
     plot_saamer = False
-    if os.path.exists(era5_file_path):
-        ds_era5 = xr.open_dataset(era5_file_path)
-        if config.getboolean("ERA5","WESTERN_COORDS"):
-            lon = config.getfloat("ERA5","LON") + 360
-        else:
-            lon = config.getfloat("ERA5","LON")
-        # ds_era5 = ds_era5.sel(latitude=-53.75,longitude=292.25) # method='nearest'
-        ds_era5 = ds_era5.sel(latitude=config.getfloat("ERA5","LAT"),longitude=lon)
+    if ds_era5 is not None:
         tprime_era5_T21  = ds_era5['tprime'].values
         # tprime_era5_temp = (ds_era5["t"]-ds_era5["t"].rolling(time=10,center=True).mean()).values
         vert_res_era5    = (ds_era5['level'][1]-ds_era5['level'][0]).values / 1000 # km
@@ -0,0 +1,112 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import re
+import sys
+import configparser
+
+import numpy as np
+
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.colors import BoundaryNorm
+from matplotlib.ticker import AutoMinorLocator, MultipleLocator
+
+import warnings
+warnings.simplefilter("ignore", RuntimeWarning)
+
+import plt_helper
+import lidar_pyramid
+
+plt.style.use('latex_default.mplstyle')
+
+"""Config"""
+FIG_WIDTH = 12  # inch
+FIG_DPI   = 150
+
+
+def plot_lidar_longrange(CONFIG_FILE, start, end, reset=False):
+    """Time-height section of T and T' between start and end from the level-of-detail pyramid
+        - the level is chosen so that the number of time tiles does not exceed the pixel width of the axes
+    """
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    zrange = eval(config.get("GENERAL","ALTITUDE_RANGE"))
+
+    """Update pyramid with new measurements"""
+    lidar_pyramid.update_pyramid(CONFIG_FILE, reset)
+
+    gskw = {'hspace':0.15}
+    fig, axes = plt.subplots(2,1, figsize=(FIG_WIDTH,8), sharex=True, gridspec_kw=gskw)
+    width_px  = axes[0].get_position().width * FIG_WIDTH * FIG_DPI
+
+    tres  = int(re.search(r'T(\d+)Z', config.get("GENERAL","RESOLUTION")).group(1)) # e.g. *T15Z900.nc -> 15 min
+    level = lidar_pyramid.select_level(tres, start, end, width_px)
+    ds    = lidar_pyramid.read_level(config, level, start, end)
+    if ds is None:
+        print(f"[i]  No measurements between {start} and {end}")
+        plt.close(fig)
+        return
+    print(f"[i]  Pyramid level: {level} ({ds['time'].size} x {ds['alt'].size} tiles)")
+
+    cb_range  = eval(config.get("GENERAL", "TRANGE"))
+    clev_list = [np.arange(cb_range[0],cb_range[1]+10,10), [-16,-8,-4,-2,-1,-0.5,0.5,1,2,4,8,16]]
+    cmap_list = [plt.get_cmap('turbo'), plt.get_cmap('seismic')]
+    cbar_list = ["temperature / K", "T' ($\\lambda$ < $\\lambda_{c}=15\\,km$) / K"]
+    for k, var in enumerate(["temperature", "tprime_vbwf"]):
+        ax   = axes[k]
+        norm = BoundaryNorm(boundaries=clev_list[k], ncolors=cmap_list[k].N, clip=True)
+        pcolor0 = ax.pcolormesh(ds['time'].values, ds['alt'].values, ds[var].values.T, cmap=cmap_list[k], norm=norm)
+        cbar = fig.colorbar(pcolor0, ax=ax, location='right', fraction=0.05, pad=0.02, extend='both')
+        cbar.set_label(cbar_list[k])
+
+        ax.set_xlim(np.datetime64(start), np.datetime64(end))
+        ax.set_ylim(zrange[0], zrange[1])
+        ax.xaxis.set_major_locator(mdates.AutoDateLocator())
+        ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(ax.xaxis.get_major_locator()))
+        ax.yaxis.set_major_locator(MultipleLocator(10))
+        ax.yaxis.set_minor_locator(AutoMinorLocator())
+        ax.set_ylabel('altitude / km')
+        ax.grid()
+
+    fig.suptitle('German Aerospace Center (DLR)\n \
+    {}, {}\n \
+    ------------------------------\n \
+    {} to {}'.format(config.get("GENERAL","INSTRUMENT"), config.get("GENERAL","STATION_NAME"), start, end))
+
+    """Watermark"""
+    fig = plt_helper.add_watermark(fig)
+
+    """Save figure"""
+    file_name = "{}-{}-{}.png".format(config.get("GENERAL","INSTRUMENT").lower(), start, end)
+    fig.savefig(os.path.join(config.get("OUTPUT","FOLDER"), file_name),
+                facecolor='w', edgecolor='w', format='png', dpi=FIG_DPI, bbox_inches='tight')
+    plt.close(fig)
+    print(f"[i]  Long-range plot saved: {file_name}")
+
+
+if __name__ == '__main__':
+    """provide ini file, start and end as arguments and pass it to function"""
+
+    """Example:
+        >> python3 plot_lidar_longrange.py coral.ini 2020-01-01 2020-04-01
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    reset = False
+    if len(sys.argv) > 4:
+        if sys.argv[4].lower().capitalize() == "True":
+            reset = True
+    plot_lidar_longrange(sys.argv[1], sys.argv[2], sys.argv[3], reset)
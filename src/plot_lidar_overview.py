@@ -0,0 +1,139 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import sys
+import configparser
+import calendar
+
+import numpy as np
+
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.colors import BoundaryNorm
+from matplotlib.ticker import AutoMinorLocator, MultipleLocator
+
+import warnings
+warnings.simplefilter("ignore", RuntimeWarning)
+
+import plt_helper, storage
+from process_lidar_data import process_lidar_data
+
+plt.style.use('latex_default.mplstyle')
+
+
+def plot_lidar_overview(CONFIG_FILE, reset):
+    """Season overview (OVERVIEW_RANGE): nightly mean T, rms of T' and measurement coverage calendar
+        - built from the cache of reduced nightly profiles (process_lidar_data.py ... overview),
+          which is updated with new nights only
+    """
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    zrange = eval(config.get("GENERAL","ALTITUDE_RANGE"))
+    overview_range = eval(config.get("GENERAL","OVERVIEW_RANGE"))
+
+    """Update cache of reduced nightly profiles"""
+    cache_file = process_lidar_data(CONFIG_FILE, "overview", reset)
+    with storage.open_dataset(cache_file) as ds_file:
+        ds = ds_file.load()
+
+    """Daily grid of the season"""
+    start = np.datetime64(overview_range[0], 'M').astype('datetime64[D]')
+    end   = (np.datetime64(overview_range[1], 'M') + 1).astype('datetime64[D]')
+    days  = np.arange(start, end + 1, dtype='datetime64[D]') # edges for pcolormesh
+    night_days = ds['date_startp'].values.astype('datetime64[D]')
+    in_range   = (night_days >= start) & (night_days < end)
+    day_index  = (night_days[in_range] - start).astype(int)
+
+    vars = {}
+    for var in ["temperature", "tprime_vbwf_rms"]:
+        vars[var] = np.full((len(days)-1, len(ds['alt'])), np.nan)
+        vars[var][day_index,:] = ds[var].values[in_range]
+    duration = np.zeros(len(days)-1)
+    np.add.at(duration, day_index, ds['duration'].values[in_range])
+
+    """Figure"""
+    gskw = {'hspace':0.25, 'height_ratios': [4,4,3]}
+    fig, axes = plt.subplots(3,1, figsize=(10,12), gridspec_kw=gskw)
+
+    cb_range  = eval(config.get("GENERAL", "TRANGE"))
+    clev_list = [np.arange(cb_range[0],cb_range[1]+10,10), [0,0.5,1,1.5,2,3,4,6,8,12,16]]
+    cmap_list = [plt.get_cmap('turbo'), plt.get_cmap('magma_r')]
+    cbar_list = ["nightly mean temperature / K", "rms of T' ($\\lambda$ < $\\lambda_{c}=15\\,km$) / K"]
+    for k, var in enumerate(["temperature", "tprime_vbwf_rms"]):
+        ax   = axes[k]
+        norm = BoundaryNorm(boundaries=clev_list[k], ncolors=cmap_list[k].N, clip=True)
+        pcolor0 = ax.pcolormesh(days[:-1] + np.timedelta64(12,'h'), ds['alt'].values, vars[var].T, cmap=cmap_list[k], norm=norm)
+        cbar = fig.colorbar(pcolor0, ax=ax, location='right', fraction=0.05, pad=0.02, extend='both')
+        cbar.set_label(cbar_list[k])
+
+        ax.set_xlim(days[0], days[-1])
+        ax.set_ylim(zrange[0], zrange[1])
+        ax.xaxis.set_major_locator(mdates.MonthLocator())
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%b'))
+        ax.xaxis.set_minor_locator(mdates.DayLocator(bymonthday=[8,15,22]))
+        ax.yaxis.set_major_locator(MultipleLocator(10))
+        ax.yaxis.set_minor_locator(AutoMinorLocator())
+        ax.set_ylabel('altitude / km')
+        ax.grid()
+
+    """Coverage calendar (months x day of month)"""
+    ax = axes[2]
+    months   = np.arange(start.astype('datetime64[M]'), end.astype('datetime64[M]'), dtype='datetime64[M]')
+    coverage = np.full((len(months), 31), np.nan)
+    for m, month in enumerate(months):
+        month_days = np.arange(month.astype('datetime64[D]'), (month + 1).astype('datetime64[D]'), dtype='datetime64[D]')
+        coverage[m, 0:len(month_days)] = duration[(month_days - start).astype(int)]
+    cmap = plt.get_cmap('Blues')
+    cmap = cmap.with_extremes(under='whitesmoke', bad='white')
+    norm = BoundaryNorm(boundaries=[0.01,2,4,6,8,10,12,14,24], ncolors=cmap.N, extend='min')
+    pcolor0 = ax.pcolormesh(np.arange(1,33)-0.5, np.arange(len(months)+1)-0.5, coverage, cmap=cmap, norm=norm, edgecolors='white', linewidth=0.5)
+    cbar = fig.colorbar(pcolor0, ax=ax, location='right', fraction=0.05, pad=0.02, ticks=[2,4,6,8,10,12,14,24])
+    cbar.set_label('measurement / h')
+    ax.set_yticks(np.arange(len(months)))
+    ax.set_yticklabels([calendar.month_abbr[int(str(month)[5:7])] + ' ' + str(month)[0:4] for month in months])
+    ax.invert_yaxis()
+    ax.set_xticks([1,5,10,15,20,25,31])
+    ax.set_xlabel('day of month')
+    ax.text(0.99, -0.15, "{} nights, {:.0f}$\\,$h".format(np.count_nonzero(in_range), duration.sum()),
+            transform=ax.transAxes, horizontalalignment='right', verticalalignment='top')
+
+    fig.suptitle('German Aerospace Center (DLR)\n \
+    {}, {}\n \
+    ------------------------------\n \
+    Overview: {} to {}'.format(config.get("GENERAL","INSTRUMENT"), config.get("GENERAL","STATION_NAME"), overview_range[0], overview_range[1]))
+
+    """Watermark"""
+    fig = plt_helper.add_watermark(fig)
+
+    """Save figure"""
+    fig.savefig(os.path.join(config.get("OUTPUT","FOLDER"), config.get("OUTPUT","OVERVIEW_FILE")),
+                facecolor='w', edgecolor='w', format='png', dpi=150, bbox_inches='tight')
+    plt.close(fig)
+    print(f"[i]  Overview saved: {config.get('OUTPUT','OVERVIEW_FILE')}")
+
+
+if __name__ == '__main__':
+    """provide ini file as argument and pass it to function"""
+
+    """Example:
+        >> python3 plot_lidar_overview.py coral.ini
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    reset = False
+    if len(sys.argv) > 2:
+        if sys.argv[2].lower().capitalize() == "True":
+            reset = True
+    plot_lidar_overview(sys.argv[1], reset)
@@ -0,0 +1,551 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import sys
+import glob
+import configparser
+import multiprocessing as mp
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from scipy import ndimage
+
+import warnings
+warnings.simplefilter("ignore", RuntimeWarning)
+
+import era5_processor, lidar_processor, plt_helper, spectra, climatology, storage
+
+"""Config"""
+VERTICAL_CUTOFF = 15 # km (LAMBDA_CUT)
+TEMPORAL_CUTOFF = 8*60 # min (TAU_CUT)
+SPECTRA_METHOD  = 'lombscargle' # 'lombscargle' (gaps allowed), 'welch' (gap-free series, series with gaps fall back to Lomb-Scargle)
+EVENT_BANDS     = [[11,30,2], [30,60,4], [60,94,8]] # km, km, K (|T'| threshold per altitude band)
+EVENT_MIN_DURATION = 2 # h (persistence of connected region)
+EVENT_MIN_DEPTH    = 3 # km (vertical extent of connected region)
+UNCERTAINTY_SAMPLES = 200 # noise realizations per night (UNCERTAINTY: N_SAMPLES)
+
+
+def process_lidar_data(CONFIG_FILE, content, reset):
+    """Compute lidar products (epot, spectra, waveparams, events, climatology, era5bias, uncertainty, overview) for all measurements in parallel and reduce them into one compact file"""
+
+    """Settings"""
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+
+    if config.get("INPUT","OBS_FILE") == "NONE":
+        obs_list = sorted(glob.glob(os.path.join(config.get("INPUT","OBS_FOLDER") , config.get("GENERAL","RESOLUTION"))))
+    else:
+        obs_list = [os.path.join(config.get("INPUT","OBS_FOLDER"), config.get("INPUT","OBS_FILE"))]
+
+    config["GENERAL"]["CONTENT"] = content
+    os.makedirs(os.path.join(config.get("OUTPUT","FOLDER"),config.get("GENERAL","CONTENT")), exist_ok=True)
+    output_file = os.path.join(config.get("OUTPUT","FOLDER"), config.get("GENERAL","CONTENT"),
+                               config.get("GENERAL","INSTRUMENT").lower() + "-" + content + ".nc")
+    output_file = storage.backend_path(output_file, config.get("OUTPUT","BACKEND", fallback="netcdf"))
+
+    """Check which measurements are already processed"""
+    ds_out = None
+    if os.path.exists(output_file) and not reset:
+        with storage.open_dataset(output_file) as ds_file:
+            ds_out = ds_file.load()
+    elif reset:
+        for night_file in glob.glob(os.path.join(config.get("OUTPUT","FOLDER"), config.get("GENERAL","CONTENT"), "*-" + content + ".*")):
+            storage.remove(night_file)
+    processed = [] if ds_out is None else list(ds_out['night'].values)
+
+    progress_counter = mp.Manager().Value('i', 0)
+    lock = mp.Manager().Lock()
+    stime = time.time()
+    pbar = {"progress_counter": progress_counter, "lock": lock, "stime": stime}
+
+    if content == "era5bias":
+        # - Only measurements with ERA5 (station column sidecar or -ml-int of the night) - #
+        era5_nights = set(storage.era5_nights(era5_folder(config), '-ml-int')) | set(storage.era5_nights(era5_folder(config), '-ml-station'))
+        obs_list = [obs for obs in obs_list if os.path.split(obs)[-1][0:13] in era5_nights]
+
+    args_list = []
+    for obs in obs_list:
+        if os.path.split(obs)[-1][0:13] not in processed:
+            args = (config, obs, pbar)
+            args_list.append(args)
+
+    pbar['ntasks'] = len(args_list)
+    config['GENERAL']['NCPUS']  = str(max(1, int(mp.cpu_count()-2)))
+    print(f"[i]  CPUs available: {mp.cpu_count()}")
+    print(f"[i]  CPUs used: {config.get('GENERAL','NCPUS')}")
+    print(f"[i]  Reset: {reset}, Number of measurements: {pbar['ntasks']}")
+
+    with mp.Pool(processes=config.getint("GENERAL","NCPUS")) as pool:
+        if config.get("GENERAL","CONTENT") == "epot":
+            results = pool.starmap(epot_profile, args_list)
+        elif config.get("GENERAL","CONTENT") == "spectra":
+            results = pool.starmap(night_spectra, args_list)
+        elif config.get("GENERAL","CONTENT") == "waveparams":
+            results = pool.starmap(wave_parameters, args_list)
+        elif config.get("GENERAL","CONTENT") == "events":
+            results = pool.starmap(detect_events, args_list)
+        elif config.get("GENERAL","CONTENT") == "overview":
+            results = pool.starmap(overview_profile, args_list)
+        elif config.get("GENERAL","CONTENT") == "uncertainty":
+            results = pool.starmap(night_uncertainty, args_list)
+        elif config.get("GENERAL","CONTENT") in ["climatology", "era5bias"]:
+            # - One partial accumulator per worker, merged while results arrive - #
+            n_batches = config.getint("GENERAL","NCPUS")
+            batches   = [(config, [args[1] for args in args_list[i::n_batches]], pbar) for i in range(n_batches)]
+            acc, nights = None, []
+            for acc_part, nights_part in pool.imap_unordered(climatology_partial, batches):
+                acc = climatology.merge(acc, acc_part)
+                nights += nights_part
+            results = [] if acc is None else [acc.assign_coords(night=nights)]
+        else:
+            print(f"[i]  Unknown content: {content}")
+            return None
+
+    """Reduce results into one file"""
+    results = [result for result in results if result is not None]
+    if len(results) > 0:
+        if ds_out is not None:
+            results.insert(0, ds_out)
+        if config.get("GENERAL","CONTENT") == "spectra":
+            ds_out = monthly_spectra(results)
+        elif config.get("GENERAL","CONTENT") in ["climatology", "era5bias"]:
+            ds_out = None
+            for ds_part in results:
+                ds_out = climatology.merge(ds_out, ds_part)
+            ds_out = climatology.finalize(ds_out).assign_coords(night=np.concatenate([ds_part['night'].values for ds_part in results])).sortby('night')
+            if config.get("GENERAL","CONTENT") == "climatology":
+                ds_monthly = climatology.finalize(climatology.collapse(ds_out.drop_vars('night'), 'hour'))
+                storage.write_dataset(ds_monthly, os.path.splitext(output_file)[0] + "-monthly" + os.path.splitext(output_file)[1])
+            else:
+                ds_out = era5_bias_rms(ds_out)
+        elif config.get("GENERAL","CONTENT") == "events":
+            ds_out = event_index(results)
+            ds_out[[var for var in ds_out.data_vars if 'event' in ds_out[var].dims]].to_dataframe().to_csv(os.path.splitext(output_file)[0] + ".csv")
+        else:
+            ds_out = xr.concat(results, dim='night', join='outer').sortby('night')
+        for var in ds_out.variables:
+            ds_out[var].encoding = {}
+        storage.write_dataset(ds_out, output_file)
+        if config.get("GENERAL","CONTENT") == "waveparams":
+            ds_out.to_dataframe().to_csv(os.path.splitext(output_file)[0] + ".csv")
+
+    etime    = time.time()
+    hours    = int((etime - stime) / 3600)
+    minutes  = int(((etime - stime) % 3600) / 60)
+    seconds  = int(((etime - stime) % 60))
+    time_str = str(hours).zfill(2) + ":" + str(minutes).zfill(2) + ":" + str(seconds).zfill(2)
+    print("")
+    print(f"[i]  Processing completed in {time_str} hours ({output_file}).")
+    return output_file
+
+
+# ----------------------------------- SUBROUTINES ----------------------------------- #
+def load_measurement(config, obs, background=False, era5=False):
+    """Open and process lidar measurement incl. T' (None if no data available)
+        - background: with RESOLUTION_BG also T' relative to the background product of the night (tprime_bg)
+        - era5: with ERA5 station column of the night also residuals to ERA5 and T' relative to ERA5 (tres_era5, tprime_era5)
+    """
+    if background:
+        ds, ds_bg = lidar_processor.open_lidar_pair(config, obs)
+    else:
+        ds, ds_bg = lidar_processor.open_and_decode_lidar_measurement(obs), None
+    if ds is None:
+        return
+    ds, ds_bg = lidar_processor.process_lidar_pair(config, ds, ds_bg)
+    ds = lidar_processor.calculate_primes(ds, TEMPORAL_CUTOFF, VERTICAL_CUTOFF)
+    if ds_bg is not None:
+        ds = lidar_processor.calculate_primes_bg(ds, ds_bg)
+        ds_bg.close()
+    if era5:
+        ds_era5 = era5_processor.open_station_column(config, era5_folder(config), os.path.split(obs)[-1][0:13])
+        if ds_era5 is not None:
+            ds = lidar_processor.calculate_primes_era5(ds, ds_era5.load())
+            ds_era5.close()
+    return ds
+
+
+def background_pair(config):
+    """Background product of the night configured (RESOLUTION_BG)"""
+    return config.get("GENERAL", "RESOLUTION_BG", fallback="NONE") != "NONE"
+
+
+def era5_folder(config):
+    """ERA5 station columns of the measurements (INPUT: ERA5-FOLDER, default OUTPUT FOLDER/era5-profiles)"""
+    return config.get("INPUT", "ERA5-FOLDER", fallback=os.path.join(config.get("OUTPUT","FOLDER"), "era5-profiles"))
+
+
+def epot_profile(config, obs, pbar):
+    """Nightly mean profiles of N2 and potential energy density (vertical and temporal BW filter)"""
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    ds = lidar_processor.calculate_energy(ds)
+    data_vars = {}
+    for var in ["N2_vbwf", "N2_tbwf", "epot_vbwf", "epot_tbwf"]:
+        data_vars[var] = (('night', 'alt'), np.nanmean(ds[var].values, axis=0)[np.newaxis,:], {'long_name': 'nightly mean ' + var})
+    data_vars["n_profiles"] = (('night', 'alt'), np.sum(~np.isnan(ds["epot_vbwf"].values), axis=0)[np.newaxis,:])
+    data_vars["date_startp"] = (('night'), [np.datetime64(ds['date_startp'].values, 'ns')])
+    data_vars["duration"]    = (('night'), [ds.duration.total_seconds() / 3600], {'units': 'h'})
+
+    ds_night = xr.Dataset(data_vars, coords={'night': [file_name[0:13]], 'alt': np.round(ds.alt_plot.values, 3)})
+    ds_night['alt'].attrs['units'] = 'km'
+    ds_night["epot_vbwf"].attrs['units'] = 'J kg-1'
+    ds_night["epot_tbwf"].attrs['units'] = 'J kg-1'
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def night_uncertainty(config, obs, pbar):
+    """Monte Carlo uncertainty of T' (temperature_err propagated through the vertical and temporal BW filter)
+        - T' and its standard deviation per bin (tprime_*_std) stored per night in the content folder
+        - returns nightly mean profiles of the standard deviation
+        - UNCERTAINTY: N_SAMPLES noise realizations, SEED (NONE: not reproducible) combined with the night
+    """
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    n_samples = config.getint("UNCERTAINTY","N_SAMPLES",fallback=UNCERTAINTY_SAMPLES)
+    seed = config.get("UNCERTAINTY","SEED",fallback="NONE")
+    seed = None if seed == "NONE" else [int(seed), int(file_name[0:8] + file_name[9:13])]
+    ds = lidar_processor.calculate_prime_uncertainty(ds, TEMPORAL_CUTOFF, VERTICAL_CUTOFF, n_samples=n_samples, seed=seed)
+
+    primes = ["tprime_vbwf", "tprime_tbwf", "tprime_vbwf_std", "tprime_tbwf_std"]
+    ds_primes = xr.Dataset({var: (('time', 'alt'), ds[var].values, {'units': 'K'}) for var in primes},
+                           coords={'time': ds.time.values, 'alt': np.round(ds.alt_plot.values, 3)},
+                           attrs={'n_samples': n_samples, 'night': file_name[0:13]})
+    ds_primes['alt'].attrs['units'] = 'km'
+    ds_primes.to_netcdf(os.path.join(config.get("OUTPUT","FOLDER"), config.get("GENERAL","CONTENT"),
+                                     file_name[0:13] + "-" + config.get("GENERAL","CONTENT") + ".nc"))
+
+    data_vars = {}
+    for var in ["tprime_vbwf_std", "tprime_tbwf_std"]:
+        data_vars[var] = (('night', 'alt'), np.nanmean(ds[var].values, axis=0)[np.newaxis,:], {'long_name': 'nightly mean ' + var, 'units': 'K'})
+    data_vars["n_profiles"]  = (('night', 'alt'), np.sum(~np.isnan(ds["tprime_tbwf_std"].values), axis=0)[np.newaxis,:])
+    data_vars["date_startp"] = (('night'), [np.datetime64(ds['date_startp'].values, 'ns')])
+    data_vars["duration"]    = (('night'), [ds.duration.total_seconds() / 3600], {'units': 'h'})
+    ds_night = xr.Dataset(data_vars, coords={'night': [file_name[0:13]], 'alt': np.round(ds.alt_plot.values, 3)},
+                          attrs={'n_samples': n_samples})
+    ds_night['alt'].attrs['units'] = 'km'
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def night_spectra(config, obs, pbar):
+    """Vertical wavenumber spectra of T' (tbwf) per profile and frequency spectra of T' (vbwf) per altitude bin
+        - with RESOLUTION_BG also both spectra of T' relative to the background product (psd_vertical_bg, psd_frequency_bg)
+        - stored per night in the content folder
+        - returns nightly mean spectra for the monthly average
+    """
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs, background=True)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    """Grids (fixed per config, so nights can be averaged)"""
+    zrange = eval(config.get("GENERAL","ALTITUDE_RANGE"))
+    zmask  = (ds.alt_plot.values >= zrange[0]) & (ds.alt_plot.values <= zrange[1])
+    alt    = ds.alt_plot.values[zmask] # km
+    hours  = (ds.time.values - ds.time.values[0]) / np.timedelta64(1, 'h')
+    duration_night = (ds['date_endp'].values - ds['date_startp'].values) / np.timedelta64(1, 'h')
+    wavenumbers = spectra.frequency_grid(zrange[1] - zrange[0], ds.vres) # 1/km
+    frequencies = spectra.frequency_grid(duration_night, ds.tres / 60)   # 1/h
+
+    # - T' per spectrum: vertical (time, alt), frequency (alt, time) - #
+    primes = {'': (ds["tprime_tbwf"].values[:,zmask], ds["tprime_vbwf"].values[:,zmask].T)}
+    if background_pair(config):
+        tprime_bg = ds["tprime_bg"].values[:,zmask] if "tprime_bg" in ds else np.full((len(hours), len(alt)), np.nan)
+        primes['_bg'] = (tprime_bg, tprime_bg.T)
+
+    psd = {}
+    for suffix, (tprime_vertical, tprime_frequency) in primes.items():
+        if SPECTRA_METHOD == 'welch':
+            # - on the grids of the config (Welch frequencies depend on the length of the night) - #
+            psd_vertical  = spectra.welch(tprime_vertical, ds.vres, freqs=wavenumbers)[1]
+            psd_frequency = spectra.welch(tprime_frequency, ds.tres / 60, freqs=frequencies)[1]
+        else:
+            psd_vertical  = spectra.lomb_scargle(tprime_vertical, alt, wavenumbers)
+            psd_frequency = spectra.lomb_scargle(tprime_frequency, hours, frequencies)
+        psd['psd_vertical' + suffix]  = (('time', 'wavenumber'), psd_vertical, {'units': 'K2 km'})
+        psd['psd_frequency' + suffix] = (('alt', 'frequency'), psd_frequency, {'units': 'K2 h'})
+
+    ds_spectra = xr.Dataset(psd,
+                            coords={'time'      : ds.time.values,
+                                    'alt'       : np.round(alt, 3),
+                                    'wavenumber': wavenumbers,
+                                    'frequency' : frequencies},
+                            attrs={'method': SPECTRA_METHOD, 'night': file_name[0:13]})
+    ds_spectra['wavenumber'].attrs['units'] = 'km-1'
+    ds_spectra['frequency'].attrs['units']  = 'h-1'
+    ds_spectra.to_netcdf(os.path.join(config.get("OUTPUT","FOLDER"), config.get("GENERAL","CONTENT"),
+                                      file_name[0:13] + "-" + config.get("GENERAL","CONTENT") + ".nc"))
+
+    """Nightly mean for monthly average"""
+    ds_night = ds_spectra.drop_vars('time').assign({var: ds_spectra[var].mean(dim='time') for var in psd if 'time' in ds_spectra[var].dims})
+    ds_night = ds_night.expand_dims(night=[file_name[0:13]])
+    ds_night.attrs = {'method': SPECTRA_METHOD}
+    ds_night['month_of_night'] = (('night'), [str(ds['date_startp'].values)[0:7]])
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def overview_profile(config, obs, pbar):
+    """Reduced profiles of one night for the season overview (mean T, rms of T', coverage)"""
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    data_vars = {}
+    data_vars["temperature"]     = (('night', 'alt'), np.nanmean(ds["temperature"].values, axis=0)[np.newaxis,:], {'units': 'K'})
+    data_vars["tprime_tbwf_rms"] = (('night', 'alt'), np.sqrt(np.nanmean(ds["tprime_tbwf"].values**2, axis=0))[np.newaxis,:], {'units': 'K'})
+    data_vars["tprime_vbwf_rms"] = (('night', 'alt'), np.sqrt(np.nanmean(ds["tprime_vbwf"].values**2, axis=0))[np.newaxis,:], {'units': 'K'})
+    data_vars["n_profiles"]      = (('night', 'alt'), np.sum(~np.isnan(ds["temperature"].values), axis=0)[np.newaxis,:])
+    data_vars["date_startp"]     = (('night'), [np.datetime64(ds['date_startp'].values, 'ns')])
+    data_vars["start_time"]      = (('night'), [ds.time.values[0]])
+    data_vars["end_time"]        = (('night'), [ds.time.values[-1]])
+    data_vars["duration"]        = (('night'), [ds.duration.total_seconds() / 3600], {'units': 'h'})
+    ds_night = xr.Dataset(data_vars, coords={'night': [file_name[0:13]], 'alt': np.round(ds.alt_plot.values, 3)})
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def wave_parameters(config, obs, pbar):
+    """Dominant vertical wavelength, ground-based period and vertical phase speed from 2-D spectrum of T' (tbwf, vbwf, with RESOLUTION_BG also bg)"""
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs, background=True)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    zrange = eval(config.get("GENERAL","ALTITUDE_RANGE"))
+    zmask  = (ds.alt_plot.values >= zrange[0]) & (ds.alt_plot.values <= zrange[1])
+    units  = {'lambda_z': 'km', 'period': 'h', 'c_z': 'km h-1', 'power_share': '1'}
+
+    data_vars = {}
+    for filt in ['tbwf', 'vbwf'] + (['bg'] if "tprime_bg" in ds else []):
+        params = spectra.dominant_wave(ds["tprime_" + filt].values[:,zmask], ds.tres / 60, ds.vres)
+        for param, value in params.items():
+            data_vars[param + "_" + filt] = (('night'), [value], {'units': units[param]})
+    data_vars["date_startp"] = (('night'), [np.datetime64(ds['date_startp'].values, 'ns')])
+    data_vars["duration"]    = (('night'), [ds.duration.total_seconds() / 3600], {'units': 'h'})
+    ds_night = xr.Dataset(data_vars, coords={'night': [file_name[0:13]]})
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def detect_events(config, obs, pbar):
+    """Wave events as connected regions of large |T'| (threshold per altitude band, persistence in time)"""
+    file_name = os.path.split(obs)[-1]
+    ds = load_measurement(config, obs)
+    if ds is None:
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+        return
+
+    # - Amplitude threshold per altitude - #
+    alt = ds.alt_plot.values
+    threshold = np.full(alt.shape, np.inf)
+    for band in EVENT_BANDS:
+        threshold[(alt >= band[0]) & (alt < band[1])] = band[2]
+
+    events = {name: [] for name in ['event_night', 'filter', 'time_start', 'time_end', 'alt_bottom', 'alt_top', 'tprime_max', 'n_bins']}
+    times = ds.time.values
+    for filt in ['tbwf', 'vbwf']:
+        tprime = np.abs(ds["tprime_" + filt].values)
+        labels, n_labels = ndimage.label(np.nan_to_num(tprime) > threshold[np.newaxis,:], structure=np.ones((3,3)))
+        if n_labels == 0:
+            continue
+        index   = np.arange(1, n_labels+1)
+        slices  = ndimage.find_objects(labels)
+        t_start = np.array([sl[0].start for sl in slices])
+        t_end   = np.array([sl[0].stop - 1 for sl in slices])
+        z_start = np.array([sl[1].start for sl in slices])
+        z_end   = np.array([sl[1].stop - 1 for sl in slices])
+        amp     = ndimage.maximum(np.nan_to_num(tprime), labels, index)
+        n_bins  = ndimage.sum(np.ones(labels.shape), labels, index)
+
+        # - Persistence and vertical extent - #
+        duration = (times[t_end] - times[t_start]) / np.timedelta64(1, 'h') + ds.tres / 60
+        depth    = alt[z_end] - alt[z_start] + ds.vres
+        keep     = (duration >= EVENT_MIN_DURATION) & (depth >= EVENT_MIN_DEPTH)
+
+        events['event_night'] += [file_name[0:13]] * np.count_nonzero(keep)
+        events['filter']      += [filt] * np.count_nonzero(keep)
+        events['time_start']  += list(times[t_start[keep]])
+        events['time_end']    += list(times[t_end[keep]])
+        events['alt_bottom']  += list(alt[z_start[keep]])
+        events['alt_top']     += list(alt[z_end[keep]])
+        events['tprime_max']  += list(amp[keep])
+        events['n_bins']      += list(n_bins[keep].astype(int))
+
+    ds_night = xr.Dataset({var: (('event'), np.array(values)) for var, values in events.items() if len(values) > 0})
+    ds_night['n_events']    = (('night'), [len(events['event_night'])])
+    ds_night['date_startp'] = (('night'), [np.datetime64(ds['date_startp'].values, 'ns')])
+    ds_night = ds_night.assign_coords(night=[file_name[0:13]])
+    ds.close()
+
+    plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return ds_night
+
+
+def event_index(results):
+    """Combine event datasets (previous index and new nights) into one index (night and event dimension)"""
+    ds_nights = xr.concat([ds_part[['n_events', 'date_startp']] for ds_part in results], dim='night')
+    ds_events = [ds_part.drop_vars(['n_events', 'date_startp', 'night']) for ds_part in results if 'event' in ds_part.dims]
+    ds_events = [ds_part.drop_vars('event') if 'event' in ds_part.coords else ds_part for ds_part in ds_events]
+    if len(ds_events) > 0:
+        ds_nights = xr.merge([ds_nights, xr.concat(ds_events, dim='event')])
+        ds_nights = ds_nights.assign_coords(event=np.arange(len(ds_nights['event'])))
+    return ds_nights.sortby('night')
+
+
+def climatology_partial(args):
+    """Partial climatology (or ERA5 bias statistics) of a batch of measurements (accumulated within the worker)"""
+    config, obs_batch, pbar = args
+    night_accumulator = night_era5_bias if config.get("GENERAL","CONTENT") == "era5bias" else night_climatology
+    acc, nights = None, []
+    for obs in obs_batch:
+        acc_night = night_accumulator(config, obs)
+        if acc_night is not None:
+            acc = climatology.merge(acc, acc_night)
+            nights.append(os.path.split(obs)[-1][0:13])
+        plt_helper.show_progress(pbar['progress_counter'], pbar['lock'], pbar["stime"], pbar['ntasks'])
+    return acc, nights
+
+
+def night_climatology(config, obs):
+    """Accumulator of T, T' and T'^2 per month, hour and altitude for one measurement"""
+    ds = load_measurement(config, obs)
+    if ds is None:
+        return
+
+    times  = pd.DatetimeIndex(ds.time.values)
+    groups = (times.month.values - 1) * 24 + times.hour.values
+    coords = {'month': np.arange(1,13), 'hour': np.arange(0,24), 'alt': np.round(ds.alt_plot.values, 3)}
+
+    acc = climatology.accumulator(ds["temperature"].values, groups, coords, "temperature")
+    for filt in ['tbwf', 'vbwf']:
+        tprime = ds["tprime_" + filt].values
+        acc = acc.merge(climatology.accumulator(tprime, groups, coords, "tprime_" + filt))
+        acc = acc.merge(climatology.accumulator(tprime**2, groups, coords, "tprime_" + filt + "_sq"))
+    ds.close()
+    return acc
+
+
+def night_era5_bias(config, obs):
+    """Accumulator of lidar - ERA5 differences per month and altitude for one measurement (None without ERA5)
+        - tres_era5: T - T_ERA5 (bias: mean, RMS: sqrt of mean of tres_era5_sq)
+        - dtprime_<filt>: T' (lidar) - T' (ERA5), ERA5 T on the lidar grid filtered with the same BW filter and
+          sampling as the lidar T' of load_measurement (bins missing in one of both are removed in both)
+    """
+    ds = load_measurement(config, obs, era5=True)
+    if ds is None:
+        return
+    if "temperature_era5" not in ds:
+        ds.close()
+        return
+
+    # - ERA5 T' with the sampling of the lidar (lidar T' is reused) - #
+    valid = ~np.isnan(ds["temperature"].values) & ~np.isnan(ds["temperature_era5"].values)
+    ds_era5 = ds[['temperature']].copy()
+    ds_era5["temperature"] = (ds["temperature"].dims, np.where(np.isnan(ds["temperature"].values), np.nan, ds["temperature_era5"].values))
+    ds_era5 = lidar_processor.calculate_primes(ds_era5, TEMPORAL_CUTOFF, VERTICAL_CUTOFF)
+
+    months, groups = np.unique(ds.time.values.astype('datetime64[M]'), return_inverse=True)
+    coords = {'month': months.astype('datetime64[ns]'), 'alt': np.round(ds.alt_plot.values, 3)}
+
+    tres = np.where(valid, ds["tres_era5"].values, np.nan)
+    acc = climatology.accumulator(tres, groups, coords, "tres_era5")
+    acc = acc.merge(climatology.accumulator(tres**2, groups, coords, "tres_era5_sq"))
+    for filt in ['tbwf', 'vbwf']:
+        tprime_lidar = np.where(valid, ds["tprime_" + filt].values, np.nan)
+        tprime_era5  = np.where(valid, ds_era5["tprime_" + filt].values, np.nan)
+        acc = acc.merge(climatology.accumulator(tprime_lidar - tprime_era5, groups, coords, "dtprime_" + filt))
+        acc = acc.merge(climatology.accumulator((tprime_lidar - tprime_era5)**2, groups, coords, "dtprime_" + filt + "_sq"))
+        acc = acc.merge(climatology.accumulator(tprime_lidar**2, groups, coords, "tprime_" + filt + "_sq"))
+        acc = acc.merge(climatology.accumulator(tprime_era5**2, groups, coords, "tprime_" + filt + "_era5_sq"))
+    ds.close()
+    return acc
+
+
+def era5_bias_rms(ds_out):
+    """Bias (mean of the differences) and RMS (sqrt of the mean of the squared differences) of the ERA5 comparison"""
+    for name in ["tres_era5", "dtprime_tbwf", "dtprime_vbwf"]:
+        ds_out[name + "_bias"] = ds_out[name]
+        ds_out[name + "_rms"]  = np.sqrt(ds_out[name + "_sq"])
+    return ds_out
+
+
+def monthly_spectra(results):
+    """Monthly mean spectra from sums and counts (a previous monthly file is incremented with the new nights)
+        - spectra missing in a part (e.g. psd_*_bg before RESOLUTION_BG was set) count as zero
+    """
+    psd_vars = []
+    ds_sum = None
+    for ds_part in results:
+        if 'psd_vertical_sum' not in ds_part:
+            # - Nightly spectra to monthly sums - #
+            month = ds_part['month_of_night'].rename('month')
+            for var in [var for var in ds_part.data_vars if var.startswith('psd_')]:
+                ds_part[var + '_sum']   = ds_part[var].fillna(0).groupby(month).sum(dim='night')
+                ds_part[var + '_count'] = ds_part[var].notnull().groupby(month).sum(dim='night')
+        psd_vars += [var[:-4] for var in ds_part.data_vars if var.endswith('_sum') and var[:-4] not in psd_vars]
+        ds_part = ds_part[[var for var in ds_part.data_vars if var.endswith(('_sum', '_count'))] + ['month_of_night']]
+        if ds_sum is None:
+            ds_sum = ds_part
+        else:
+            sums_old, sums_new = xr.align(ds_sum.drop_vars('month_of_night'), ds_part.drop_vars('month_of_night'), join='outer', fill_value=0)
+            sums_old = sums_old.assign({var: xr.zeros_like(sums_new[var]) for var in sums_new.data_vars if var not in sums_old})
+            sums_new = sums_new.assign({var: xr.zeros_like(sums_old[var]) for var in sums_old.data_vars if var not in sums_new})
+            ds_sum = (sums_old + sums_new).assign(month_of_night=xr.concat([ds_sum['month_of_night'], ds_part['month_of_night']], dim='night'))
+
+    for var in psd_vars:
+        ds_sum[var] = ds_sum[var + '_sum'] / ds_sum[var + '_count'].where(ds_sum[var + '_count'] > 0)
+    return ds_sum.sortby('night')
+
+
+if __name__ == '__main__':
+    """provide ini file as argument and pass it to function"""
+
+    """Example:
+        >> python3 process_lidar_data.py coral.ini epot true
+    """
+
+    """Try changing working directory for Crontab"""
+    try:
+        os.chdir(os.path.dirname(sys.argv[0]))
+    except:
+        print('[i]  Working directory already set!')
+
+    content = sys.argv[2]
+    # epot, spectra, waveparams, events, climatology, era5bias, uncertainty, overview
+
+    reset = False
+    if len(sys.argv) > 3:
+        if sys.argv[3].lower().capitalize() == "True":
+            reset = True
+    process_lidar_data(sys.argv[1], content, reset)
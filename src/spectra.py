@@ -0,0 +1,107 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import numpy as np
+from scipy import signal
+
+"""Config"""
+min_samples = 10 # minimum number of valid values per series
+
+
+def frequency_grid(length, res):
+    """Fourier frequencies (without 0) of a series with given length and resolution (e.g. km -> 1/km)"""
+    n = int(round(length / res))
+    return np.arange(1, n//2 + 1) / (n * res)
+
+
+def lomb_scargle(data, x, freqs):
+    """One-sided Lomb-Scargle PSD of each row of data (NaN = gap), computed for all rows and frequencies at once
+        - least-squares fit of cos/sin at each frequency (sums are matrix products over the last axis)
+        - normalized like a periodogram (sum(PSD*df) ~ variance), units: data^2 / freqs
+    Input:
+        - 2D matrix (series in rows)
+        - x (sampling positions of the columns)
+        - freqs (frequencies in 1/unit of x)
+    Output:
+        - 2D matrix (rows x freqs)
+    """
+    data  = np.asarray(data, dtype=float)
+    valid = ~np.isnan(data)
+    w     = valid.astype(float)
+    n     = w.sum(axis=-1, keepdims=True)
+
+    # - Remove mean of valid values - #
+    y = np.where(valid, data, 0.)
+    y = np.where(valid, y - y.sum(axis=-1, keepdims=True) / np.maximum(n, 1), 0.)
+
+    arg = 2 * np.pi * np.outer(x, freqs)
+    cos = np.cos(arg)
+    sin = np.sin(arg)
+    yc  = y @ cos
+    ys  = y @ sin
+    cc  = w @ cos**2
+    ss  = w @ sin**2
+    cs  = w @ (cos * sin)
+
+    det   = cc * ss - cs**2
+    power = (ss * yc**2 + cc * ys**2 - 2 * cs * yc * ys) / np.where(det > 0, det, np.nan)
+    power = np.where(n >= min_samples, power, np.nan)
+
+    dx = np.abs(x[1] - x[0])
+    return power * dx
+
+
+def welch(data, res, nperseg=None, freqs=None):
+    """One-sided Welch PSD of each row of data (Welch needs gap-free rows)
+        - rows with gaps (NaN) fall back to the Lomb-Scargle PSD at the Welch frequencies
+        - freqs: common frequency grid (e.g. frequency_grid of the night), the Welch PSD is interpolated linearly
+          onto it (NaN outside of the Welch frequencies), so series of different length can be averaged
+    """
+    data = np.asarray(data, dtype=float)
+    gaps = np.isnan(data).any(axis=-1)
+    nperseg = min(256, data.shape[-1]) if nperseg is None else nperseg # scipy default, without warning for short rows
+    f, psd = signal.welch(np.nan_to_num(data), fs=1/res, nperseg=nperseg, axis=-1, detrend='constant')
+    f, psd = f[1:], psd[..., 1:]
+    if freqs is not None:
+        freqs = np.asarray(freqs, dtype=float)
+        lo = np.clip(np.searchsorted(f, freqs, side='right') - 1, 0, len(f)-2)
+        w  = np.where((freqs >= f[0]) & (freqs <= f[-1]), (freqs - f[lo]) / (f[lo+1] - f[lo]), np.nan)
+        psd, f = psd[..., lo] * (1 - w) + psd[..., lo+1] * w, freqs
+    if np.any(gaps):
+        psd[gaps] = lomb_scargle(data[gaps], np.arange(data.shape[-1]) * res, f)
+    return f, psd
+
+
+def dominant_wave(data, dt, dz):
+    """Dominant wave of a time-height field from its 2-D spectrum (Hann window, NaN -> 0)
+    Input:
+        - 2D matrix (time, altitude) on regular grid
+        - dt, dz (resolution, e.g. h and km)
+    Output:
+        - dict with vertical wavelength (dz unit), ground-based period (dt unit),
+          vertical phase speed (dz/dt, negative for downward phase progression) and share of spectral power
+    """
+    data = np.asarray(data, dtype=float)
+    nt, nz = data.shape
+    if np.count_nonzero(~np.isnan(data)) < min_samples**2:
+        return {'lambda_z': np.nan, 'period': np.nan, 'c_z': np.nan, 'power_share': np.nan}
+
+    data   = np.nan_to_num(data - np.nanmean(data))
+    window = np.outer(np.hanning(nt), np.hanning(nz))
+    power  = np.abs(np.fft.fft2(data * window))**2
+    f = np.fft.fftfreq(nt, dt)
+    m = np.fft.fftfreq(nz, dz)
+
+    # - Half plane f > 0 (P(f,m) = P(-f,-m)) without m = 0 - #
+    power_half = np.where((f[:,np.newaxis] > 0) & (m[np.newaxis,:] != 0), power, 0)
+    it, iz = np.unravel_index(np.argmax(power_half), power.shape)
+
+    # - T' ~ cos(2pi (f t + m z)) -> phase speed dz/dt = -f/m - #
+    return {'lambda_z'   : 1 / np.abs(m[iz]),
+            'period'     : 1 / f[it],
+            'c_z'        : -f[it] / m[iz],
+            'power_share': 2 * power_half[it, iz] / power.sum()}
@@ -0,0 +1,366 @@
+################################################################################
+# Copyright 2023 German Aerospace Center                                       #
+################################################################################
+# This is free software you can redistribute/modify under the terms of the     #
+# GNU Lesser General Public License 3 or later: http://www.gnu.org/licenses    #
+################################################################################
+
+import os
+import re
+import sys
+import glob
+import shutil
+import fcntl
+import contextlib
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+"""Storage of intermediate files (encoding profiles: chunk shapes, compression, dimension order; packed int16)
+    - backends: NetCDF (.nc) or Zarr (.zarr, consolidated metadata, appends along time), chosen by the file extension
+"""
+
+"""Config"""
+canonical_dims = ('time','level','latitude','longitude')
+extensions     = {'netcdf': '.nc', 'zarr': '.zarr'}
+zarr_format    = 2 # new stores (consolidated metadata .zmetadata is part of the v2 format)
+
+# - chunks: size per dim (-1: full length of the written data), dim_order: order of dims in the file - #
+# - (ERA5 intermediates hold 48 hourly time steps) - #
+ENCODING_PROFILES = {
+    # - uncompressed (to_netcdf defaults, time unlimited) - #
+    'default'       : {'zlib': False, 'complevel': 0, 'shuffle': False, 'chunks': None,
+                       'dim_order': canonical_dims},
+    # - point reads (plot_lidar_filt_1D, plot_lidar_filt_stacked): one chunk per grid point - #
+    # - (virtual stations: one chunk per measurement, dims night, step, level) - #
+    'station-column': {'zlib': True,  'complevel': 4, 'shuffle': True,
+                       'chunks': {'latitude': 1, 'longitude': 1, 'time': 48, 'night': 1, 'level': -1},
+                       'dim_order': ('latitude','longitude','time','night','step','level')},
+    # - lat/lon (and lon/z) cross sections per time step (composition plots) - #
+    'cross-section' : {'zlib': True,  'complevel': 4, 'shuffle': True,
+                       'chunks': {'time': 1, 'level': 16, 'latitude': -1, 'longitude': -1},
+                       'dim_order': canonical_dims},
+}
+
+# - Packed int16 (scale_factor/add_offset): valid range and required precision per variable - #
+# - variables with range/65534 > precision stay float32 (p: 0.01 Pa near 70 km is not possible) - #
+PACKING = {
+    't'     : {'range': [100, 400],    'precision': 0.01}, # K    -> 0.0046 K
+    'p'     : {'range': [0, 110000],   'precision': 0.01}, # Pa   -> float32
+    'u'     : {'range': [-250, 250],   'precision': 0.01}, # m/s  -> 0.0076 m/s
+    'v'     : {'range': [-250, 250],   'precision': 0.01}, # m/s  -> 0.0076 m/s
+    'tprime': {'range': [-60, 60],     'precision': 0.01}, # K    -> 0.0018 K
+}
+pack_fill_value = np.int16(-32768)
+
+# - Time axis of all files (appended time steps are encoded with the units of the file, not of the first chunk) - #
+time_encoding = {'units': 'hours since 1900-01-01', 'calendar': 'proleptic_gregorian', 'dtype': 'float64'}
+
+
+def packing(var):
+    """scale_factor and add_offset of a variable (None if not packed)"""
+    if var not in PACKING:
+        return None
+    vmin, vmax = PACKING[var]['range']
+    scale = (vmax - vmin) / (2**16 - 2) # -32767...32767, -32768 is _FillValue
+    if scale > PACKING[var]['precision']:
+        return None
+    return {'dtype': 'int16', 'scale_factor': np.float32(scale), 'add_offset': np.float32((vmax + vmin) / 2),
+            '_FillValue': pack_fill_value}
+
+
+def clip_packed(ds):
+    """Clip packed variables to their valid range (no int16 overflow)"""
+    for var in ds.data_vars:
+        if packing(var) is not None:
+            ds[var] = ds[var].clip(*PACKING[var]['range'])
+    return ds
+
+
+def encoding(ds, profile, packed=False):
+    """Encoding of all data variables for an encoding profile (dims missing in the profile are not chunked) and of time"""
+    settings = ENCODING_PROFILES[profile]
+    enc = {}
+    for var in ds.data_vars:
+        enc[var] = {'zlib': settings['zlib']}
+        if packed and (packing(var) is not None):
+            enc[var].update(packing(var))
+        if settings['zlib']:
+            enc[var]['complevel'] = settings['complevel']
+            enc[var]['shuffle']   = settings['shuffle']
+        if (settings['chunks'] is not None) and (ds[var].ndim > 0):
+            # - time is unlimited, so time chunks may be longer than the data written first (appends) - #
+            chunks = [settings['chunks'].get(dim, -1) for dim in ds[var].dims]
+            enc[var]['chunksizes'] = tuple(ds.sizes[dim] if size <= 0 else (size if dim == 'time' else min(size, ds.sizes[dim]))
+                                           for size, dim in zip(chunks, ds[var].dims))
+    if 'time' in ds.coords:
+        enc['time'] = dict(time_encoding)
+    return enc
+
+
+def write_dataset(ds, path, profile='default', append=False, packed=False):
+    """Write dataset with an encoding profile (time is unlimited)
+        - append: add time steps to an existing file (written with the same profile, packing is taken from the file)
+        - packed: int16 with scale_factor/add_offset for variables in PACKING (decoded on read)
+    """
+    if packed:
+        ds = clip_packed(ds)
+    if is_zarr(path):
+        write_zarr(ds, path, profile, append, packed)
+        return
+    if not append:
+        order = [dim for dim in ENCODING_PROFILES[profile]['dim_order'] if dim in ds.dims]
+        ds = ds.transpose(*order, ...)
+        ds.attrs['encoding_profile'] = profile
+        ds.attrs['packed'] = int(packed)
+        ds.to_netcdf(path, unlimited_dims=['time'] if 'time' in ds.dims else None, encoding=encoding(ds, profile, packed))
+        return
+
+    with netCDF4.Dataset(path, 'a') as nc:
+        n = len(nc.dimensions['time'])
+        nt = ds.sizes['time']
+        times = nc['time']
+        dates = pd.to_datetime(ds['time'].values).to_pydatetime()
+        times[n:n+nt] = netCDF4.date2num(dates, times.units, getattr(times, 'calendar', 'standard'))
+        for var in ds.data_vars:
+            if 'time' not in ds[var].dims:
+                continue
+            dims  = nc[var].dimensions
+            index = tuple(slice(n, n+nt) if dim == 'time' else slice(None) for dim in dims)
+            values = ds[var].transpose(*dims).values
+            invalid = np.isnan(values)
+            # - NaN -> _FillValue, masked values are set to 0 first (no NaN cast when netCDF4 packs the data) - #
+            nc[var][index] = np.ma.array(np.where(invalid, 0, values), mask=invalid)
+
+
+def write_zarr(ds, path, profile='default', append=False, packed=False):
+    """Write dataset to a Zarr store (consolidated metadata)
+        - append: add time steps that are not yet in the store (several measurements can share a store)
+        - writes are serialized by a lock file, so parallel workers can append to the same store
+    """
+    with store_lock(path):
+        if append and os.path.exists(path):
+            with xr.open_zarr(path, **zarr_options(path)) as ds_store:
+                new_times = ~np.isin(ds['time'].values, ds_store['time'].values)
+                order = list(ds_store[list(ds.data_vars)[0]].dims)
+            ds = ds.isel(time=new_times)
+            if ds.sizes['time'] > 0:
+                ds.transpose(*order, ...).to_zarr(path, append_dim='time', **zarr_options(path))
+            return
+
+        order = [dim for dim in ENCODING_PROFILES[profile]['dim_order'] if dim in ds.dims]
+        ds = ds.transpose(*order, ...)
+        ds.attrs['encoding_profile'] = profile
+        ds.attrs['packed'] = int(packed)
+        enc = {}
+        for var, var_enc in encoding(ds, profile, packed).items():
+            enc[var] = {key: value for key, value in var_enc.items() if key in ['dtype', 'scale_factor', 'add_offset', '_FillValue', 'units', 'calendar']}
+            if 'chunksizes' in var_enc:
+                enc[var]['chunks'] = var_enc['chunksizes']
+        ds.to_zarr(path, mode='w', encoding=enc, zarr_format=zarr_format, consolidated=True)
+
+
+def zarr_options(path):
+    """Format of an existing store (v3 stores of zarr-python 3 have zarr.json) with consolidated metadata"""
+    return {'zarr_format': 3 if os.path.exists(os.path.join(path, 'zarr.json')) else 2, 'consolidated': True}
+
+
+@contextlib.contextmanager
+def store_lock(path):
+    """Exclusive lock of a store (lock file next to it)"""
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_zarr(path):
+    return path.rstrip('/').endswith('.zarr')
+
+
+def backend_path(path, backend):
+    """Replace the extension of path (.nc/.zarr) by the one of the backend ('netcdf', 'zarr')"""
+    return os.path.splitext(path.rstrip('/'))[0] + extensions[backend]
+
+
+def find(path):
+    """Existing file of path with any backend extension (None if not available)"""
+    for backend in extensions:
+        if os.path.exists(backend_path(path, backend)):
+            return backend_path(path, backend)
+    return None
+
+
+def remove(path):
+    """Remove file or store"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def convert(path_src, path_dst, profile='default', packed=False, append=True):
+    """Write a (downloaded) NetCDF file to another file or store, e.g. -pl.nc into a day store -pl.zarr"""
+    with xr.open_dataset(path_src) as ds_file:
+        ds = ds_file.load()
+    for var in ds.variables:
+        ds[var].encoding = {key: value for key, value in ds[var].encoding.items() if key in ['units', 'calendar']}
+    write_dataset(ds, path_dst, profile, append=(append and os.path.exists(path_dst)), packed=packed)
+
+
+def link(path_src, path_link):
+    """Relative symbolic link (e.g. measurement name -> shared day store)"""
+    if os.path.abspath(path_src) == os.path.abspath(path_link) or os.path.lexists(path_link):
+        return
+    os.symlink(os.path.relpath(path_src, os.path.dirname(os.path.abspath(path_link))), path_link)
+
+
+def era5_file(config, nc_file_name, start_date, product):
+    """Path of an ERA5 product (e.g. '-ml-int') of a measurement in OUTPUT ERA5-FOLDER
+        - netcdf: <nc_file_name><product>.nc
+        - zarr:   day store <YYYYMMDD><product>.zarr of the ERA5 request date (start_date), shared by all
+                  measurements of that date (measurements are linked to it with link_era5_file)
+    """
+    backend = config.get("ERA5", "BACKEND", fallback="netcdf")
+    if backend == "zarr":
+        return os.path.join(config.get("OUTPUT","ERA5-FOLDER"), start_date.strftime("%Y%m%d") + product + extensions[backend])
+    return os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + product + extensions[backend])
+
+
+def link_era5_file(config, nc_file_name, start_date, product):
+    """Link measurement name to the (shared) ERA5 file, so readers find <nc_file_name><product> with any backend"""
+    path = era5_file(config, nc_file_name, start_date, product)
+    if os.path.exists(path):
+        link(path, os.path.join(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name + product + os.path.splitext(path)[1]))
+
+
+def era5_available(config, nc_file_name, start_date, product):
+    """ERA5 product of a measurement already prepared: file of era5_file or consolidated (era5-index.csv of OUTPUT ERA5-FOLDER)"""
+    if os.path.exists(era5_file(config, nc_file_name, start_date, product)):
+        return True
+    paths, _ = era5_paths(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name, product)
+    return len(paths) > 0
+
+
+def open_era5_file(config, nc_file_name, start_date, product):
+    """ERA5 product of a measurement from the file of era5_file or the consolidated files (None if not available)"""
+    path = era5_file(config, nc_file_name, start_date, product)
+    if os.path.exists(path):
+        return open_dataset(path)
+    return open_era5(config.get("OUTPUT","ERA5-FOLDER"), nc_file_name, product)
+
+
+def era5_index_file(folder):
+    return os.path.join(folder, "era5-index.csv")
+
+
+def read_era5_index(folder):
+    """Index of consolidated ERA5 data (night, product, start, end), empty if nothing is consolidated"""
+    if not os.path.exists(era5_index_file(folder)):
+        return pd.DataFrame(columns=['night', 'product', 'start', 'end'])
+    return pd.read_csv(era5_index_file(folder), parse_dates=['start', 'end'], dtype={'night': str})
+
+
+def era5_paths(folder, night, product):
+    """Files holding an ERA5 product of a measurement -> paths, (start, end) (None if per-night file), [] if not available"""
+    path = find(os.path.join(folder, night + product + '.nc'))
+    if path is not None:
+        return [path], None
+
+    index = read_era5_index(folder)
+    entry = index[(index['night'] == night) & (index['product'] == product)]
+    if len(entry) == 0:
+        return [], None
+    start, end = entry['start'].iloc[0], entry['end'].iloc[0]
+    paths = [find(os.path.join(folder, str(month) + product + '.nc')) for month in pd.period_range(start, end, freq='M')]
+    if any(path is None for path in paths):
+        return [], None
+    return paths, (start, end)
+
+
+def open_era5(folder, night, product):
+    """ERA5 product (e.g. '-ml-int') of a measurement (night: file_name[0:13]), None if not available
+        - per-night file (.nc/.zarr) or time range of the measurement in the monthly files (consolidate_era5.py)
+    """
+    paths, timeframe = era5_paths(folder, night, product)
+    if len(paths) == 0:
+        return None
+    if timeframe is None:
+        return open_dataset(paths[0])
+    ds_list = [open_dataset(path).sel(time=slice(*timeframe)) for path in paths]
+    return ds_list[0] if len(ds_list) == 1 else xr.concat(ds_list, dim='time')
+
+
+def fingerprint(path):
+    """Identity of a file or zarr store (path, size and modification time)
+        - zarr: of the root metadata (v3: zarr.json, v2: .zmetadata), of the store directory if neither exists
+    """
+    path = os.path.realpath(path)
+    stat_path = path
+    if is_zarr(path):
+        metadata = [os.path.join(path, name) for name in ['zarr.json', '.zmetadata'] if os.path.exists(os.path.join(path, name))]
+        stat_path = metadata[0] if len(metadata) > 0 else path
+    stat = os.stat(stat_path)
+    return "{}:{}:{}".format(path, stat.st_size, stat.st_mtime_ns)
+
+
+def era5_nights(folder, product):
+    """Measurements (file_name[0:13]) with ERA5 product available (per-night files and consolidated index)"""
+    nights = [os.path.split(path)[-1][0:13] for path in glob.glob(os.path.join(folder, "*" + product + ".*"))
+              if re.match(r'^\d{8}-\d{4}' + product + r'\.(nc|zarr)$', os.path.split(path)[-1])]
+    index = read_era5_index(folder)
+    return sorted(set(nights) | set(index['night'][index['product'] == product]))
+
+
+def open_dataset(path, **kwargs):
+    """Open dataset written with any encoding profile and backend (dims in canonical order, lazy transpose)"""
+    if is_zarr(path):
+        ds = xr.open_zarr(path, **zarr_options(path), **kwargs)
+    else:
+        ds = xr.open_dataset(path, **kwargs)
+    order = [dim for dim in canonical_dims if dim in ds.dims]
+    return ds.transpose(*order, ...)
+
+
+def rewrite(path, profile, packed=False):
+    """Rewrite an existing file with another encoding profile (and packing)"""
+    with open_dataset(path) as ds_file:
+        ds = ds_file.load()
+    for var in ds.variables:
+        ds[var].encoding = {key: value for key, value in ds[var].encoding.items() if key in ['units', 'calendar']}
+    root, ext = os.path.splitext(path.rstrip('/'))
+    tmp_path = root + '.tmp' + ext # same backend as path
+    write_dataset(ds, tmp_path, profile, packed=packed)
+    if is_zarr(path):
+        remove(path) # a store (directory) cannot be replaced by rename
+        remove(tmp_path + '.lock')
+    os.replace(tmp_path, path.rstrip('/'))
+
+
+def size(path):
+    """Size of a file or store (sum of the files in the store) in bytes"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+if __name__ == '__main__':
+    """Rewrite files with an encoding profile"""
+
+    """Example:
+        >> python3 storage.py station-column True /export/data/era5-profiles/*-ml-int.nc
+    """
+
+    profile = sys.argv[1]
+    packed  = sys.argv[2].lower().capitalize() == "True"
+    if profile not in ENCODING_PROFILES:
+        print(f"[i]  Unknown profile: {profile} ({', '.join(ENCODING_PROFILES)})")
+        sys.exit(1)
+    for path in sys.argv[3:]:
+        size_old = size(path)
+        rewrite(path, profile, packed)
+        print(f"[i]  {os.path.split(path.rstrip('/'))[-1]}: {size_old/1024**2:.1f} MB -> {size(path)/1024**2:.1f} MB ({profile}, packed: {packed})")
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import types
+import datetime
+import threading
+import configparser
+
+import numpy as np
+import pytest
+import xarray as xr
+
+"""Modules are run from src (flat imports, paths relative to src, e.g. ../input/era5-ml-coeff.csv)"""
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, SRC)
+
+
+@pytest.fixture(autouse=True)
+def src_working_directory(monkeypatch):
+    monkeypatch.chdir(SRC)
+
+
+@pytest.fixture
+def pbar():
+    """Progress bar state of a single task (no multiprocessing manager)"""
+    return {'progress_counter': types.SimpleNamespace(value=0), 'lock': threading.Lock(), 'stime': time.time(), 'ntasks': 1}
+
+
+@pytest.fixture
+def lidar_config(tmp_path):
+    """Config of an instrument with observations in tmp_path/obs (fine T15Z900, background T120Z900)"""
+    config = configparser.ConfigParser()
+    config.read_dict({'GENERAL': {'INSTRUMENT': 'CORAL', 'RESOLUTION': '*T15Z900.nc', 'RESOLUTION_BG': '*T120Z900.nc',
+                                  'TIMEFRAME_NIGHT': '[17,13]', 'CONTENT': 'test'},
+                      'INPUT'  : {'OBS_FOLDER': str(tmp_path / 'obs'), 'OBS_FILE': 'NONE'},
+                      'OUTPUT' : {'FOLDER': str(tmp_path / 'out')}})
+    os.makedirs(config.get("INPUT","OBS_FOLDER"), exist_ok=True)
+    return config
+
+
+@pytest.fixture
+def write_lidar_obs(lidar_config):
+    """Writer of raw lidar files (time in ms after time_offset, T = 0 for missing bins)
+        - temperature(time_h, alt_km) -> K, time_h in hours after start
+    """
+    def write(night, temperature, n_time=48, tres=15, vres=100, suffix='T15Z900', err=0.1):
+        start = datetime.datetime.strptime(night, '%Y%m%d-%H%M')
+        time  = np.arange(n_time) * tres * 60 * 1000.
+        alt   = np.arange(0, 90000, vres, dtype=float)
+        temp  = temperature(time[:,np.newaxis] / 3.6e6, alt[np.newaxis,:] / 1000) * np.ones((n_time, 1))
+        temp[:, alt < 10000] = 0
+        ds = xr.Dataset({'temperature'    : (('time','altitude'), temp),
+                         'temperature_err': (('time','altitude'), np.full(temp.shape, err)),
+                         'time_offset'    : ((), (start - datetime.datetime(1970,1,1)).total_seconds()),
+                         'altitude_offset': ((), 0.), 'station_height': ((), 0.)},
+                        coords={'time': time, 'altitude': alt})
+        path = os.path.join(lidar_config.get("INPUT","OBS_FOLDER"), night + '_' + suffix + '.nc')
+        ds.to_netcdf(path)
+        return path
+    return write
@@ -0,0 +1,58 @@
+import numpy as np
+
+import climatology
+
+
+def synthetic_batch(seed, n=200, n_alt=15):
+    rng    = np.random.default_rng(seed)
+    values = 230 + 5 * rng.standard_normal((n, n_alt))
+    values[rng.random(values.shape) < 0.2] = np.nan
+    hours  = rng.integers(0, 24, n)
+    return values, hours
+
+
+def direct_statistics(values, hours, hour):
+    rows = values[hours == hour]
+    return np.nanmean(rows, axis=0), np.nanstd(rows, axis=0, ddof=1)
+
+
+def test_merge_matches_statistics_of_all_values():
+    coords = {'hour': np.arange(24), 'alt': np.arange(15)}
+    batches = [synthetic_batch(seed) for seed in range(3)]
+    acc = None
+    for values, hours in batches:
+        acc = climatology.merge(acc, climatology.accumulator(values, hours, coords, 'temperature'))
+    acc = climatology.finalize(acc)
+
+    values = np.concatenate([values for values, _ in batches])
+    hours  = np.concatenate([hours for _, hours in batches])
+    for hour in [0, 7, 23]:
+        mean, std = direct_statistics(values, hours, hour)
+        np.testing.assert_allclose(acc['temperature'].sel(hour=hour).values, mean, rtol=1e-12)
+        np.testing.assert_allclose(acc['temperature_std'].sel(hour=hour).values, std, rtol=1e-10)
+        np.testing.assert_array_equal(acc['temperature_count'].sel(hour=hour).values, np.sum(~np.isnan(values[hours == hour]), axis=0))
+
+
+def test_merge_outer_aligns_grids():
+    values_a, hours_a = synthetic_batch(4)
+    values_b, hours_b = synthetic_batch(5)
+    acc_a = climatology.accumulator(values_a, hours_a, {'hour': np.arange(24), 'alt': np.arange(15)}, 'temperature')
+    acc_b = climatology.accumulator(values_b, hours_b, {'hour': np.arange(24), 'alt': np.arange(5, 20)}, 'temperature')
+    acc   = climatology.finalize(climatology.merge(acc_a, acc_b))
+    assert acc.sizes['alt'] == 20
+
+    values = np.full((len(values_a) + len(values_b), 20), np.nan)
+    values[:len(values_a), :15] = values_a
+    values[len(values_a):, 5:20] = values_b
+    hours  = np.concatenate([hours_a, hours_b])
+    mean, std = direct_statistics(values, hours, 12)
+    np.testing.assert_allclose(acc['temperature'].sel(hour=12).values, mean, rtol=1e-12)
+    np.testing.assert_allclose(acc['temperature_std'].sel(hour=12).values, std, rtol=1e-10)
+
+
+def test_collapse_matches_statistics_of_all_hours():
+    values, hours = synthetic_batch(6)
+    acc = climatology.accumulator(values, hours, {'hour': np.arange(24), 'alt': np.arange(15)}, 'temperature')
+    acc = climatology.finalize(climatology.collapse(acc, 'hour'))
+    np.testing.assert_allclose(acc['temperature'].values, np.nanmean(values, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(acc['temperature_std'].values, np.nanstd(values, axis=0, ddof=1), rtol=1e-10)
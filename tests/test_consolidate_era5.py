@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import consolidate_era5
+import storage
+
+NIGHTS = ['20180629-2203', '20180630-2230', '20180701-2315'] # overlapping by a day, across a month
+
+
+def night_dataset(night):
+    """Hourly ERA5 data of the night's date and the next day (48 h, values depend on time only)"""
+    time  = pd.date_range(pd.Timestamp(night[0:8]), periods=48, freq='h')
+    hours = (time - pd.Timestamp('2018-06-01')) / pd.Timedelta(hours=1)
+    level = np.arange(4) * 400.
+    return xr.Dataset({'t': (('time','level'), 200 + hours.values[:,np.newaxis] + level[np.newaxis,:] / 1000)},
+                      coords={'time': time, 'level': level})
+
+
+@pytest.fixture
+def era5_folder(tmp_path):
+    folder = tmp_path / 'era5-region'
+    folder.mkdir()
+    for night in NIGHTS:
+        for product in ['-ml-int', '-pl']:
+            storage.write_dataset(night_dataset(night), str(folder / (night + product + '.nc')))
+    config_file = tmp_path / 'test.ini'
+    config_file.write_text("[OUTPUT]\nFOLDER = {}\n\n[ERA5]\nBACKEND = netcdf\n".format(tmp_path))
+    return str(config_file), str(folder)
+
+
+def test_consolidated_nights_open_unchanged(era5_folder):
+    config_file, folder = era5_folder
+    before = {night: storage.open_era5(folder, night, '-ml-int').load() for night in NIGHTS}
+
+    consolidate_era5.consolidate_era5(config_file, 'era5-region')
+    assert sorted(os.listdir(folder)) == ['2018-06-ml-int.nc', '2018-06-pl.nc', '2018-07-ml-int.nc', '2018-07-pl.nc', 'era5-index.csv']
+
+    hours = []
+    for month in ['2018-06', '2018-07']:
+        with storage.open_dataset(os.path.join(folder, month + '-ml-int.nc')) as ds_month:
+            hours.append(ds_month['time'].values)
+    hours = np.concatenate(hours)
+    assert np.all(np.diff(hours) == np.timedelta64(1, 'h')) # duplicate hours removed, time order kept
+    assert len(hours) == 4 * 24
+
+    for night in NIGHTS:
+        with storage.open_era5(folder, night, '-ml-int') as ds_night:
+            xr.testing.assert_identical(ds_night.load().drop_attrs(), before[night].drop_attrs())
+
+
+def test_per_night_files_kept_if_hours_are_missing(era5_folder, monkeypatch):
+    config_file, folder = era5_folder
+    monkeypatch.setattr(consolidate_era5, 'consolidate_month', lambda month, monthly_file, *args: None)
+    with pytest.raises(RuntimeError):
+        consolidate_era5.consolidate_era5(config_file, 'era5-region')
+    assert all(os.path.exists(os.path.join(folder, night + '-ml-int.nc')) for night in NIGHTS)
+    assert not os.path.exists(storage.era5_index_file(folder))
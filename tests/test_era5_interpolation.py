@@ -0,0 +1,100 @@
+import numpy as np
+import xarray as xr
+
+import era5_processor
+
+
+def test_interpolation_weights_match_np_interp():
+    rng   = np.random.default_rng(0)
+    z     = np.cumsum(rng.uniform(50, 500, (2, 3, 4, 40)), axis=-1) # (time, lat, lon, level) increasing
+    data  = rng.standard_normal((2,) + z.shape)                     # (var, time, lat, lon, level)
+    z_new = era5_processor.z_new
+
+    lo, w  = era5_processor.interpolation_weights(z, z_new)
+    interp = era5_processor.apply_interpolation_weights(data, lo, w)
+    for idx in np.ndindex(z.shape[:-1]):
+        for k in range(len(data)):
+            np.testing.assert_allclose(interp[(k,) + idx], np.interp(z_new, z[idx], data[(k,) + idx]), rtol=1e-12, atol=1e-12)
+
+
+def test_interpolation_weights_per_column_targets():
+    rng   = np.random.default_rng(1)
+    z     = np.cumsum(rng.uniform(0.5, 2, (5, 30)), axis=-1)
+    z_new = np.sort(rng.uniform(-1, 50, (5, 12)), axis=-1) # including values outside of the columns
+    data  = rng.standard_normal(z.shape)
+    interp = era5_processor.apply_interpolation_weights(data, *era5_processor.interpolation_weights(z, z_new))
+    for col in range(len(z)):
+        np.testing.assert_allclose(interp[col], np.interp(z_new[col], z[col], data[col]), rtol=1e-12, atol=1e-12)
+
+
+def synthetic_grid(seed=2):
+    """ERA5-like grid (latitude descending) with two variables"""
+    rng  = np.random.default_rng(seed)
+    lat  = np.arange(-48, -53.25, -0.25)
+    lon  = np.arange(288, 293.25, 0.25)
+    dims = ['time','level','latitude','longitude']
+    shape = (3, 5, len(lat), len(lon))
+    return xr.Dataset({'t': (dims, 250 + rng.standard_normal(shape)), 'u': (dims, rng.standard_normal(shape))},
+                      coords={'time': np.arange(3), 'level': np.arange(5), 'latitude': lat, 'longitude': lon})
+
+
+def test_station_bilinear_matches_xarray_interp():
+    ds = synthetic_grid()
+    for station in [(-50.4, 290.6), (-50.5, 290.6), (-50.4, 290.75), (-50.5, 290.75)]: # off grid, on grid lines, on grid point
+        ds_station = era5_processor.interp_station(ds, station, 'bilinear')
+        ds_ref     = ds.interp(latitude=station[0], longitude=station[1])
+        for var in ['t', 'u']:
+            np.testing.assert_allclose(ds_station[var].values, ds_ref[var].values, rtol=1e-12)
+        assert float(ds_station['latitude']) == station[0]
+
+
+def test_station_idw_weights():
+    ds = synthetic_grid()
+    lat_window, lon_window, w = era5_processor.station_weights(ds, (-50.4, 290.6), 'idw')
+    assert w.shape == (2, 2) and np.isclose(w.sum(), 1)
+    assert np.unravel_index(np.argmax(w), w.shape) == (1, 0) # nearest grid point (-50.5, 290.5) of the window [-50.25, -50.5] x [290.5, 290.75]
+
+
+def test_interp_slice_matches_xarray_interp():
+    ds = synthetic_grid()
+    for dim, x in [('latitude', -50.4), ('latitude', -50.5), ('longitude', 290.6)]:
+        np.testing.assert_allclose(era5_processor.interp_slice(ds['t'], dim, x).values, ds['t'].interp({dim: x}).values, rtol=1e-12)
+
+
+def test_interp_to_lidar_grid_matches_xarray_interp():
+    rng = np.random.default_rng(3)
+    era5_time = np.arange('2018-06-16T18', '2018-06-17T08', dtype='datetime64[h]').astype('datetime64[ns]')
+    era5_alt  = np.arange(0, 70001, 400.)
+    ds_era5 = xr.Dataset({var: (('time','level'), rng.standard_normal((len(era5_time), len(era5_alt)))) for var in ['t','u']},
+                         coords={'time': era5_time, 'level': era5_alt})
+    time = np.arange('2018-06-16T22:03', '2018-06-17T08:30', 15, dtype='datetime64[m]').astype('datetime64[ns]') # ends after ERA5
+    alt  = np.arange(15, 95, 0.15) # km, above ERA5 top
+
+    out = era5_processor.interp_to_lidar_grid(ds_era5, time, alt, ['t','u'])
+    ds_ref = ds_era5.interp(time=time, level=alt * 1000)
+    for var in ['t','u']:
+        np.testing.assert_allclose(out[var], ds_ref[var].values, rtol=1e-10, atol=1e-12)
+        assert np.isnan(out[var][-1,:]).all() and np.isnan(out[var][:,-1]).all()
+
+
+def test_linear_weights_are_shared_and_read_only():
+    lo, w = era5_processor.linear_weights((0., 1., 3.), (0.5, 2., 4.))
+    np.testing.assert_array_equal(lo[:2], [0, 1])
+    np.testing.assert_allclose(w, [0.5, 0.5, np.nan])
+    assert era5_processor.linear_weights((0., 1., 3.), (0.5, 2., 4.))[0] is lo
+    assert not lo.flags.writeable and not w.flags.writeable
+
+
+def test_extract_stations_matches_interp_station():
+    ds = synthetic_grid()
+    ds['t2m'] = ds['t'].isel(level=0) # without level
+    stations, names = [(-50.4, 290.6), (-50.5, 290.75), (-48.1, 292.9)], ['A', 'B', 'C']
+    for method in ['bilinear', 'idw']:
+        for memory_budget in [1e-6, 1e3]: # one time step per chunk, one chunk
+            ds_stations = era5_processor.extract_stations(ds, stations, names, method, memory_budget)
+            for name, station in zip(names, stations):
+                ds_ref = era5_processor.interp_station(ds, station, method)
+                for var in ['t', 'u', 't2m']:
+                    np.testing.assert_allclose(ds_stations[var].sel(station=name).transpose(*ds_ref[var].dims).values,
+                                               ds_ref[var].values, rtol=1e-12)
+                assert float(ds_stations['latitude'].sel(station=name)) == station[0]
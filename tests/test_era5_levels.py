@@ -0,0 +1,59 @@
+import numpy as np
+import xarray as xr
+
+import era5_processor
+
+
+def synthetic_model_levels(seed=0, shape=(2, 137, 3, 4)):
+    """Model level dataset (time, level, lat, lon) with t, q, surface geopotential z and lnsp"""
+    rng  = np.random.default_rng(seed)
+    t    = np.linspace(230, 290, shape[1])[np.newaxis,:,np.newaxis,np.newaxis] + rng.standard_normal(shape)
+    q    = 1e-3 * rng.random(shape)
+    z    = np.zeros(shape)
+    z[:,0,:,:] = 9.80665 * rng.uniform(0, 2000, (shape[0],) + shape[2:])
+    lnsp = np.log(rng.uniform(80000, 103000, (shape[0],) + shape[2:]))
+    dims = ['time','level','latitude','longitude']
+    return xr.Dataset({'t': (dims, t), 'q': (dims, q), 'z': (dims, z)}), lnsp
+
+
+def pressure_levels_loop(lnsp):
+    """Half level pressure a + b*sp and full level mean of the baseline"""
+    a, b   = era5_processor.ml_coefficients()
+    p_half = np.stack([a[i] + b[i] * np.exp(lnsp) for i in range(len(a))], axis=1)
+    p_full = np.stack([(p_half[:,i+1] + p_half[:,i]) / 2 for i in range(len(a)-1)], axis=1)
+    return p_half, p_full
+
+
+def compute_z_level_loop(t, q, z_s, p_half):
+    """Level by level integration of the baseline (from the surface to the top)"""
+    t_moist = t * (1. + 0.609133 * q)
+    z   = np.zeros(t.shape)
+    z_h = z_s.copy()
+    for i in range(t.shape[1]-1, 0, -1):
+        dlog_p = np.log(p_half[:,i+1] / p_half[:,i])
+        alpha  = 1. - ((p_half[:,i] / (p_half[:,i+1] - p_half[:,i])) * dlog_p)
+        t_level = t_moist[:,i] * era5_processor.Rd
+        z[:,i] = z_h + t_level * alpha
+        z_h    = z_h + t_level * dlog_p
+    z[:,0] = z_h + t_moist[:,0] * era5_processor.Rd * np.log(2)
+    return z
+
+
+def test_compute_z_level_matches_loop():
+    ds, lnsp  = synthetic_model_levels()
+    p_half, _ = era5_processor.pressure_levels(lnsp)
+    z_ref = compute_z_level_loop(ds['t'].values, ds['q'].values, ds['z'].values[:,0], p_half)
+    ds = era5_processor.compute_z_level(ds, p_half)
+    np.testing.assert_allclose(ds['z'].values, z_ref, rtol=1e-12)
+    np.testing.assert_allclose(ds['geop_height'].values, z_ref / era5_processor.g, rtol=1e-12)
+    assert np.all(np.diff(ds['geop_height'].values[:,::-1], axis=1) > 0)
+
+
+def test_pressure_levels_match_loop():
+    _, lnsp = synthetic_model_levels(seed=1)
+    p_half, p_full = era5_processor.pressure_levels(lnsp)
+    p_half_ref, p_full_ref = pressure_levels_loop(lnsp)
+    assert p_half.shape == (2, 138, 3, 4) and p_full.shape == (2, 137, 3, 4)
+    np.testing.assert_allclose(p_half, p_half_ref, rtol=1e-14)
+    np.testing.assert_allclose(p_full, p_full_ref, rtol=1e-14)
+    np.testing.assert_allclose(p_half[:,-1], np.exp(lnsp), rtol=1e-14)
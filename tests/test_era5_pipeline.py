@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import era5_processor
+import storage
+
+
+def synthetic_ml_file(path, seed, n_time=5, shape=(137, 3, 4)):
+    """ERA5 model level file (t, q, u, v, z and lnsp on all levels, hourly), time encoded in days of the first step"""
+    rng  = np.random.default_rng(seed)
+    dims = ['time','level','latitude','longitude']
+    full = (n_time,) + shape
+    t    = np.linspace(200, 290, shape[0])[np.newaxis,:,np.newaxis,np.newaxis] + rng.standard_normal(full)
+    z    = np.zeros(full)
+    z[:,0,:,:] = 9.80665 * rng.uniform(0, 500, (n_time,) + shape[1:])
+    lnsp = np.broadcast_to(np.log(rng.uniform(95000, 103000, (n_time, 1) + shape[1:])), full).copy()
+    time = pd.date_range('2018-06-16T18', periods=n_time, freq='h')
+    ds = xr.Dataset({'t': (dims, t), 'q': (dims, 1e-3 * rng.random(full)), 'u': (dims, 10 * rng.standard_normal(full)),
+                     'v': (dims, 10 * rng.standard_normal(full)), 'z': (dims, z), 'lnsp': (dims, lnsp)},
+                    coords={'time': time, 'level': np.arange(1, shape[0]+1),
+                            'latitude': [-50., -50.25, -50.5], 'longitude': [290., 290.25, 290.5, 290.75]})
+    ds.to_netcdf(path, encoding={'time': {'units': 'days since 2018-06-16 18:00:00', 'dtype': 'float64'}})
+
+
+def process(tmp_path, name, memory_budget):
+    files = {'file_ml_int': str(tmp_path / (name + '-ml-int.nc')), 'file_station': str(tmp_path / (name + '-ml-station.nc'))}
+    era5_processor.process_ml_files(str(tmp_path / 'ml.nc'), file_ml_T21=str(tmp_path / 'ml-T21.nc'), memory_budget=memory_budget,
+                                    profile='cross-section', station=(-50.1, 290.6), **files)
+    return {key: storage.open_dataset(path).load() for key, path in files.items()}
+
+
+def test_chunked_outputs_match_single_pass(tmp_path):
+    synthetic_ml_file(tmp_path / 'ml.nc', seed=0)
+    synthetic_ml_file(tmp_path / 'ml-T21.nc', seed=1)
+    with xr.open_dataset(tmp_path / 'ml.nc') as ds:
+        step_mb = era5_processor.ml_fields_per_step * ds.sizes['level'] * ds.sizes['latitude'] * ds.sizes['longitude'] * 8 / 1024**2
+        time = ds['time'].values
+
+    single = process(tmp_path, 'single', 1000)
+    for chunk in [1, 2]:
+        chunked = process(tmp_path, 'chunk{}'.format(chunk), step_mb * (chunk + 0.5))
+        for key in single:
+            np.testing.assert_array_equal(chunked[key]['time'].values, time)
+            assert chunked[key]['time'].encoding['units'] == storage.time_encoding['units']
+            xr.testing.assert_identical(chunked[key], single[key])
+    assert set(single['file_station'].data_vars) == {'t', 'p', 'u', 'v', 'tprime'}
+
+
+def test_appended_time_steps_without_source_encoding(tmp_path):
+    rng  = np.random.default_rng(2)
+    time = pd.date_range('2018-06-16T18', periods=4, freq='h')
+    ds   = xr.Dataset({'t': (('time','level'), 250 + rng.standard_normal((4, 5)))}, coords={'time': time, 'level': np.arange(5) * 400.})
+    for profile in ['default', 'station-column']:
+        path = str(tmp_path / (profile + '.nc'))
+        for t0 in range(4):
+            era5_processor.write_ml_int(ds.isel(time=[t0]), path, append=(t0 > 0), profile=profile)
+        with storage.open_dataset(path) as ds_file:
+            np.testing.assert_array_equal(ds_file['time'].values, time.values)
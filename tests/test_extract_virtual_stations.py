@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import extract_virtual_stations
+import storage
+
+
+def station_night(night, start, n_time, seed):
+    """Columns of two stations of one measurement as returned by extract_stations"""
+    rng  = np.random.default_rng(seed)
+    dims = ('station','time','level')
+    shape = (2, n_time, 4)
+    ds = xr.Dataset({var: (dims, rng.uniform(200, 280, shape)) for var in ['t', 'tprime']},
+                    coords={'station': ['CORAL', 'RIO'], 'latitude': ('station', [-53.8, -53.9]),
+                            'longitude': ('station', [292.2, 292.3]),
+                            'time': pd.date_range(start, periods=n_time, freq='h'), 'level': np.arange(4) * 400.})
+    return extract_virtual_stations.night_columns(ds, night), ds
+
+
+def test_write_stations_one_dataset_per_station(tmp_path):
+    ds_a, ref_a = station_night('20180616-2200', '2018-06-16T18', 6, 0)
+    ds_b, ref_b = station_night('20180617-2130', '2018-06-17T18', 5, 1)
+    ds_c, ref_c = station_night('20180615-2300', '2018-06-15T18', 6, 2)
+    names = ['CORAL', 'RIO']
+    extract_virtual_stations.write_stations(str(tmp_path), names, [ds_b, ds_a])
+    assert extract_virtual_stations.station_nights(str(tmp_path), names) == {'20180616-2200', '20180617-2130'}
+    extract_virtual_stations.write_stations(str(tmp_path), names, [ds_c]) # later measurement of an earlier night
+
+    assert sorted(os.listdir(tmp_path)) == ['coral.nc', 'rio.nc']
+    for name in names:
+        path = extract_virtual_stations.station_file(str(tmp_path), name)
+        with xr.open_dataset(path) as ds_file:
+            assert ds_file['t'].dims == ('night', 'step', 'level') # one chunk per measurement
+        with storage.open_dataset(path) as ds_station:
+            assert list(ds_station['night'].values) == ['20180615-2300', '20180616-2200', '20180617-2130']
+            for night, ref in [('20180615-2300', ref_c), ('20180616-2200', ref_a), ('20180617-2130', ref_b)]:
+                ds_night = ds_station.sel(night=night).dropna('step', how='all')
+                np.testing.assert_array_equal(ds_night['time'].values, ref['time'].values)
+                np.testing.assert_allclose(ds_night['t'].transpose('step', 'level').values, ref['t'].sel(station=name).values, rtol=1e-6)
+            assert np.isnan(ds_station['t'].sel(night='20180617-2130', step=5)).all() # shorter night padded
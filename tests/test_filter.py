@@ -0,0 +1,58 @@
+import numpy as np
+from scipy import signal
+
+import filter
+
+
+def filter_columns_loop(b, a, data):
+    """Per-column filter of the baseline (mirrored, filtfilt, NaNs skipped, columns with < 10 values passed through)"""
+    out = np.full(data.shape, np.nan)
+    for col, column in enumerate(data):
+        mask = np.isnan(column)
+        c_masked = column[~mask]
+        if len(c_masked) >= 10:
+            c_mirrored = np.append(np.flip(c_masked, axis=0), c_masked, axis=0)
+            c_filtered = signal.filtfilt(b, a, c_mirrored, axis=0)[len(c_masked):]
+            column_out = column.copy()
+            column_out[~mask] = c_filtered
+            out[col,:] = column_out
+        else:
+            out[col,:] = column
+    return out
+
+
+def gappy_field(seed=0, shape=(40, 120)):
+    """Time-height like field with shared and individual NaN patterns (bottom/top cuts, gaps, empty columns)"""
+    rng  = np.random.default_rng(seed)
+    data = 220 + np.cumsum(rng.standard_normal(shape), axis=1)
+    data[:, :15] = np.nan
+    data[::3, 100:] = np.nan
+    data[5, 40:47] = np.nan
+    data[7, :] = np.nan
+    data[9, 20:] = np.nan # only 5 values
+    return data
+
+
+def test_filter_columns_matches_loop():
+    b, a = filter.butter_highpass(1/15, 1/0.1, order=5)
+    data = gappy_field()
+    np.testing.assert_allclose(filter.filter_columns(b, a, data), filter_columns_loop(b, a, data), rtol=0, atol=1e-9)
+
+
+def test_butterworth_filter_matches_loop():
+    data = gappy_field(seed=1)
+    pert, bg = filter.butterworth_filter(data, cutoff=1/15, fs=1/0.1, order=5, mode='both')
+    b, a = filter.butter_lowpass(1/15, 1/0.1, order=5)
+    np.testing.assert_allclose(bg, filter_columns_loop(b, a, data), rtol=0, atol=1e-9)
+    b, a = filter.butter_highpass(1/15, 1/0.1, order=5)
+    np.testing.assert_allclose(pert, filter_columns_loop(b, a, data), rtol=0, atol=1e-9)
+
+
+def test_filter_columns_stack_matches_single_matrices():
+    b, a = filter.butter_highpass(1/15, 1/0.1, order=5)
+    data = gappy_field(seed=2)
+    noise = np.random.default_rng(3).standard_normal((5,) + data.shape)
+    stack = data[np.newaxis] + noise # NaN pattern shared by all realizations
+    out = filter.filter_columns(b, a, stack)
+    for k in range(len(stack)):
+        np.testing.assert_allclose(out[k], filter_columns_loop(b, a, stack[k]), rtol=0, atol=1e-9)
@@ -0,0 +1,81 @@
+import configparser
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import lidar_processor
+
+
+def lidar_measurement(temperature, err, vres=1.):
+    """Lidar measurement (time, altitude) with alt_plot from 10 km, 15 min resolution"""
+    n_time, n_alt = temperature.shape
+    ds = xr.Dataset({'temperature': (('time','altitude'), temperature), 'temperature_err': (('time','altitude'), err)},
+                    coords={'time': pd.date_range('2018-06-16T22', periods=n_time, freq='15min'), 'altitude': np.arange(n_alt) * vres * 1000})
+    ds['alt_plot'] = (ds.altitude + 10000) / 1000
+    return ds
+
+
+def test_quality_control_flags_one_bin_per_type():
+    temp = np.full((4, 40), 230.)
+    err  = np.ones((4, 40))
+    temp[0,:]  = 400.; err[0,10] = 16.   # err > 15 K, err/T = 0.04
+    err[1,10]  = 12.                       # err/T = 0.052 > 0.05, err < 15 K
+    err[2,25]  = 12.                       # at 35 km: first noisy bin above 30 km -> top cut
+    temp[3,15] = 260.                      # 30 K above the rolling median
+
+    ds = lidar_processor.quality_control(configparser.ConfigParser(), lidar_measurement(temp.copy(), err.copy()))
+
+    expected = np.zeros((4, 40), dtype=np.uint8)
+    expected[0,10]  = lidar_processor.QC_ERR
+    expected[1,10]  = lidar_processor.QC_REL_ERR
+    expected[2,25:] = lidar_processor.QC_TOP
+    expected[2,25] |= lidar_processor.QC_REL_ERR
+    expected[3,15]  = lidar_processor.QC_SPIKE
+    np.testing.assert_array_equal(ds['qc_flags'].values, expected)
+
+    np.testing.assert_array_equal(np.isnan(ds['temperature'].values), expected != 0)
+    np.testing.assert_array_equal(np.isnan(ds['temperature_err'].values), expected != 0)
+    np.testing.assert_array_equal(ds['temperature'].values[expected == 0], temp[expected == 0])
+
+
+def test_quality_control_thresholds_from_config():
+    temp = np.full((1, 40), 230.)
+    err  = np.ones((1, 40))
+    err[0,10] = 12.
+    config = configparser.ConfigParser()
+    config.read_dict({'QC': {'REL_ERR_MAX': '0.1'}})
+    ds = lidar_processor.quality_control(config, lidar_measurement(temp, err))
+    assert not ds['qc_flags'].values.any()
+
+
+def energy_inputs(tbg, tprime, vres=1.):
+    ds = xr.Dataset({name + '_' + filt: (('t','z'), values) for name, values in [('tbg', tbg), ('tprime', tprime)] for filt in ['vbwf', 'tbwf']})
+    ds.attrs['vres'] = vres
+    return ds
+
+
+def test_calculate_energy_isothermal():
+    tbg    = np.full((3, 50), 240.)
+    tprime = np.full((3, 50), 2.)
+    ds = lidar_processor.calculate_energy(energy_inputs(tbg, tprime))
+    n2 = lidar_processor.g**2 / (lidar_processor.cp * 240.)
+    for filt in ['vbwf', 'tbwf']:
+        np.testing.assert_allclose(ds['N2_' + filt].values, n2, rtol=1e-12)
+        np.testing.assert_allclose(ds['epot_' + filt].values, 0.5 * lidar_processor.g**2 / n2 * (2. / 240.)**2, rtol=1e-12)
+
+
+def test_calculate_energy_constant_lapse_rate():
+    z      = np.arange(50.) # km
+    lapse  = 2. # K/km
+    tbg    = np.tile(260. - lapse * z, (3, 1))
+    tprime = np.tile(np.sin(2 * np.pi * z / 6), (3, 1))
+    ds = lidar_processor.calculate_energy(energy_inputs(tbg, tprime))
+    g, cp = lidar_processor.g, lidar_processor.cp
+    n2 = g / tbg * (-lapse / 1000 + g / cp)
+    np.testing.assert_allclose(ds['N2_vbwf'].values, n2, rtol=1e-12)
+    np.testing.assert_allclose(ds['epot_vbwf'].values, 0.5 * g**2 / n2 * (tprime / tbg)**2, rtol=1e-12)
+
+    # - superadiabatic background: no Ep - #
+    ds = lidar_processor.calculate_energy(energy_inputs(np.tile(700. - 12. * z, (3, 1)), tprime))
+    assert np.isnan(ds['N2_vbwf'].values).all() and np.isnan(ds['epot_vbwf'].values).all()
@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import lidar_pyramid
+
+NIGHTS = ['20180630-1803', '20180701-2017'] # first night crosses the month boundary
+
+
+def wave_field(time_h, alt_km):
+    return 240. - 0.5 * alt_km + 4 * np.sin(2 * np.pi * (alt_km / 7 - time_h / 5))
+
+
+@pytest.fixture
+def pyramid(lidar_config, write_lidar_obs, pbar):
+    """Pyramid of NIGHTS (first night flushed twice, as after an interrupted update)"""
+    folder = lidar_pyramid.pyramid_folder(lidar_config)
+    os.makedirs(folder)
+    tiles = [lidar_pyramid.night_tiles((lidar_config, write_lidar_obs(night, wave_field), pbar)) for night in NIGHTS]
+    for night, night_tiles in [tiles[0], tiles[0], tiles[1]]:
+        lidar_pyramid.flush_partitions(folder, {partition: [(night, ds)] for partition, ds in night_tiles.items()}, [night])
+    return folder
+
+
+def level_tiles(folder, level):
+    """All tiles of a level (partitions combined)"""
+    ds_level = None
+    for path in sorted(os.listdir(folder)):
+        if path.startswith('L{}-'.format(level)):
+            with xr.open_dataset(os.path.join(folder, path)) as ds_file:
+                ds_file = ds_file.drop_vars('night').load()
+            ds_level = ds_file if ds_level is None else lidar_pyramid.combine_tiles(ds_level, ds_file)
+    return ds_level
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_coarse_levels_are_block_means_of_level_0(pyramid):
+    ds_0 = level_tiles(pyramid, 0)
+    for level in range(1, lidar_pyramid.PYRAMID_LEVELS):
+        # - blocks of 2^level time tiles and 2^min(level, ALT_MAX_LEVEL) altitude tiles of level 0 - #
+        blocks = ds_0.assign_coords(time_tile=ds_0['time_tile'] >> level,
+                                    alt_tile=ds_0['alt_tile'] >> min(level, lidar_pyramid.ALT_MAX_LEVEL))
+        ds_l = level_tiles(pyramid, level)
+        for var in lidar_pyramid.PYRAMID_VARS:
+            block_sum   = blocks[var + '_sum'].groupby('time_tile').sum().groupby('alt_tile').sum()
+            block_count = blocks[var + '_count'].groupby('time_tile').sum().groupby('alt_tile').sum()
+            block_min   = blocks[var + '_min'].groupby('time_tile').min().groupby('alt_tile').min()
+            block_max   = blocks[var + '_max'].groupby('time_tile').max().groupby('alt_tile').max()
+            block_sum, block_count, block_min, block_max = [da.sel(time_tile=ds_l['time_tile'], alt_tile=ds_l['alt_tile'])
+                                                            for da in [block_sum, block_count, block_min, block_max]]
+            np.testing.assert_array_equal(ds_l[var + '_count'].values, block_count.values)
+            valid = block_count.values > 0
+            np.testing.assert_allclose((ds_l[var + '_sum'] / ds_l[var + '_count']).values[valid],
+                                       (block_sum / block_count).values[valid], rtol=1e-10)
+            np.testing.assert_allclose(ds_l[var + '_min'].values[valid], block_min.values[valid], rtol=1e-6)
+            np.testing.assert_allclose(ds_l[var + '_max'].values[valid], block_max.values[valid], rtol=1e-6)
+
+
+def test_partitions_and_nights(pyramid, lidar_config):
+    with open(os.path.join(pyramid, 'nights.txt')) as f:
+        assert sorted(set(f.read().split())) == NIGHTS
+    with xr.open_dataset(lidar_pyramid.partition_file(pyramid, 0, '2018-06')) as ds_june:
+        assert list(ds_june['night'].values) == NIGHTS[:1] # second flush of the night skipped
+        assert (lidar_pyramid.tile_times(ds_june['time_tile'].values, 0, 15).astype('datetime64[M]') == np.datetime64('2018-06')).all()
+    with xr.open_dataset(lidar_pyramid.partition_file(pyramid, 0, '2018-07')) as ds_july:
+        assert list(ds_july['night'].values) == NIGHTS
+        assert ds_july['temperature_count'].max() == 1 # every profile counted once
+
+    ds = lidar_pyramid.read_level(lidar_config, 0, '2018-06-30T18:00', '2018-07-01T06:00')
+    assert ds['time'].values[0] == np.datetime64('2018-06-30T18:07:30')
+    inner = ~np.isnan(ds['temperature'].values)
+    assert inner.sum() == 48 * np.sum(ds['alt'].values >= 10) # whole first night, no data below 10 km
+
+
+def test_select_level():
+    assert lidar_pyramid.select_level(15, '2018-06-30T18:00', '2018-07-01T06:00', 1000) == 0 # 48 steps
+    assert lidar_pyramid.select_level(15, '2018-01-01', '2018-02-01', 1000) == 2             # 2976 steps -> 744 tiles
+    assert lidar_pyramid.select_level(15, '2010-01-01', '2020-01-01', 1000) == lidar_pyramid.PYRAMID_LEVELS - 1
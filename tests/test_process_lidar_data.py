@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import climatology
+import lidar_processor
+import process_lidar_data
+
+LAPSE = 1.  # K/km
+WAVE  = 2.  # K, vertical wavelength 5 km, period 4 h (both below the cutoffs)
+
+
+def lapse_rate_wave(time_h, alt_km):
+    return 260. - LAPSE * alt_km + WAVE * np.sin(2 * np.pi * (alt_km / 5 - time_h / 4))
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice") # bins without data below 10 km
+def test_epot_profile_constant_lapse_rate(lidar_config, write_lidar_obs, pbar):
+    obs = write_lidar_obs('20180616-2203', lapse_rate_wave, n_time=96) # 24 h
+    ds_night = process_lidar_data.epot_profile(lidar_config, obs, pbar)
+
+    alt = ds_night['alt'].values
+    tbg = 260. - LAPSE * alt
+    g, cp = lidar_processor.g, lidar_processor.cp
+    n2   = g / tbg * (-LAPSE / 1000 + g / cp)
+    epot = 0.25 * g**2 / n2 * (WAVE / tbg)**2 # nightly mean of 1/2 (g/N)^2 (T'/T_bg)^2 over full wave periods
+    inner = (alt > 25) & (alt < 70) # away from filter edges
+    # - temporal filter: edge effects at the start and end of the night remain in the nightly mean - #
+    for filt, rtol_n2, rtol_epot in [('vbwf', 0.01, 0.05), ('tbwf', 0.02, 0.15)]:
+        np.testing.assert_allclose(ds_night['N2_' + filt].values[0, inner], n2[inner], rtol=rtol_n2)
+        np.testing.assert_allclose(ds_night['epot_' + filt].values[0, inner], epot[inner], rtol=rtol_epot)
+    assert list(ds_night['night'].values) == ['20180616-2203']
+
+
+def smooth_field(time_h, alt_km):
+    return 250. - 0.5 * alt_km + 3 * np.sin(2 * np.pi * alt_km / 20) * np.cos(2 * np.pi * time_h / 30)
+
+
+def test_background_pair_matches_single_files(lidar_config, write_lidar_obs):
+    obs    = write_lidar_obs('20180616-2203', smooth_field)
+    obs_bg = write_lidar_obs('20180616-2203', smooth_field, n_time=6, tres=120, suffix='T120Z900')
+    ds = process_lidar_data.load_measurement(lidar_config, obs, background=True)
+
+    # - Single files: processed on their own, background interpolated in time on the overlap - #
+    ds_fine = lidar_processor.process_lidar_measurement(lidar_config, lidar_processor.open_and_decode_lidar_measurement(obs))
+    ds_bg   = lidar_processor.process_lidar_measurement(lidar_config, lidar_processor.open_and_decode_lidar_measurement(obs_bg))
+    overlap = (ds_fine.time.values >= ds_bg.time.values[0]) & (ds_fine.time.values <= ds_bg.time.values[-1])
+    tbg = ds_bg['temperature'].interp(time=ds_fine.time.values[overlap]).values
+    tprime = ds_fine['temperature'].values[overlap] - tbg
+
+    assert overlap.sum() == 41 # 10 h of the 12 h night
+    np.testing.assert_allclose(ds['tprime_bg'].values[overlap], tprime, rtol=0, atol=1e-9, equal_nan=True)
+    assert np.nanmax(np.abs(ds['tprime_bg'].values[overlap])) < 0.1 # background of the same smooth field
+    assert np.isfinite(ds['tprime_bg'].values[overlap][:, ds.alt_plot.values > 15]).all()
+
+
+def wave_packet(time_h, alt_km):
+    """Wave (lambda_z 10 km) of 8 K at 20 km and 6 h after start, 0.5 K elsewhere"""
+    envelope = 0.5 + 7.5 * np.exp(-((alt_km - 20) / 5)**2 - ((time_h - 6) / 2)**2)
+    return 240. - 0.5 * alt_km + envelope * np.sin(2 * np.pi * alt_km / 10)
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_detect_events_and_index(lidar_config, write_lidar_obs, pbar):
+    ds_event = process_lidar_data.detect_events(lidar_config, write_lidar_obs('20180616-2203', wave_packet), pbar)
+    ds_quiet = process_lidar_data.detect_events(lidar_config, write_lidar_obs('20180615-2203', lambda t, z: 240. - 0.5 * z), pbar)
+    assert ds_quiet['n_events'].item() == 0 and 'event' not in ds_quiet.dims
+
+    vbwf = ds_event['filter'].values == 'vbwf'
+    assert vbwf.any() and ds_event['n_events'].item() == len(ds_event['event_night'])
+    # - events of the packet: above the threshold (2 K below 30 km), persistent and deep enough, around its centre - #
+    assert (ds_event['tprime_max'].values > 2).all()
+    assert ((ds_event['alt_bottom'] >= 11) & (ds_event['alt_top'] <= 30)).all()
+    assert ((ds_event['alt_top'] - ds_event['alt_bottom']).values + 0.1 >= process_lidar_data.EVENT_MIN_DEPTH).all()
+    centre = np.datetime64('2018-06-17T04:03')
+    assert ((ds_event['time_start'].values <= centre) & (ds_event['time_end'].values >= centre)).all()
+
+    ds_index = process_lidar_data.event_index([ds_event, ds_quiet])
+    assert list(ds_index['night'].values) == ['20180615-2203', '20180616-2203']
+    assert list(ds_index['n_events'].values) == [0, ds_event['n_events'].item()]
+    np.testing.assert_array_equal(ds_index['event'].values, np.arange(ds_event['n_events'].item()))
+    assert (ds_index['event_night'].values == '20180616-2203').all()
+
+
+def linear_field(time_h, alt_km):
+    return 250. - 0.5 * alt_km + 0.2 * time_h # exact under linear interpolation of ERA5
+
+
+def write_era5_station(lidar_config, night, offset):
+    """ERA5 station column (-ml-station) of a measurement: linear_field - offset"""
+    folder = os.path.join(lidar_config.get("OUTPUT","FOLDER"), 'era5-profiles')
+    os.makedirs(folder, exist_ok=True)
+    time  = pd.date_range(pd.Timestamp(night[0:11] + ':' + night[11:13]).floor('h'), periods=15, freq='h')
+    level = np.arange(0, 96000, 400.)
+    time_h = (time.values - np.datetime64(pd.Timestamp(night[0:11] + ':' + night[11:13]))) / np.timedelta64(1, 'h')
+    t = linear_field(time_h[:,np.newaxis], level[np.newaxis,:] / 1000) - offset
+    xr.Dataset({'t': (('time','level'), t)}, coords={'time': time, 'level': level}).to_netcdf(os.path.join(folder, night + '-ml-station.nc'))
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_era5_bias_rms(lidar_config, write_lidar_obs, pbar):
+    lidar_config["GENERAL"]["CONTENT"] = "era5bias"
+    nights, offsets = ['20180616-2203', '20180620-2203'], [2., -1.]
+    obs = [write_lidar_obs(night, linear_field) for night in nights]
+    for night, offset in zip(nights, offsets):
+        write_era5_station(lidar_config, night, offset)
+
+    acc, acc_nights = process_lidar_data.climatology_partial((lidar_config, obs, pbar))
+    ds_out = process_lidar_data.era5_bias_rms(climatology.finalize(acc))
+    assert acc_nights == nights
+
+    # - same number of valid bins per night: bias and RMS of the two constant offsets - #
+    ds_june = ds_out.sel(month=np.datetime64('2018-06', 'ns'))
+    valid = ds_june['tres_era5_count'].values > 0
+    assert valid.sum() > 700
+    np.testing.assert_allclose(ds_june['tres_era5_bias'].values[valid], np.mean(offsets), rtol=1e-6)
+    np.testing.assert_allclose(ds_june['tres_era5_rms'].values[valid], np.sqrt(np.mean(np.square(offsets))), rtol=1e-6)
+    for filt in ['tbwf', 'vbwf']: # constant offsets are removed by the filters (same sampling for lidar and ERA5)
+        assert np.nanmax(np.abs(ds_june['dtprime_' + filt + '_bias'].values)) < 1e-6
+        assert np.nanmax(ds_june['dtprime_' + filt + '_rms'].values) < 1e-6
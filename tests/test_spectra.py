@@ -0,0 +1,71 @@
+import numpy as np
+from scipy import signal
+
+import spectra
+
+
+def test_lomb_scargle_matches_periodogram_without_gaps():
+    rng  = np.random.default_rng(0)
+    res  = 0.1
+    data = rng.standard_normal((6, 128))
+    freqs = spectra.frequency_grid(data.shape[-1] * res, res)[:-1] # without Nyquist
+    psd  = spectra.lomb_scargle(data, np.arange(data.shape[-1]) * res, freqs)
+    f, periodogram = signal.periodogram(data, fs=1/res, detrend='constant', axis=-1)
+    np.testing.assert_allclose(f[1:-1], freqs)
+    np.testing.assert_allclose(psd, periodogram[:, 1:-1], rtol=1e-8)
+
+
+def test_lomb_scargle_normalization_and_peak_with_gaps():
+    res = 0.1
+    x   = np.arange(300) * res
+    rng = np.random.default_rng(1)
+    data = 2 * np.cos(2 * np.pi * x / 3.0) + 0.1 * rng.standard_normal(x.size)
+    data[40:70] = np.nan
+    data[rng.choice(x.size, 30, replace=False)] = np.nan
+
+    freqs = spectra.frequency_grid(x[-1] + res, res)[:-1]
+    psd   = spectra.lomb_scargle(data[np.newaxis], x, freqs)[0]
+    df    = freqs[1] - freqs[0]
+    assert abs(np.nansum(psd) * df / np.nanvar(data) - 1) < 0.1
+    assert np.isclose(freqs[np.nanargmax(psd)], 1 / 3.0)
+
+
+def test_lomb_scargle_too_few_samples():
+    data = np.full((1, 50), np.nan)
+    data[0, :spectra.min_samples - 1] = 1.
+    x    = np.arange(50.)
+    assert np.all(np.isnan(spectra.lomb_scargle(data, x, spectra.frequency_grid(50, 1)[:-1])))
+
+
+def test_welch_gap_rows_fall_back_to_lomb_scargle():
+    res  = 0.1
+    rng  = np.random.default_rng(2)
+    data = rng.standard_normal((4, 256))
+    data[1, 100:120] = np.nan
+    data[3, ::7] = np.nan
+    freqs, psd = spectra.welch(data, res, nperseg=64)
+    _, psd_full = signal.welch(data[[0, 2]], fs=1/res, nperseg=64, axis=-1)
+    np.testing.assert_allclose(psd[[0, 2]], psd_full[:, 1:])
+    np.testing.assert_allclose(psd[[1, 3]], spectra.lomb_scargle(data[[1, 3]], np.arange(256) * res, freqs))
+    assert np.all(np.isfinite(psd[[1, 3], :-1]))
+    df = freqs[1] - freqs[0]
+    assert np.all(np.abs(np.nansum(psd[[1, 3]], axis=-1) * df / np.nanvar(data[[1, 3]], axis=-1) - 1) < 0.2)
+
+
+def test_welch_on_common_grid():
+    res   = 0.25
+    freqs = spectra.frequency_grid(20, res) # grid of a 20 h night
+    psd_nights = []
+    for n, seed in [(80, 3), (52, 4)]: # full and shorter night
+        x    = np.arange(n) * res
+        data = 2 * np.cos(2 * np.pi * x / 2.5)[np.newaxis] + 0.1 * np.random.default_rng(seed).standard_normal((3, n))
+        f, psd = spectra.welch(data, res, freqs=freqs)
+        f_welch, psd_welch = spectra.welch(data, res)
+        np.testing.assert_array_equal(f, freqs)
+        inside = (freqs >= f_welch[0]) & (freqs <= f_welch[-1])
+        for row in range(len(data)):
+            np.testing.assert_allclose(psd[row, inside], np.interp(freqs[inside], f_welch, psd_welch[row]), rtol=1e-12)
+        assert np.isnan(psd[:, ~inside]).all()
+        psd_nights.append(psd)
+    assert psd_nights[0].shape == psd_nights[1].shape
+    assert np.isclose(freqs[np.nanargmax(np.nanmean(psd_nights, axis=(0, 1)))], 1 / 2.5)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+import storage
+
+
+def synthetic_ml_int(seed=0, start='2018-06-16T18'):
+    rng  = np.random.default_rng(seed)
+    dims = ['time','level','latitude','longitude']
+    shape = (4, 6, 3, 5)
+    ds = xr.Dataset({'t'     : (dims, rng.uniform(180, 300, shape)),
+                     'u'     : (dims, rng.uniform(-100, 100, shape)),
+                     'v'     : (dims, rng.uniform(-100, 100, shape)),
+                     'tprime': (dims, rng.uniform(-20, 20, shape)),
+                     'p'     : (dims, rng.uniform(1, 100000, shape))},
+                    coords={'time': pd.date_range(start, periods=shape[0], freq='h'), 'level': np.arange(shape[1]) * 400.,
+                            'latitude': [-50.25, -50.5, -50.75], 'longitude': np.arange(290, 291.25, 0.25)})
+    ds['t'][0,0,0,0]      = np.nan
+    ds['tprime'][1,2,1,1] = 75. # outside of the packing range
+    return ds
+
+
+def test_packing_precision():
+    for var in ['t', 'u', 'v', 'tprime']:
+        assert storage.packing(var)['scale_factor'] / 2 < storage.PACKING[var]['precision']
+    assert storage.packing('p') is None
+
+
+def test_packed_round_trip(tmp_path):
+    ds   = synthetic_ml_int()
+    path = str(tmp_path / 'ml-int.nc')
+    storage.write_dataset(ds, path, 'cross-section', packed=True)
+    with storage.open_dataset(path) as ds_file:
+        ds_read = ds_file.load()
+        dtypes  = {var: ds_file[var].encoding['dtype'] for var in ds.data_vars}
+
+    assert all(dtypes[var] == np.int16 for var in ['t', 'u', 'v', 'tprime'])
+    assert dtypes['p'] != np.int16
+    expected = storage.clip_packed(ds.copy())
+    for var in ['t', 'u', 'v', 'tprime']:
+        err = np.nanmax(np.abs(ds_read[var].values - expected[var].values))
+        assert err <= float(storage.packing(var)['scale_factor']) / 2 * 1.01
+        np.testing.assert_array_equal(np.isnan(ds_read[var].values), np.isnan(ds[var].values))
+    assert abs(float(storage.packing('t')['scale_factor']) / 2 - 0.0023) < 1e-4 # ~0.002 K for temperature
+    assert float(ds_read['tprime'][1,2,1,1]) == storage.PACKING['tprime']['range'][1]
+    np.testing.assert_array_equal(ds_read['p'].values, ds['p'].values)
+
+
+@pytest.mark.filterwarnings("error::RuntimeWarning") # no NaN cast while packing appended data
+def test_packed_append(tmp_path):
+    ds_a = synthetic_ml_int(seed=1)
+    ds_b = synthetic_ml_int(seed=2, start='2018-06-16T22')
+    path = str(tmp_path / 'ml-int.nc')
+    storage.write_dataset(ds_a, path, 'cross-section', packed=True)
+    storage.write_dataset(ds_b, path, 'cross-section', append=True, packed=True)
+    with storage.open_dataset(path) as ds_file:
+        ds_read = ds_file.load()
+    assert ds_read.sizes['time'] == 8
+    expected = storage.clip_packed(xr.concat([ds_a, ds_b], dim='time'))
+    np.testing.assert_array_equal(ds_read['time'].values, expected['time'].values)
+    assert np.nanmax(np.abs(ds_read['t'].values - expected['t'].values)) <= float(storage.packing('t')['scale_factor']) / 2 * 1.01
+    np.testing.assert_array_equal(np.isnan(ds_read['t'].values), np.isnan(expected['t'].values))